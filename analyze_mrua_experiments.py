@@ -9,9 +9,26 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple
 import warnings
 import os
+import argparse
+import heapq
+import itertools
+import queue
+import threading
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from archive_history import fecha_range_filter, iter_partitions, read_partitions, to_timestamp
+from mongo_indexes import ensure_indexes
+from parallel_extract import PARTITIONS_PER_WORKER, iter_ranges, parallel_documents
+from mrua_aggregates import ACTIVE_FILTER
+from mrua_kinematics import RunningStats, documents_to_arrays
+from mrua_manifest import write_manifest
+from mrua_mirror import MIRROR_PATH, iter_mirror_experiments, load_mirror_experiments
+from mrua_plot_templates import TIERS, render_experiment
+from mrua_summary_figures import SummaryAccumulator, render_summary
+from mrua_validation import DUPLICATE_ID, REASON_NAMES, quarantine_candidates, reason_counts, validate_arrays
 warnings.filterwarnings('ignore')
 
 
@@ -27,6 +44,30 @@ DISTANCE_BETWEEN_SENSORS = 0.50  # 50 cm entre cada sensor
 import os
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "analysis_output")  # Carpeta en raíz del proyecto
 
+# ============ CONFIGURACIÓN DEL PIPELINE ============
+PIPELINE_BATCH_SIZE = 200   # Experimentos por lote de extracción
+PIPELINE_QUEUE_SIZE = 4     # Lotes en cola entre extracción y cálculo
+RENDER_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Procesos de gráficas
+IO_WORKERS = 4              # Hilos de escritura de CSV / MongoDB
+GRAPH_TIER = 'none'         # Gráficas por carpeta: 'none', 'draft' o 'full' (bajo demanda con mrua_render.py)
+GRAPH_TIERS = ['none'] + list(TIERS)
+SUMMARY_GRAPHS_DIR = "summary_graphs"  # Figuras resumen por modalidad (mrua_summary_figures.py)
+GLOBAL_STATS_DIR = "global_statistics"  # Estadísticas de todos los experimentos (fusionadas lote a lote)
+
+# ============ CONFIGURACIÓN DEL MODO POR LOTES (--chunked) ============
+MEMORY_BUDGET_MB = 512      # Memoria objetivo del proceso; elige el tamaño de lote
+CHUNK_BUDGET_FRACTION = 0.5 # Parte del presupuesto para los lotes en vuelo (resto: intérprete, figuras, acumuladores)
+CHUNK_SAMPLE_SIZE = 200     # Experimentos medidos para estimar la memoria por experimento
+MIN_CHUNK_SIZE = 50
+MAX_CHUNK_SIZE = 20000
+STREAM_RANGE_SIZE = 5000    # Documentos por rango en la lectura paralela por lotes
+
+# Copy-on-write: los subconjuntos por modalidad/experimento y las columnas derivadas
+# comparten memoria con el DataFrame original hasta que se modifican (siempre activo
+# desde pandas 3.0; en pandas 2.x hay que activarlo)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 
 # ============ CONEXIÓN A MONGODB ============
 def connect_to_mongodb(uri: str, database: str) -> pymongo.database.Database:
@@ -53,7 +94,74 @@ def connect_to_mongodb(uri: str, database: str) -> pymongo.database.Database:
 
 
 # ============ EXTRACCIÓN DE DATOS ============
-def extract_experiments(db: pymongo.database.Database, collection: str) -> pd.DataFrame:
+def fetch_experiments(db: pymongo.database.Database, collection: str, validate: bool = False,
+                      mirror: str = None, date_from=None, date_to=None, workers: int = 1) -> List[dict]:
+    """
+    Lee los documentos de los experimentos (más recientes primero) desde MongoDB,
+    el espejo local o el archivo mensual.
+    
+    Args:
+        db: Objeto Database de MongoDB
+        collection: Nombre de la colección
+        validate: Si es True, descarta los experimentos que la validación enviaría a cuarentena
+        mirror: Ruta del espejo SQLite (mrua_mirror.py); si se indica, se lee de él en lugar de MongoDB
+        date_from: Fecha inicial incluida (texto ISO o datetime); None = sin límite
+        date_to: Fecha final excluida; si se indica alguna de las dos, también se leen
+            las particiones mensuales de archive_history.py que se solapan con el rango
+        workers: Hilos de lectura; con más de 1 se lee por rangos de fecha en paralelo (parallel_extract.py)
+        
+    Returns:
+        Lista de documentos de 'history'
+    """
+    ranged = date_from is not None or date_to is not None
+    if mirror:
+        experiments = load_mirror_experiments(mirror)
+        if ranged:
+            start, end = to_timestamp(date_from), to_timestamp(date_to)
+            fechas = pd.to_datetime(pd.Series([exp.get('fecha') for exp in experiments], dtype=object),
+                                    errors='coerce', utc=True, format='mixed')
+            keep = fechas.notna()
+            if not pd.isna(start):
+                keep &= fechas >= start
+            if not pd.isna(end):
+                keep &= fechas < end
+            experiments = [exp for exp, ok in zip(experiments, keep) if ok]
+        print(f"[OK] Leidos {len(experiments)} experimentos del espejo local: {mirror}")
+    elif workers > 1:
+        experiments = parallel_documents(db, collection, workers, query=fecha_range_filter(date_from, date_to))
+    else:
+        collection_obj = db[collection]
+        # Más recientes primero, sin los duplicados marcados por dedup_history.py
+        experiments = list(collection_obj.find({**ACTIVE_FILTER, **fecha_range_filter(date_from, date_to)}).sort('fecha', -1))
+    
+    if ranged:
+        # Experimentos antiguos: solo se abren las particiones de los meses del rango
+        archived = read_partitions(date_from, date_to)
+        if archived:
+            print(f"[OK] Leidos {len(archived)} experimentos archivados")
+            experiments = sorted(experiments + archived,
+                                 key=lambda exp: to_timestamp(exp.get('fecha')).value if exp.get('fecha') else 0,
+                                 reverse=True)
+    
+    if validate and experiments:
+        experiments = filter_valid_experiments(experiments)
+    return experiments
+
+
+def iter_experiments(db: pymongo.database.Database, collection: str, validate: bool = False,
+                     mirror: str = None, date_from=None, date_to=None, workers: int = 1,
+                     batch_size: int = 1000):
+    """
+    Igual que fetch_experiments, pero en el caso simple (una sola consulta a MongoDB sin
+    validación, espejo ni rango) recorre el cursor sin cargar toda la colección en memoria.
+    """
+    if validate or mirror or workers > 1 or date_from is not None or date_to is not None:
+        return iter(fetch_experiments(db, collection, validate, mirror, date_from, date_to, workers))
+    return db[collection].find(ACTIVE_FILTER, batch_size=batch_size).sort('fecha', -1)
+
+
+def extract_experiments(db: pymongo.database.Database, collection: str, validate: bool = False,
+                        mirror: str = None, date_from=None, date_to=None, workers: int = 1) -> pd.DataFrame:
     """
     Extrae todos los experimentos de la colección y los convierte a DataFrame.
     Adaptado para el formato real: {tiempo, distancia, velocidad, aceleracion, v12, v23, v34, t12, t23, t34}
@@ -61,17 +169,36 @@ def extract_experiments(db: pymongo.database.Database, collection: str) -> pd.Da
     Args:
         db: Objeto Database de MongoDB
         collection: Nombre de la colección
+        validate, mirror, date_from, date_to, workers: Ver fetch_experiments
         
     Returns:
         DataFrame con los experimentos expandidos en formato de sensores
     """
-    collection_obj = db[collection]
-    experiments = list(collection_obj.find().sort('fecha', -1))  # Más recientes primero
+    experiments = fetch_experiments(db, collection, validate, mirror, date_from, date_to, workers)
     
     if len(experiments) == 0:
         print("[WARNING] No se encontraron experimentos en la coleccion")
         return pd.DataFrame(), []
     
+    df = experiments_to_dataframe(experiments)
+
+    print(f"[OK] Extraidos {len(experiments)} experimentos ({len(df)} registros de sensores)")
+    if len(df) > 0:
+        print(f"   Rango de fechas: {df['timestamp'].min()} a {df['timestamp'].max()}")
+    
+    return df, experiments
+
+
+def experiments_to_dataframe(experiments: List[dict]) -> pd.DataFrame:
+    """
+    Convierte documentos de 'history' al formato de sensores (una fila por sensor con registro).
+    
+    Args:
+        experiments: Documentos de 'history'
+        
+    Returns:
+        DataFrame con columnas experiment_id, mode, failed, timestamp, sensor_id, distance_cm y time_s
+    """
     # Convertir formato real a formato de sensores
     rows = []
     for i, exp in enumerate(experiments):
@@ -153,15 +280,39 @@ def extract_experiments(db: pymongo.database.Database, collection: str) -> pd.Da
     # Normalizar timestamps para evitar error de comparación (tz-naive vs tz-aware)
     if not df.empty and 'timestamp' in df.columns:
         df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True).dt.tz_localize(None)
+    
+    return df
 
-    print(f"[OK] Extraidos {len(experiments)} experimentos ({len(df)} registros de sensores)")
-    if len(df) > 0:
-        print(f"   Rango de fechas: {df['timestamp'].min()} a {df['timestamp'].max()}")
+
+def filter_valid_experiments(experiments: List[dict]) -> List[dict]:
+    """
+    Aplica la validación vectorizada (mrua_validation) y descarta los experimentos inválidos.
     
-    return df, experiments
+    Args:
+        experiments: Documentos de 'history'
+        
+    Returns:
+        Documentos que superan la validación
+    """
+    arrays = documents_to_arrays(experiments)
+    reasons = validate_arrays(arrays)
+    keep = ~quarantine_candidates(arrays, reasons)
+    if not keep.all():
+        counts = ', '.join(f"{name}={count}" for name, count in reason_counts(reasons[~keep]).items() if count)
+        print(f"[WARNING] Descartados {int((~keep).sum())} experimentos invalidos ({counts})")
+    return [exp for exp, ok in zip(experiments, keep) if ok]
 
 
 # ============ CÁLCULOS ESTADÍSTICOS ============
+def split_by_mode(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Separa un DataFrame en remoto y presencial con un solo groupby (sin máscaras por
+    modalidad). Si falta una modalidad se devuelve un DataFrame vacío con las mismas columnas.
+    """
+    frames = dict(tuple(df.groupby('mode', sort=False)))
+    return {mode: frames.get(mode, df.iloc[:0]) for mode in ('remote', 'presential')}
+
+
 def calculate_statistics(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     """
     Calcula estadísticas por sensor y modalidad.
@@ -177,10 +328,23 @@ def calculate_statistics(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
         'mean', 'std', 'count'
     ]).reset_index()
     grouped.columns = ['sensor_id', 'mode', 'time_mean', 'time_std', 'count']
+    return statistics_from_grouped(grouped)
+
+
+def statistics_from_grouped(grouped: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Separa las estadísticas por sensor y modalidad y calcula el error relativo.
+    Se comparte entre calculate_statistics y las estadísticas globales por lotes.
     
+    Args:
+        grouped: DataFrame con sensor_id, mode, time_mean, time_std y count
+        
+    Returns:
+        Diccionario con DataFrames de estadísticas
+    """
     # Separar remoto y presencial
-    remote = grouped[grouped['mode'] == 'remote'].copy()
-    presential = grouped[grouped['mode'] == 'presential'].copy()
+    by_mode = split_by_mode(grouped)
+    remote, presential = by_mode['remote'], by_mode['presential']
     
     # Merge para calcular error relativo
     merged = pd.merge(
@@ -226,10 +390,23 @@ def calculate_failure_statistics(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     
     # Contar fallos por modalidad
     failure_counts = experiments.groupby(['mode', 'failed']).size().reset_index(name='count')
+    return failure_statistics_from_counts(failure_counts)
+
+
+def failure_statistics_from_counts(failure_counts: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Porcentajes y resumen de fallos a partir del número de experimentos por modalidad
+    y estado. Se comparte entre calculate_failure_statistics y las estadísticas globales.
     
-    # Separar por modalidad
-    remote_failures = failure_counts[failure_counts['mode'] == 'remote'].copy()
-    presential_failures = failure_counts[failure_counts['mode'] == 'presential'].copy()
+    Args:
+        failure_counts: DataFrame con mode, failed y count
+        
+    Returns:
+        Diccionario con DataFrames de estadísticas de fallos
+    """
+    # Separar por modalidad (con copy-on-write, añadir 'percentage' no modifica failure_counts)
+    by_mode = split_by_mode(failure_counts)
+    remote_failures, presential_failures = by_mode['remote'], by_mode['presential']
     
     # Calcular porcentajes
     remote_total = remote_failures['count'].sum() if not remote_failures.empty else 0
@@ -273,6 +450,19 @@ def calculate_failure_statistics(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
 
 
 # ============ CÁLCULO DE VELOCIDAD Y ACELERACIÓN ============
+def experiment_positions(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Posiciones de las filas de cada experimento ordenadas por sensor, en orden de aparición.
+    Se calculan con un solo ordenamiento; los experimentos se recorren indexando las columnas
+    en NumPy en lugar de construir un sub-DataFrame con una máscara por experimento.
+    """
+    codes, experiment_ids = pd.factorize(df['experiment_id'])
+    # Un solo ordenamiento estable por (experimento, sensor) y un corte por experimento
+    order = np.lexsort((df['sensor_id'].to_numpy(), codes))
+    splits = np.split(order, np.cumsum(np.bincount(codes, minlength=len(experiment_ids)))[:-1])
+    return dict(zip(experiment_ids, splits))
+
+
 def calculate_velocity_and_acceleration(df: pd.DataFrame) -> pd.DataFrame:
     """
     Calcula velocidad promedio entre sensores y aceleración promedio.
@@ -284,35 +474,36 @@ def calculate_velocity_and_acceleration(df: pd.DataFrame) -> pd.DataFrame:
         DataFrame con velocidades y aceleraciones calculadas
     """
     results = []
+    columns = {name: df[name].to_numpy() for name in ('mode', 'sensor_id', 'distance_cm', 'time_s')}
     
-    # Agrupar por experimento
-    for exp_id in df['experiment_id'].unique():
-        exp_data = df[df['experiment_id'] == exp_id].sort_values('sensor_id')
-        mode = exp_data['mode'].iloc[0]
+    # Recorrer cada experimento por sus posiciones (ordenadas por sensor)
+    for exp_id, rows in experiment_positions(df).items():
+        mode = columns['mode'][rows[0]]
         
-        if len(exp_data) < 2:
+        if len(rows) < 2:
             continue
         
+        sensor_ids = columns['sensor_id'][rows]
+        distances = columns['distance_cm'][rows]
+        times = columns['time_s'][rows]
+        
         # Calcular velocidades entre sensores consecutivos
         velocities = []
         accelerations = []
         
-        for i in range(len(exp_data) - 1):
-            sensor_curr = exp_data.iloc[i]
-            sensor_next = exp_data.iloc[i + 1]
-            
+        for i in range(len(rows) - 1):
             # Distancia en metros
-            distance_m = (sensor_next['distance_cm'] - sensor_curr['distance_cm']) / 100.0
-            time_interval = sensor_next['time_s'] - sensor_curr['time_s']
+            distance_m = (distances[i + 1] - distances[i]) / 100.0
+            time_interval = times[i + 1] - times[i]
             
             if time_interval > 0:
                 velocity = distance_m / time_interval
                 velocities.append({
                     'experiment_id': exp_id,
                     'mode': mode,
-                    'sensor_from': sensor_curr['sensor_id'],
-                    'sensor_to': sensor_next['sensor_id'],
-                    'position_cm': sensor_next['distance_cm'],
+                    'sensor_from': sensor_ids[i],
+                    'sensor_to': sensor_ids[i + 1],
+                    'position_cm': distances[i + 1],
                     'velocity_ms': velocity,
                     'time_interval_s': time_interval
                 })
@@ -369,26 +560,30 @@ def save_raw_data_to_mongodb(db: pymongo.database.Database, df: pd.DataFrame, or
     try:
         col_raw = db[RAW_DATA_COLLECTION]
         
-        # Convertir DataFrame a documentos
+        # Experimentos originales indexados por id (una pasada en lugar de una búsqueda por experimento)
+        originals = {}
+        for e in original_experiments:
+            originals.setdefault(str(e.get('id', e.get('_id'))), e)
+        
+        # Convertir DataFrame a documentos: una posición por fila, sin sub-DataFrames por experimento
+        sensor_ids = df['sensor_id'].to_numpy()
+        distances = df['distance_cm'].to_numpy()
+        times = df['time_s'].to_numpy()
         raw_docs = []
-        for exp_id in df['experiment_id'].unique():
-            exp_data = df[df['experiment_id'] == exp_id]
-            sensors_data = []
-            
-            for _, row in exp_data.iterrows():
-                sensors_data.append({
-                    'sensor_id': int(row['sensor_id']),
-                    'distance_cm': float(row['distance_cm']),
-                    'time_s': float(row['time_s'])
-                })
+        for exp_id, rows in df.groupby('experiment_id', sort=False).indices.items():
+            sensors_data = [{
+                'sensor_id': int(sensor_ids[i]),
+                'distance_cm': float(distances[i]),
+                'time_s': float(times[i])
+            } for i in rows]
             
             # Buscar experimento original para datos adicionales
-            original_exp = next((e for e in original_experiments if str(e.get('id', e.get('_id'))) == exp_id), None)
+            original_exp = originals.get(exp_id)
             
             raw_doc = {
                 'experiment_id': exp_id,
-                'mode': exp_data['mode'].iloc[0] if len(exp_data) > 0 else 'remote',
-                'timestamp': exp_data['timestamp'].iloc[0] if len(exp_data) > 0 else datetime.now(),
+                'mode': df['mode'].iat[rows[0]],
+                'timestamp': df['timestamp'].iat[rows[0]],
                 'sensors': sensors_data,
                 'processed_at': datetime.now(),
                 # Datos originales adicionales
@@ -432,57 +627,70 @@ def export_to_csv(df: pd.DataFrame, stats: Dict[str, pd.DataFrame], output_dir:
         velocities_df: DataFrame con velocidades
         accelerations_df: DataFrame con aceleraciones
         failure_stats: Diccionario con estadísticas de fallos
+        
+    Junto a los CSV se escribe manifest.json (mrua_manifest.py) con la suma de
+    control y las filas de cada fichero, que usa check_data_integrity.py.
     """
     try:
         # Crear directorio si no existe
         os.makedirs(output_dir, exist_ok=True)
+        written = {}  # Fichero -> filas, para el manifiesto
         
         # 1. Datos crudos de sensores
         csv_path = os.path.join(output_dir, "raw_sensors_data.csv")
         df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+        written[os.path.basename(csv_path)] = len(df)
         print(f"[OK] Datos crudos exportados: {csv_path}")
         
         # 2. Estadísticas por sensor
         if 'grouped' in stats:
             csv_path = os.path.join(output_dir, "statistics_by_sensor.csv")
             stats['grouped'].to_csv(csv_path, index=False, encoding='utf-8-sig')
+            written[os.path.basename(csv_path)] = len(stats['grouped'])
             print(f"[OK] Estadisticas exportadas: {csv_path}")
         
         # 3. Comparación remoto vs presencial
         if 'comparison' in stats:
             csv_path = os.path.join(output_dir, "comparison_remote_vs_presential.csv")
             stats['comparison'].to_csv(csv_path, index=False, encoding='utf-8-sig')
+            written[os.path.basename(csv_path)] = len(stats['comparison'])
             print(f"[OK] Comparacion exportada: {csv_path}")
         
         # 4. Velocidades
         if velocities_df is not None and not velocities_df.empty:
             csv_path = os.path.join(output_dir, "velocities.csv")
             velocities_df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            written[os.path.basename(csv_path)] = len(velocities_df)
             print(f"[OK] Velocidades exportadas: {csv_path}")
         
         # 5. Aceleraciones
         if accelerations_df is not None and not accelerations_df.empty:
             csv_path = os.path.join(output_dir, "accelerations.csv")
             accelerations_df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            written[os.path.basename(csv_path)] = len(accelerations_df)
             print(f"[OK] Aceleraciones exportadas: {csv_path}")
         
         # 6. Estadísticas de fallos
         if failure_stats and not failure_stats.get('summary', pd.DataFrame()).empty:
             csv_path = os.path.join(output_dir, "failure_statistics.csv")
             failure_stats['summary'].to_csv(csv_path, index=False, encoding='utf-8-sig')
+            written[os.path.basename(csv_path)] = len(failure_stats['summary'])
             print(f"[OK] Estadisticas de fallos exportadas: {csv_path}")
             
             # Exportar detalles por modalidad
             if not failure_stats.get('remote', pd.DataFrame()).empty:
                 csv_path = os.path.join(output_dir, "failure_statistics_remote.csv")
                 failure_stats['remote'].to_csv(csv_path, index=False, encoding='utf-8-sig')
+                written[os.path.basename(csv_path)] = len(failure_stats['remote'])
                 print(f"[OK] Fallos remotos exportados: {csv_path}")
             
             if not failure_stats.get('presential', pd.DataFrame()).empty:
                 csv_path = os.path.join(output_dir, "failure_statistics_presential.csv")
                 failure_stats['presential'].to_csv(csv_path, index=False, encoding='utf-8-sig')
+                written[os.path.basename(csv_path)] = len(failure_stats['presential'])
                 print(f"[OK] Fallos presenciales exportados: {csv_path}")
         
+        write_manifest(output_dir, written, df)
         print(f"[OK] Todos los CSV guardados en: {output_dir}")
     except Exception as e:
         print(f"[ERROR] Error exportando a CSV: {e}")
@@ -645,7 +853,8 @@ def plot_acceleration_comparison(accelerations_df: pd.DataFrame, output_path: st
     data_to_plot = [remote_acc, presential_acc]
     labels = ['Remoto', 'Presencial']
     
-    bp = ax.boxplot(data_to_plot, labels=labels, patch_artist=True, widths=0.6)
+    bp = ax.boxplot(data_to_plot, patch_artist=True, widths=0.6)
+    ax.set_xticks([1, 2], labels)  # 'labels=' de boxplot ya no existe en matplotlib >= 3.11
     
     # Colorear boxes
     colors = ['lightblue', 'lightgreen']
@@ -680,18 +889,22 @@ def plot_experimental_vs_theoretical(df: pd.DataFrame, output_path: str = None):
     """
     fig, ax = plt.subplots(figsize=(10, 6))
     
-    # Agrupar por modalidad
+    times_all = df['time_s'].to_numpy()
+    distances_all = df['distance_cm'].to_numpy()
+    modes_all = df['mode'].to_numpy()
+    positions = experiment_positions(df)
+    
+    # Agrupar por modalidad (posiciones de cada experimento, sin sub-DataFrames)
     for mode in df['mode'].unique():
-        mode_data = df[df['mode'] == mode].copy()
+        mode_experiments = [rows for rows in positions.values() if modes_all[rows[0]] == mode]
         
         # Calcular aceleración promedio para el ajuste
         accelerations = []
-        for exp_id in mode_data['experiment_id'].unique():
-            exp_data = mode_data[mode_data['experiment_id'] == exp_id].sort_values('sensor_id')
-            if len(exp_data) >= 2:
+        for rows in mode_experiments:
+            if len(rows) >= 2:
                 # Ajuste lineal simple: v = at (asumiendo v₀=0)
-                times = exp_data['time_s'].values
-                distances = exp_data['distance_cm'].values / 100.0  # a metros
+                times = times_all[rows]
+                distances = distances_all[rows] / 100.0  # a metros
                 
                 if len(times) > 1:
                     # Ajuste polinomial de segundo grado: x = 0.5*a*t²
@@ -703,13 +916,14 @@ def plot_experimental_vs_theoretical(df: pd.DataFrame, output_path: str = None):
             continue
         
         a_mean = np.mean(accelerations)
+        mode_rows = np.concatenate(mode_experiments)
         
         # Generar curva teórica
-        t_theoretical = np.linspace(0, mode_data['time_s'].max(), 100)
+        t_theoretical = np.linspace(0, times_all[mode_rows].max(), 100)
         x_theoretical = 0.5 * a_mean * t_theoretical ** 2  # x = ½at² (v₀=0, x₀=0)
         
         # Datos experimentales promedio por tiempo
-        exp_grouped = mode_data.groupby('time_s')['distance_cm'].mean() / 100.0
+        exp_grouped = pd.Series(distances_all[mode_rows]).groupby(times_all[mode_rows]).mean() / 100.0
         
         ax.plot(
             t_theoretical,
@@ -747,140 +961,554 @@ def plot_experimental_vs_theoretical(df: pd.DataFrame, output_path: str = None):
     plt.close()  # Cerrar figura para liberar memoria
 
 
-# ============ FUNCIÓN PRINCIPAL ============
-def main():
+# ============ ESTADÍSTICAS GLOBALES POR LOTES ============
+class GlobalStatistics:
     """
-    Función principal que ejecuta todo el pipeline de análisis.
-    Organiza los resultados en carpetas por experimento (prueba_1_remoto, prueba_2_remoto, etc.)
+    Estadísticas de todos los experimentos acumuladas lote a lote: media y desviación
+    con RunningStats (fusión exacta) y conteos de fallos por modalidad. El resultado
+    coincide con calculate_statistics / calculate_failure_statistics sobre el DataFrame
+    completo sin tenerlo nunca en memoria. También acumula la velocidad por tramo y la
+    aceleración promedio de cada experimento.
     """
-    print("=" * 60)
-    print("ANÁLISIS DE EXPERIMENTOS MRUA")
-    print("=" * 60)
     
-    # 1. Conectar a MongoDB
-    try:
-        db = connect_to_mongodb(MONGODB_URI, DATABASE_NAME)
-    except Exception as e:
-        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
-        return
+    def __init__(self):
+        self.times = {}          # (sensor_id, mode) -> RunningStats
+        self.failures = {}       # (mode, failed) -> experimentos
+        self.velocities = {}     # (mode, sensor_to) -> RunningStats
+        self.accelerations = {}  # mode -> RunningStats
     
-    # 2. Extraer datos
-    df, original_experiments = extract_experiments(db, COLLECTION_NAME)
-    if df.empty:
-        print("[ERROR] No hay datos para analizar")
-        return
+    @staticmethod
+    def _merge_groups(target: Dict, values: pd.Series, keys):
+        moments = values.groupby(keys).agg(['count', 'mean', 'var'])
+        for key, count, mean, var in zip(moments.index, moments['count'], moments['mean'], moments['var']):
+            if count:
+                m2 = float(var) * (count - 1) if count > 1 else 0.0
+                target.setdefault(key, RunningStats()).merge(RunningStats(int(count), float(mean), m2))
     
-    # 2.1. Guardar datos crudos en MongoDB
-    if len(df) > 0:
-        save_raw_data_to_mongodb(db, df, original_experiments)
+    def add_rows(self, df: pd.DataFrame):
+        """Agrega las filas de sensores de un lote (formato de experiments_to_dataframe)."""
+        if df.empty:
+            return
+        self._merge_groups(self.times, df['time_s'], [df['sensor_id'], df['mode']])
+        experiments = df.drop_duplicates('experiment_id')
+        for (mode, failed), count in experiments.groupby(['mode', 'failed']).size().items():
+            self.failures[(mode, failed)] = self.failures.get((mode, failed), 0) + int(count)
     
-    # Agrupar experimentos por modo y procesar cada uno individualmente
-    print("\n[INFO] Organizando experimentos por modo...")
+    def add_results(self, velocities_df: pd.DataFrame, accelerations_df: pd.DataFrame):
+        """Agrega las velocidades y aceleraciones calculadas para los experimentos de un lote."""
+        if not velocities_df.empty:
+            self._merge_groups(self.velocities, velocities_df['velocity_ms'],
+                               [velocities_df['mode'], velocities_df['sensor_to']])
+        if not accelerations_df.empty:
+            # Solo la aceleración promedio de cada experimento (fila sin sensores)
+            averages = accelerations_df[accelerations_df['sensor_from'].isna()]
+            self._merge_groups(self.accelerations, averages['acceleration_ms2'], averages['mode'])
     
-    # Contadores para numerar experimentos por modo
-    remote_count = {}
-    presential_count = {}
+    def tables(self) -> Dict[str, object]:
+        """
+        Returns:
+            Diccionario con 'stats' y 'failure_stats' (mismo formato que calculate_statistics y
+            calculate_failure_statistics) y DataFrames 'velocities' y 'accelerations'
+        """
+        grouped = pd.DataFrame(
+            [(sensor_id, mode, st.mean, st.std, st.count) for (sensor_id, mode), st in sorted(self.times.items())],
+            columns=['sensor_id', 'mode', 'time_mean', 'time_std', 'count'])
+        failure_counts = pd.DataFrame(
+            [(mode, failed, count) for (mode, failed), count in sorted(self.failures.items())],
+            columns=['mode', 'failed', 'count'])
+        velocities = pd.DataFrame(
+            [(mode, sensor_to, st.count, st.mean, st.std) for (mode, sensor_to), st in sorted(self.velocities.items())],
+            columns=['mode', 'sensor_to', 'count', 'velocity_mean_ms', 'velocity_std_ms'])
+        accelerations = pd.DataFrame(
+            [(mode, st.count, st.mean, st.std) for mode, st in sorted(self.accelerations.items())],
+            columns=['mode', 'count', 'acceleration_mean_ms2', 'acceleration_std_ms2'])
+        return {
+            'stats': statistics_from_grouped(grouped),
+            'failure_stats': failure_statistics_from_counts(failure_counts),
+            'velocities': velocities,
+            'accelerations': accelerations,
+        }
+
+
+def export_global_statistics(global_stats: GlobalStatistics, output_dir: str) -> List[str]:
+    """
+    Exporta las estadísticas globales con los mismos nombres de CSV que cada carpeta
+    de experimento, más velocity_statistics.csv y acceleration_statistics.csv.
     
-    # Agrupar por experiment_id y modo
-    for exp_id in df['experiment_id'].unique():
-        exp_data = df[df['experiment_id'] == exp_id]
-        if exp_data.empty:
+    Returns:
+        Rutas de los CSV escritos
+    """
+    tables = global_stats.tables()
+    failure_stats = tables['failure_stats']
+    files = {
+        'statistics_by_sensor.csv': tables['stats']['grouped'],
+        'comparison_remote_vs_presential.csv': tables['stats']['comparison'],
+        'failure_statistics.csv': failure_stats['summary'],
+        'failure_statistics_remote.csv': failure_stats['remote'],
+        'failure_statistics_presential.csv': failure_stats['presential'],
+        'velocity_statistics.csv': tables['velocities'],
+        'acceleration_statistics.csv': tables['accelerations'],
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for name, table in files.items():
+        if table.empty:
             continue
-            
-        mode = exp_data['mode'].iloc[0]
-        
-        # Determinar número de experimento para este modo
-        if mode == 'remote':
-            if mode not in remote_count:
-                remote_count[mode] = 0
-            remote_count[mode] += 1
-            exp_num = remote_count[mode]
-            folder_name = f"prueba_{exp_num}_remoto"
-        else:  # presential
-            if mode not in presential_count:
-                presential_count[mode] = 0
-            presential_count[mode] += 1
-            exp_num = presential_count[mode]
-            folder_name = f"prueba_{exp_num}_presencial"
-        
-        # Crear carpeta para este experimento
-        exp_output_dir = os.path.join(OUTPUT_DIR, folder_name)
-        exp_csv_dir = os.path.join(exp_output_dir, "csv")
-        exp_graphs_dir = os.path.join(exp_output_dir, "graphs")
-        
-        os.makedirs(exp_csv_dir, exist_ok=True)
-        os.makedirs(exp_graphs_dir, exist_ok=True)
-        
-        print(f"\n{'='*60}")
-        print(f"Procesando: {folder_name} (ID: {exp_id})")
-        print(f"{'='*60}")
-        
-        # 3. Calcular estadísticas para este experimento
-        print("\n[INFO] Calculando estadisticas...")
-        stats = calculate_statistics(exp_data)
-        
-        # 3.1. Calcular estadísticas de fallos
-        failure_stats = calculate_failure_statistics(exp_data)
-        
-        # Mostrar resumen
-        print("\n--- Resumen de Tiempos por Sensor ---")
-        print(stats['grouped'].to_string(index=False))
-        
-        print("\n--- Comparación Remoto vs Presencial ---")
-        print(stats['comparison'].to_string(index=False))
-        
-        # Mostrar estadísticas de fallos
-        if failure_stats and not failure_stats.get('summary', pd.DataFrame()).empty:
-            print("\n--- Estadísticas de Fallos por Modalidad ---")
-            print(failure_stats['summary'].to_string(index=False))
-        
-        # 4. Calcular velocidades y aceleraciones
-        print("\n[INFO] Calculando velocidades y aceleraciones...")
-        vel_acc_df = calculate_velocity_and_acceleration(exp_data)
+        csv_path = os.path.join(output_dir, name)
+        table.to_csv(csv_path, index=False, encoding='utf-8-sig')
+        written.append(csv_path)
+    return written
+
+
+# ============ EJECUCIÓN POR LOTES (FUERA DE MEMORIA) ============
+def _fecha_key(exp: dict) -> int:
+    return to_timestamp(exp.get('fecha')).value if exp.get('fecha') else 0
+
+
+def _in_range(experiments: Iterable[dict], date_from=None, date_to=None) -> Iterator[dict]:
+    start, end = to_timestamp(date_from), to_timestamp(date_to)
+    for exp in experiments:
+        ts = to_timestamp(exp.get('fecha'))
+        if pd.isna(ts) or (not pd.isna(start) and ts < start) or (not pd.isna(end) and ts >= end):
+            continue
+        yield exp
+
+
+def _validated(experiments: Iterable[dict], batch_size: int = PIPELINE_BATCH_SIZE) -> Iterator[dict]:
+    """
+    Validación por lotes (mrua_validation). Los ids repetidos se detectan también entre
+    lotes: solo se conservan los ids ya vistos, no los documentos.
+    """
+    seen = set()
+    discarded = {name: 0 for name in REASON_NAMES.values()}
+    total = 0
+    experiments = iter(experiments)
+    while True:
+        batch = list(itertools.islice(experiments, batch_size))
+        if not batch:
+            break
+        arrays = documents_to_arrays(batch)
+        reasons = validate_arrays(arrays)
+        ids = arrays['id'].astype(str)
+        repeated = np.fromiter((exp_id in seen for exp_id in ids), dtype=bool, count=len(ids))
+        reasons |= np.where(repeated, DUPLICATE_ID, 0).astype(reasons.dtype)
+        seen.update(ids)
+        keep = ~quarantine_candidates(arrays, reasons)
+        if not keep.all():
+            total += int((~keep).sum())
+            for name, count in reason_counts(reasons[~keep]).items():
+                discarded[name] += count
+        yield from (exp for exp, ok in zip(batch, keep) if ok)
+    if total:
+        counts = ', '.join(f"{name}={count}" for name, count in discarded.items() if count)
+        print(f"[WARNING] Descartados {total} experimentos invalidos ({counts})")
+
+
+def stream_experiments(db: pymongo.database.Database, collection: str, validate: bool = False,
+                       mirror: str = None, date_from=None, date_to=None, workers: int = 1) -> Iterator[dict]:
+    """
+    Versión en flujo de fetch_experiments para el modo por lotes: mismos filtros y mismo
+    orden (más recientes primero), pero sin cargar nunca la colección ni el rango completo.
+    El espejo se lee por bloques, la lectura paralela usa rangos de STREAM_RANGE_SIZE
+    documentos, las particiones archivadas se intercalan por fecha con la consulta a
+    MongoDB y la validación se aplica lote a lote.
+    
+    Args:
+        Ver fetch_experiments
         
-        velocities_df = pd.DataFrame()
-        accelerations_df = pd.DataFrame()
+    Yields:
+        Documentos de 'history'
+    """
+    ranged = date_from is not None or date_to is not None
+    if mirror:
+        stream = iter_mirror_experiments(mirror)
+        if ranged:
+            stream = _in_range(stream, date_from, date_to)
+    elif workers > 1:
+        partitions = max(workers * PARTITIONS_PER_WORKER,
+                         -(-db[collection].estimated_document_count() // STREAM_RANGE_SIZE))
+        chunks = iter_ranges(db, 'fecha', workers, projection=None, as_arrays=False, collection=collection,
+                             query=fecha_range_filter(date_from, date_to), descending=True, partitions=partitions)
+        stream = itertools.chain.from_iterable(chunks)
+    else:
+        stream = db[collection].find({**ACTIVE_FILTER, **fecha_range_filter(date_from, date_to)},
+                                     batch_size=CHUNK_SAMPLE_SIZE).sort('fecha', -1)
+    
+    if ranged:
+        # Experimentos antiguos: particiones mensuales de una en una, intercaladas por fecha
+        stream = heapq.merge(stream, iter_partitions(date_from, date_to), key=_fecha_key, reverse=True)
+    if validate:
+        stream = _validated(stream)
+    return stream
+
+
+def plan_chunk_size(experiments: Iterator[dict], budget_mb: float = MEMORY_BUDGET_MB,
+                    in_flight: int = PIPELINE_QUEUE_SIZE + 2) -> Tuple[int, Iterator[dict], float]:
+    """
+    Elige el tamaño de lote para que los lotes en vuelo (los de la cola, el que se está
+    extrayendo y el que se está calculando) quepan en CHUNK_BUDGET_FRACTION del presupuesto.
+    La memoria por experimento se mide con tracemalloc sobre una muestra: documentos
+    leídos, filas de sensores y velocidades/aceleraciones.
+    
+    Args:
+        experiments: Iterador de documentos (se consume la muestra)
+        budget_mb: Presupuesto de memoria en MB
+        in_flight: Lotes que pueden estar en memoria a la vez
         
-        if not vel_acc_df.empty:
-            velocities_df = vel_acc_df[vel_acc_df['velocity_ms'].notna()] if 'velocity_ms' in vel_acc_df.columns else pd.DataFrame()
-            accelerations_df = vel_acc_df[vel_acc_df['acceleration_ms2'].notna()] if 'acceleration_ms2' in vel_acc_df.columns else pd.DataFrame()
-            
-            print(f"\n[OK] Calculadas {len(velocities_df)} velocidades y {len(accelerations_df)} aceleraciones")
-            
-            # Mostrar resumen
-            if not velocities_df.empty:
-                print("\n--- Velocidades Promedio ---")
-                print(velocities_df.groupby(['mode', 'sensor_to'])['velocity_ms'].mean().to_string())
-            
-            if not accelerations_df.empty:
-                print("\n--- Aceleraciones Promedio ---")
-                print(accelerations_df.groupby('mode')['acceleration_ms2'].mean().to_string())
+    Returns:
+        Tamaño de lote, iterador equivalente al original (muestra incluida) y bytes por experimento
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    try:
+        sample = list(itertools.islice(experiments, CHUNK_SAMPLE_SIZE))
+        if sample:
+            calculate_velocity_and_acceleration(experiments_to_dataframe(sample))
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    per_experiment = peak / max(len(sample), 1)
+    chunk = int(budget_mb * 1e6 * CHUNK_BUDGET_FRACTION / (per_experiment * in_flight))
+    return min(max(chunk, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE), itertools.chain(sample, experiments), per_experiment
+
+
+# ============ PIPELINE POR ETAPAS ============
+def compute_experiment(exp_data: pd.DataFrame) -> Dict[str, object]:
+    """
+    Etapa de cálculo de un experimento: estadísticas, fallos, velocidades y aceleraciones.
+    
+    Args:
+        exp_data: Filas de sensores de un experimento
         
-        # 5. Generar gráficas
-        print("\n[INFO] Generando graficas...")
-        plot_time_vs_sensor(stats, os.path.join(exp_graphs_dir, 'time_vs_sensor.png'))
-        plot_relative_error(stats, os.path.join(exp_graphs_dir, 'relative_error.png'))
+    Returns:
+        Diccionario con 'stats', 'failure_stats', 'velocities_df' y 'accelerations_df'
+    """
+    print("\n[INFO] Calculando estadisticas...")
+    stats = calculate_statistics(exp_data)
+    failure_stats = calculate_failure_statistics(exp_data)
+    
+    print("\n--- Resumen de Tiempos por Sensor ---")
+    print(stats['grouped'].to_string(index=False))
+    
+    print("\n--- Comparación Remoto vs Presencial ---")
+    print(stats['comparison'].to_string(index=False))
+    
+    if failure_stats and not failure_stats.get('summary', pd.DataFrame()).empty:
+        print("\n--- Estadísticas de Fallos por Modalidad ---")
+        print(failure_stats['summary'].to_string(index=False))
+    
+    print("\n[INFO] Calculando velocidades y aceleraciones...")
+    vel_acc_df = calculate_velocity_and_acceleration(exp_data)
+    
+    velocities_df = pd.DataFrame()
+    accelerations_df = pd.DataFrame()
+    
+    if not vel_acc_df.empty:
+        velocities_df = vel_acc_df[vel_acc_df['velocity_ms'].notna()] if 'velocity_ms' in vel_acc_df.columns else pd.DataFrame()
+        accelerations_df = vel_acc_df[vel_acc_df['acceleration_ms2'].notna()] if 'acceleration_ms2' in vel_acc_df.columns else pd.DataFrame()
         
-        if velocities_df is not None and not velocities_df.empty:
-            plot_velocity_vs_position(velocities_df, os.path.join(exp_graphs_dir, 'velocity_vs_position.png'))
+        print(f"\n[OK] Calculadas {len(velocities_df)} velocidades y {len(accelerations_df)} aceleraciones")
         
-        if accelerations_df is not None and not accelerations_df.empty:
-            plot_acceleration_comparison(accelerations_df, os.path.join(exp_graphs_dir, 'acceleration_comparison.png'))
+        if not velocities_df.empty:
+            print("\n--- Velocidades Promedio ---")
+            print(velocities_df.groupby(['mode', 'sensor_to'])['velocity_ms'].mean().to_string())
         
-        plot_experimental_vs_theoretical(exp_data, os.path.join(exp_graphs_dir, 'experimental_vs_theoretical.png'))
+        if not accelerations_df.empty:
+            print("\n--- Aceleraciones Promedio ---")
+            print(accelerations_df.groupby('mode')['acceleration_ms2'].mean().to_string())
+    
+    return {
+        'stats': stats,
+        'failure_stats': failure_stats,
+        'velocities_df': velocities_df,
+        'accelerations_df': accelerations_df,
+    }
+
+
+def render_experiment_graphs(stats: Dict[str, pd.DataFrame], velocities_df: pd.DataFrame,
+                             accelerations_df: pd.DataFrame, exp_data: pd.DataFrame, graphs_dir: str,
+                             tier: str = GRAPH_TIER):
+    """
+    Etapa de gráficas de un experimento (se ejecuta en un proceso del pool de render).
+    Usa las plantillas de mrua_plot_templates: cada proceso construye las cinco figuras
+    una vez y después solo actualiza sus datos. Con tier='draft' se guardan borradores
+    de baja resolución; la versión a 300 dpi se genera con mrua_render.py.
+    """
+    for output_path in render_experiment(stats, velocities_df, accelerations_df, exp_data, graphs_dir,
+                                         **TIERS[tier]):
+        print(f"[OK] Grafica guardada: {output_path}")
+
+
+def _init_render_worker():
+    """Los procesos de render no abren ventanas: backend sin pantalla."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+class _BoundedStage:
+    """
+    Etapa asíncrona con un máximo de tareas en vuelo: submit() se bloquea cuando la
+    etapa está llena (contrapresión sobre la etapa anterior). Con workers = 0 la
+    tarea se ejecuta en el momento.
+    """
+    
+    def __init__(self, name: str, executor, max_pending: int):
+        self.name = name
+        self.executor = executor
+        self.slots = threading.BoundedSemaphore(max(1, max_pending))
+        self.errors = []
+    
+    def _done(self, future, label: str):
+        self.slots.release()
+        if future.exception() is not None:
+            self.errors.append(f"{self.name} {label}: {future.exception()}")
+    
+    def submit(self, label: str, fn, *args):
+        if self.executor is None:
+            try:
+                fn(*args)
+            except Exception as e:
+                self.errors.append(f"{self.name} {label}: {e}")
+            return
+        self.slots.acquire()
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._done(f, label))
+    
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+def _extract_stage(experiments: Iterable[dict], out_queue: queue.Queue, batch_size: int, stop: threading.Event):
+    """Etapa de extracción (hilo propio): lee los documentos y los convierte a lotes de filas de sensores."""
+    def put(item) -> bool:
+        # put() con espera acotada para poder abandonar si el consumidor se detuvo
+        while not stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    try:
+        batch = []
+        for exp in experiments:
+            batch.append(exp)
+            if len(batch) >= batch_size:
+                if not put((batch, experiments_to_dataframe(batch))):
+                    return
+                batch = []
+        if batch:
+            put((batch, experiments_to_dataframe(batch)))
+    except Exception as e:
+        put(e)
+    finally:
+        put(None)
+
+
+def run_pipeline(db: pymongo.database.Database, experiments: Iterable[dict], output_dir: str,
+                 render_workers: int = RENDER_WORKERS, io_workers: int = IO_WORKERS,
+                 batch_size: int = PIPELINE_BATCH_SIZE, graph_tier: str = GRAPH_TIER) -> Dict[str, object]:
+    """
+    Ejecuta el análisis como etapas solapadas unidas por colas acotadas:
+    extracción (hilo) -> cálculo (hilo principal) -> gráficas (pool de procesos)
+    -> escritura de CSV y datos crudos (pool de hilos).
+    Las figuras resumen por modalidad y las estadísticas globales (GlobalStatistics) se
+    acumulan lote a lote y se escriben al final.
+    Cada cola admite un número fijo de elementos, de modo que una etapa lenta frena
+    a las anteriores, la memoria se mantiene estable y el tiempo total tiende al de
+    la etapa más lenta. La numeración de carpetas sigue el orden de extracción.
+    
+    Args:
+        db: Objeto Database de MongoDB (None = sin guardar datos crudos)
+        experiments: Documentos de 'history' (más recientes primero)
+        output_dir: Carpeta raíz de resultados
+        render_workers: Procesos de gráficas (0 = en el hilo de cálculo)
+        io_workers: Hilos de escritura (0 = en el hilo de cálculo)
+        batch_size: Experimentos por lote de extracción
+        graph_tier: Nivel de las gráficas por experimento ('none', 'draft' o 'full')
         
-        # 6. Exportar a CSV
-        print("\n[INFO] Exportando datos a CSV...")
-        export_to_csv(exp_data, stats, exp_csv_dir, velocities_df, accelerations_df, failure_stats)
+    Returns:
+        Resumen con experimentos procesados, tiempo total, figuras resumen, CSV de
+        estadísticas globales y errores de las etapas
+    """
+    start = datetime.now()
+    extracted = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    extractor = threading.Thread(target=_extract_stage, args=(experiments, extracted, batch_size, stop), daemon=True)
+    extractor.start()
+    
+    render = _BoundedStage('graficas', ProcessPoolExecutor(render_workers, initializer=_init_render_worker)
+                           if render_workers > 0 and graph_tier != 'none' else None, 2 * render_workers)
+    writer = _BoundedStage('escritura', ThreadPoolExecutor(io_workers) if io_workers > 0 else None, 2 * io_workers)
+    
+    # Contadores para numerar experimentos por modo
+    counters = {}
+    processed = 0
+    errors = []
+    summary = SummaryAccumulator()
+    global_stats = GlobalStatistics()
+    try:
+        while True:
+            item = extracted.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                errors.append(f"extraccion: {item}")
+                continue
+            batch, df = item
+            if df.empty:
+                continue
+            summary.add(documents_to_arrays(batch))
+            global_stats.add_rows(df)
+            batch_velocities, batch_accelerations = [], []
+            
+            # Guardar datos crudos del lote en MongoDB
+            if db is not None:
+                writer.submit('datos crudos', save_raw_data_to_mongodb, db, df, batch)
+            
+            # Agrupar por experiment_id y modo
+            for exp_id, exp_data in df.groupby('experiment_id', sort=False):
+                mode = exp_data['mode'].iloc[0]
+                counters[mode] = counters.get(mode, 0) + 1
+                suffix = 'remoto' if mode == 'remote' else 'presencial'
+                folder_name = f"prueba_{counters[mode]}_{suffix}"
+                
+                # Crear carpeta para este experimento
+                exp_output_dir = os.path.join(output_dir, folder_name)
+                exp_csv_dir = os.path.join(exp_output_dir, "csv")
+                exp_graphs_dir = os.path.join(exp_output_dir, "graphs")
+                os.makedirs(exp_csv_dir, exist_ok=True)
+                
+                print(f"\n{'='*60}")
+                print(f"Procesando: {folder_name} (ID: {exp_id})")
+                print(f"{'='*60}")
+                
+                result = compute_experiment(exp_data)
+                batch_velocities.append(result['velocities_df'])
+                batch_accelerations.append(result['accelerations_df'])
+                if graph_tier != 'none':
+                    os.makedirs(exp_graphs_dir, exist_ok=True)
+                    render.submit(folder_name, render_experiment_graphs, result['stats'], result['velocities_df'],
+                                  result['accelerations_df'], exp_data, exp_graphs_dir, graph_tier)
+                writer.submit(folder_name, export_to_csv, exp_data, result['stats'], exp_csv_dir,
+                              result['velocities_df'], result['accelerations_df'], result['failure_stats'])
+                processed += 1
+                print(f"\n[OK] Calculos de {folder_name} completados (graficas y CSV en cola)")
+            global_stats.add_results(pd.concat(batch_velocities), pd.concat(batch_accelerations))
+    finally:
+        stop.set()
+        render.close()
+        writer.close()
+        extractor.join()
+    
+    summary_graphs, global_csv = [], []
+    if processed:
+        global_csv = export_global_statistics(global_stats, os.path.join(output_dir, GLOBAL_STATS_DIR))
+        for path in global_csv:
+            print(f"[OK] Estadisticas globales exportadas: {path}")
+
+        print("\n[INFO] Generando figuras resumen por modalidad...")
+        summary_graphs = render_summary(summary, os.path.join(output_dir, SUMMARY_GRAPHS_DIR))
+        for path in summary_graphs:
+            print(f"[OK] Grafica guardada: {path}")
+    
+    return {
+        'experiments': processed,
+        'elapsed_s': (datetime.now() - start).total_seconds(),
+        'summary_graphs': summary_graphs,
+        'global_statistics': global_csv,
+        'errors': errors + render.errors + writer.errors,
+    }
+
+
+# ============ FUNCIÓN PRINCIPAL ============
+def main():
+    """
+    Función principal que ejecuta todo el pipeline de análisis.
+    Organiza los resultados en carpetas por experimento (prueba_1_remoto, prueba_2_remoto, etc.)
+    """
+    parser = argparse.ArgumentParser(description="Analisis de experimentos MRUA")
+    parser.add_argument('--validate', action='store_true',
+                        help="Descartar experimentos invalidos (ver mrua_validation.py)")
+    parser.add_argument('--mirror', nargs='?', const=MIRROR_PATH, default=None,
+                        help="Leer del espejo SQLite local sin servidor MongoDB (ver mrua_mirror.py)")
+    parser.add_argument('--from', dest='date_from', default=None,
+                        help="Fecha inicial incluida (AAAA-MM-DD); incluye el archivo mensual")
+    parser.add_argument('--to', dest='date_to', default=None,
+                        help="Fecha final excluida (AAAA-MM-DD); incluye el archivo mensual")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Hilos para leer 'history' por rangos de fecha en paralelo")
+    parser.add_argument('--render-workers', type=int, default=RENDER_WORKERS,
+                        help="Procesos para generar graficas (0 = en el proceso principal)")
+    parser.add_argument('--io-workers', type=int, default=IO_WORKERS,
+                        help="Hilos para escribir CSV y datos crudos (0 = en el proceso principal)")
+    parser.add_argument('--chunked', action='store_true',
+                        help="Procesar 'history' en flujo, por lotes de tamano fijo, sin cargarlo entero en memoria")
+    parser.add_argument('--memory-budget', type=float, default=MEMORY_BUDGET_MB,
+                        help="Con --chunked: memoria objetivo en MB; elige el tamano de lote")
+    parser.add_argument('--experiment-graphs', choices=GRAPH_TIERS, default=GRAPH_TIER,
+                        help="Graficas en cada carpeta de experimento (none = solo figuras resumen; "
+                             "full = 300 dpi; ver mrua_render.py)")
+    args = parser.parse_args()
+    
+    print("=" * 60)
+    print("ANÁLISIS DE EXPERIMENTOS MRUA")
+    print("=" * 60)
+    
+    # 1. Conectar a MongoDB (con --mirror el análisis es local y no necesita servidor)
+    db = None
+    if not args.mirror:
+        try:
+            db = connect_to_mongodb(MONGODB_URI, DATABASE_NAME)
+        except Exception as e:
+            print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+            return
         
-        print(f"\n[OK] Analisis de {folder_name} completado!")
-        print(f"   - Graficas guardadas en: {exp_graphs_dir}")
-        print(f"   - CSV guardados en: {exp_csv_dir}")
+        # 1.1. Asegurar índices usados por el pipeline (idempotente)
+        ensure_indexes(db)
+    
+    # 2-6. Extracción, cálculo, gráficas y escritura como etapas solapadas
+    batch_size = PIPELINE_BATCH_SIZE
+    try:
+        if args.chunked:
+            # Modo por lotes: lectura en flujo y tamaño de lote según el presupuesto de memoria
+            experiments = stream_experiments(db, COLLECTION_NAME, validate=args.validate, mirror=args.mirror,
+                                             date_from=args.date_from, date_to=args.date_to, workers=args.workers)
+            batch_size, experiments, per_experiment = plan_chunk_size(experiments, args.memory_budget)
+            print(f"[INFO] Modo por lotes: ~{per_experiment / 1e3:.1f} kB por experimento, "
+                  f"lotes de {batch_size} (presupuesto {args.memory_budget:.0f} MB)")
+        else:
+            experiments = iter_experiments(db, COLLECTION_NAME, validate=args.validate, mirror=args.mirror,
+                                           date_from=args.date_from, date_to=args.date_to, workers=args.workers)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        return
+    summary = run_pipeline(db, experiments, OUTPUT_DIR, render_workers=args.render_workers,
+                           io_workers=args.io_workers, batch_size=batch_size, graph_tier=args.experiment_graphs)
+    if summary['experiments'] == 0:
+        print("[ERROR] No hay datos para analizar")
+        return
     
     print("\n" + "=" * 60)
     print("[OK] Analisis completo de todos los experimentos!")
+    print(f"   - {summary['experiments']} experimentos en {summary['elapsed_s']:.1f} s")
     print(f"   - Resultados organizados en: {OUTPUT_DIR}")
-    print(f"   - Datos crudos guardados en MongoDB: coleccion '{RAW_DATA_COLLECTION}'")
+    print(f"   - Figuras resumen: {os.path.join(OUTPUT_DIR, SUMMARY_GRAPHS_DIR)}")
+    print(f"   - Estadisticas globales: {os.path.join(OUTPUT_DIR, GLOBAL_STATS_DIR)}")
+    if args.experiment_graphs != 'full':
+        print("   - Graficas de un experimento a 300 dpi: python mrua_render.py render prueba_N_<modo>")
+    if db is not None:
+        print(f"   - Datos crudos guardados en MongoDB: coleccion '{RAW_DATA_COLLECTION}'")
+    if summary['errors']:
+        print(f"[WARNING] {len(summary['errors'])} tareas fallaron:")
+        for error in summary['errors']:
+            print(f"   - {error}")
     print("=" * 60)
 
 
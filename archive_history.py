@@ -0,0 +1,257 @@
+"""
+Archivo histórico particionado por mes.
+Mueve los experimentos de 'history' más antiguos que una edad configurable a
+particiones mensuales comprimidas (analysis_output/history_archive/AAAA-MM.jsonl.gz)
+y mantiene un índice con el número de experimentos y el rango de fechas de cada una.
+Así la colección activa se mantiene pequeña y un análisis por rango de fechas
+(p. ej. un semestre) solo abre las particiones de los meses que lo cubren.
+
+Uso:
+    python archive_history.py                        # Archivar experimentos con más de ARCHIVE_AGE_DAYS días
+    python archive_history.py --older-than 90        # Edad en días
+    python archive_history.py --dry-run              # Solo mostrar qué se archivaría
+    python archive_history.py list                   # Listar particiones
+"""
+
+import argparse
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List
+
+import pandas as pd
+import pymongo
+
+from mrua_aggregates import ACTIVE_FILTER, remove_from_aggregates, sync_history
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "analysis_output", "history_archive")
+INDEX_FILE = "index.json"
+ARCHIVE_AGE_DAYS = 180
+BATCH_SIZE = 5000
+
+
+# ============ FECHAS ============
+def to_timestamp(value) -> pd.Timestamp:
+    """Convierte una fecha (texto ISO, datetime o Timestamp) a Timestamp UTC (NaT si no es válida)."""
+    ts = pd.to_datetime(value, errors='coerce', utc=True)
+    return ts if not pd.isna(ts) else pd.NaT
+
+
+def fecha_bound(value) -> str:
+    """Límite de fecha con el mismo formato que el bridge (toISOString), comparable como texto."""
+    ts = to_timestamp(value)
+    return ts.strftime('%Y-%m-%dT%H:%M:%S.') + f"{ts.microsecond // 1000:03d}Z"
+
+
+def fecha_range_filter(date_from=None, date_to=None) -> Dict:
+    """
+    Filtro de MongoDB para el rango [date_from, date_to) sobre 'fecha'.
+    Cubre tanto fechas guardadas como texto ISO (bridge) como datetime.
+    """
+    as_text, as_date = {}, {}
+    if date_from is not None:
+        as_text['$gte'], as_date['$gte'] = fecha_bound(date_from), to_timestamp(date_from).to_pydatetime()
+    if date_to is not None:
+        as_text['$lt'], as_date['$lt'] = fecha_bound(date_to), to_timestamp(date_to).to_pydatetime()
+    if not as_text:
+        return {}
+    return {'$or': [{'fecha': as_text}, {'fecha': as_date}]}
+
+
+def _month(fecha) -> str:
+    ts = to_timestamp(fecha)
+    return ts.strftime('%Y-%m') if not pd.isna(ts) else None
+
+
+# ============ PARTICIONES ============
+def load_index(archive_dir: str = ARCHIVE_DIR) -> Dict[str, Dict]:
+    """Índice de particiones: mes -> {count, oldest, newest}."""
+    path = os.path.join(archive_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_index(index: Dict[str, Dict], archive_dir: str):
+    tmp_path = os.path.join(archive_dir, INDEX_FILE + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(sorted(index.items())), f, indent=2)
+    os.replace(tmp_path, os.path.join(archive_dir, INDEX_FILE))
+
+
+def _partition_path(month: str, archive_dir: str) -> str:
+    return os.path.join(archive_dir, f"{month}.jsonl.gz")
+
+
+def _append_partition(month: str, docs: List[dict], archive_dir: str):
+    """Añade documentos a la partición del mes (gzip admite concatenar miembros)."""
+    with gzip.open(_partition_path(month, archive_dir), 'at', encoding='utf-8') as f:
+        for doc in docs:
+            f.write(json.dumps(doc, default=str, ensure_ascii=False) + '\n')
+
+
+def partitions_for_range(date_from=None, date_to=None, archive_dir: str = ARCHIVE_DIR) -> List[str]:
+    """Meses del índice que se solapan con [date_from, date_to) (poda de particiones)."""
+    selected = []
+    for month, info in load_index(archive_dir).items():
+        if date_from is not None and to_timestamp(info['newest']) < to_timestamp(date_from):
+            continue
+        if date_to is not None and to_timestamp(info['oldest']) >= to_timestamp(date_to):
+            continue
+        selected.append(month)
+    return sorted(selected)
+
+
+def read_partitions(date_from=None, date_to=None, archive_dir: str = ARCHIVE_DIR) -> List[dict]:
+    """
+    Lee los experimentos archivados dentro de [date_from, date_to), abriendo solo las
+    particiones necesarias. Si una partición contiene el mismo _id más de una vez
+    (archivado interrumpido y repetido) se conserva la última copia.
+
+    Returns:
+        Lista de documentos con el formato de 'history'
+    """
+    start, end = to_timestamp(date_from), to_timestamp(date_to)
+    docs = {}
+    for month in partitions_for_range(date_from, date_to, archive_dir):
+        with gzip.open(_partition_path(month, archive_dir), 'rt', encoding='utf-8') as f:
+            for line in f:
+                doc = json.loads(line)
+                ts = to_timestamp(doc.get('fecha'))
+                if (not pd.isna(start) and ts < start) or (not pd.isna(end) and ts >= end):
+                    continue
+                docs[str(doc.get('_id'))] = doc
+    return list(docs.values())
+
+
+def iter_partitions(date_from=None, date_to=None, archive_dir: str = ARCHIVE_DIR) -> Iterator[dict]:
+    """
+    Igual que read_partitions, pero de una partición cada vez y en orden de fecha
+    descendente (meses más recientes primero y, dentro de cada mes, por fecha), de
+    modo que se puede intercalar con una consulta sort('fecha', -1) sin cargar el rango.
+
+    Yields:
+        Documentos con el formato de 'history'
+    """
+    start, end = to_timestamp(date_from), to_timestamp(date_to)
+    for month in reversed(partitions_for_range(date_from, date_to, archive_dir)):
+        docs = {}
+        with gzip.open(_partition_path(month, archive_dir), 'rt', encoding='utf-8') as f:
+            for line in f:
+                doc = json.loads(line)
+                ts = to_timestamp(doc.get('fecha'))
+                if (not pd.isna(start) and ts < start) or (not pd.isna(end) and ts >= end):
+                    continue
+                docs[str(doc.get('_id'))] = doc
+        yield from sorted(docs.values(), key=lambda doc: to_timestamp(doc.get('fecha')).value, reverse=True)
+
+
+# ============ ARCHIVADO ============
+def archive_older_than(db: pymongo.database.Database, days: int = ARCHIVE_AGE_DAYS,
+                       archive_dir: str = ARCHIVE_DIR, dry_run: bool = False,
+                       batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Mueve a las particiones mensuales los experimentos con fecha anterior a hoy - days.
+    Cada lote se escribe en disco antes de eliminarse de 'history' y se descuenta de
+    los agregados materializados; las series por periodo (mrua_rollups) lo conservan,
+    así que antes se incorporan a ellas los experimentos aún pendientes.
+    Los documentos cuya fecha (texto) entra en el rango pero no se puede interpretar
+    se dejan en 'history' con un aviso (mrua_validation.py --quarantine los retira).
+
+    Returns:
+        Número de experimentos archivados por mes
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+    query = {**ACTIVE_FILTER, **fecha_range_filter(date_to=cutoff)}
+    collection = db[COLLECTION_NAME]
+    os.makedirs(archive_dir, exist_ok=True)
+    index = load_index(archive_dir)
+    moved: Dict[str, int] = {}
+    if dry_run:
+        unparsed = 0
+        for doc in collection.find(query, {'fecha': 1}, batch_size=batch_size):
+            month = _month(doc.get('fecha'))
+            if month is None:
+                unparsed += 1
+                continue
+            moved[month] = moved.get(month, 0) + 1
+        if unparsed:
+            print(f"[WARNING] {unparsed} experimentos con fecha no interpretable no se archivarian")
+        return moved
+
+    sync_history(db)
+    skipped = []  # _id con fecha no interpretable: se excluyen de las consultas siguientes
+    while True:
+        # Siempre el primer lote: los anteriores ya se eliminaron de 'history'
+        batch_query = {**query, '_id': {'$nin': skipped}} if skipped else query
+        docs = list(collection.find(batch_query).sort('fecha', 1).limit(batch_size))
+        if not docs:
+            break
+        by_month: Dict[str, List[dict]] = {}
+        for doc in docs:
+            month = _month(doc.get('fecha'))
+            if month is None:
+                print(f"[WARNING] Fecha no interpretable, no se archiva: {doc['_id']} ({doc.get('fecha')!r})")
+                skipped.append(doc['_id'])
+                continue
+            by_month.setdefault(month, []).append(doc)
+
+        for month, month_docs in by_month.items():
+            moved[month] = moved.get(month, 0) + len(month_docs)
+            _append_partition(month, month_docs, archive_dir)
+            fechas = [str(to_timestamp(d['fecha']).isoformat()) for d in month_docs]
+            info = index.setdefault(month, {'count': 0, 'oldest': min(fechas), 'newest': max(fechas)})
+            info['count'] += len(month_docs)
+            info['oldest'], info['newest'] = min(info['oldest'], *fechas), max(info['newest'], *fechas)
+        _save_index(index, archive_dir)
+
+        archived = [doc for month_docs in by_month.values() for doc in month_docs]
+        if archived:
+            collection.delete_many({'_id': {'$in': [doc['_id'] for doc in archived]}})
+            remove_from_aggregates(db, archived)
+            print(f"[INFO] Archivados {sum(moved.values())} experimentos")
+        if len(docs) < batch_size:
+            break
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivo mensual comprimido de la coleccion history")
+    parser.add_argument('command', choices=['archive', 'list'], nargs='?', default='archive')
+    parser.add_argument('--older-than', type=int, default=ARCHIVE_AGE_DAYS, help="Edad minima en dias")
+    parser.add_argument('--dry-run', action='store_true', help="Solo mostrar que se archivaria")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        index = load_index()
+        if not index:
+            print("[INFO] No hay particiones archivadas")
+        for month, info in index.items():
+            size = os.path.getsize(_partition_path(month, ARCHIVE_DIR)) / 1e6
+            print(f"   - {month}: {info['count']} experimentos ({size:.2f} MB), {info['oldest']} a {info['newest']}")
+        return
+
+    try:
+        client = pymongo.MongoClient(MONGODB_URI)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+
+    moved = archive_older_than(db, args.older_than, dry_run=args.dry_run)
+    verb = "a archivar" if args.dry_run else "archivados"
+    print(f"[OK] {sum(moved.values())} experimentos {verb} (anteriores a {args.older_than} dias)")
+    for month, count in sorted(moved.items()):
+        print(f"   - {month}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark de memoria del flujo de datos del análisis y la síntesis.
+Genera un histórico sintético, lo convierte al DataFrame de sensores y mide con
+tracemalloc el pico de memoria de cada etapa (estadísticas, fallos, separación por
+modalidad, posiciones por experimento, velocidades/aceleraciones y coherencia física
+de la síntesis). El pico se expresa en copias del DataFrame (el pico medido de
+df.copy(deep=True)): con copy-on-write y recorridos por groupby/posiciones
+precalculadas, ninguna etapa que solo lee los datos debe acercarse a dos copias.
+
+Uso:
+    python benchmark_memory.py                      # 20000 experimentos
+    python benchmark_memory.py --experiments 100000 --max-ratio 1.8
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import analyze_mrua_experiments as analysis
+import synthesize_mrua_results as synthesis
+
+
+# ============ CONFIGURACIÓN ============
+DEFAULT_EXPERIMENTS = 20000
+MAX_RATIO = 2.0   # Pico permitido en copias del DataFrame (las etapas de salida no cuentan)
+
+
+# ============ DATOS SINTÉTICOS ============
+def synthetic_history(n: int, seed: int = 0) -> List[dict]:
+    """Documentos de 'history' con tiempos plausibles, ~20 % fallidos y algún sensor sin registro."""
+    rng = np.random.default_rng(seed)
+    t12 = rng.uniform(0.5, 1.0, n)
+    failed = rng.random(n) < 0.2
+    missing_s3 = rng.random(n) < 0.05
+    return [{
+        'id': 1700000000000 + i,
+        'mode': 'remote' if i % 2 else 'presential',
+        'failed': bool(failed[i]),
+        'fecha': '2025-01-01T00:00:00.000Z',
+        't12': float(t12[i]),
+        't23': 0 if missing_s3[i] else float(t12[i] + 0.4),
+        't34': 0 if failed[i] else float(t12[i] + 0.7),
+        'tiempo': float(t12[i] + 0.7),
+    } for i in range(n)]
+
+
+# ============ MEDICIÓN ============
+def measure(fn: Callable, *args) -> Dict[str, float]:
+    """Pico de memoria (bytes sobre la memoria ya ocupada) y tiempo de una llamada."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    del result
+    return {'peak': peak, 'elapsed_s': elapsed}
+
+
+def run_benchmark(n: int) -> List[Dict[str, object]]:
+    """
+    Mide cada etapa sobre el DataFrame de n experimentos.
+
+    Returns:
+        Filas con etapa, pico (bytes), pico en copias del DataFrame, tiempo y si la
+        etapa produce una salida proporcional a los datos (no se compara con el límite)
+    """
+    df = analysis.experiments_to_dataframe(synthetic_history(n))
+    synth_df = df.rename(columns={'experiment_id': 'experiment_index'})
+
+    stages = [
+        ('copia completa (referencia)', lambda: df.copy(deep=True), False),
+        ('calculate_statistics', lambda: analysis.calculate_statistics(df), False),
+        ('calculate_failure_statistics', lambda: analysis.calculate_failure_statistics(df), False),
+        ('split_by_mode', lambda: analysis.split_by_mode(df), False),
+        ('experiment_positions', lambda: analysis.experiment_positions(df), False),
+        ('ensure_physical_coherence', lambda: synthesis.ensure_physical_coherence(synth_df), False),
+        ('calculate_velocity_and_acceleration', lambda: analysis.calculate_velocity_and_acceleration(df), True),
+    ]
+    rows = []
+    for name, fn, produces_output in stages:
+        result = measure(fn)
+        rows.append({'stage': name, 'peak': result['peak'], 'elapsed_s': result['elapsed_s'],
+                     'output': produces_output})
+    one_copy = rows[0]['peak']
+    for row in rows:
+        row['ratio'] = row['peak'] / one_copy
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pico de memoria por etapa del analisis MRUA")
+    parser.add_argument('--experiments', type=int, default=DEFAULT_EXPERIMENTS)
+    parser.add_argument('--max-ratio', type=float, default=MAX_RATIO,
+                        help="Pico maximo por etapa en copias del DataFrame (codigo de salida 1 si se supera)")
+    args = parser.parse_args()
+
+    rows = run_benchmark(args.experiments)
+    print(f"[INFO] {args.experiments} experimentos, una copia del DataFrame de sensores: {rows[0]['peak'] / 1e6:.1f} MB")
+    print(f"{'etapa':<40}{'pico MB':>10}{'copias':>9}{'tiempo s':>10}")
+    exceeded = []
+    for row in rows:
+        note = '  (salida)' if row['output'] else ''
+        print(f"{row['stage']:<40}{row['peak'] / 1e6:>10.1f}{row['ratio']:>9.2f}{row['elapsed_s']:>10.2f}{note}")
+        if not row['output'] and row['ratio'] > args.max_ratio:
+            exceeded.append(row['stage'])
+    if exceeded:
+        print(f"[WARNING] Superan x{args.max_ratio} copias: {', '.join(exceeded)}")
+        sys.exit(1)
+    print(f"[OK] Todas las etapas de lectura por debajo de x{args.max_ratio} copias del DataFrame")
+
+
+if __name__ == "__main__":
+    main()
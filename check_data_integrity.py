@@ -1,69 +1,328 @@
+"""
+Verificación de integridad de las carpetas de resultados (analysis_output).
+Recorre todas las carpetas de experimentos, de cualquier modalidad y con los CSV en
+'csv/' (prueba_N_modo/csv) o directamente en la carpeta, y comprueba en paralelo:
+  - sumas SHA-256, tamaños y ficheros contra el manifest.json escrito por export_to_csv
+  - que accelerations.csv exista y tenga la fila de aceleración media
+  - que las filas y los valores de raw_sensors_data.csv coincidan con el documento
+    de 'history' del que salen (modalidad, fallo y tiempo por sensor)
+La verificación es incremental: se guarda la firma (nombre, tamaño y mtime de cada
+fichero) de cada carpeta y solo se vuelven a leer las que cambiaron desde la última
+ejecución (o que no se pudieron contrastar con 'history' porque MongoDB no estaba
+disponible). El resultado es un único informe JSON.
+
+Uso:
+    python check_data_integrity.py                    # Incremental sobre analysis_output
+    python check_data_integrity.py --full             # Volver a verificar todas las carpetas
+    python check_data_integrity.py --no-db --base otra/carpeta --workers 8
+"""
+
+import argparse
+import json
 import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
-from pathlib import Path
-
-BASE_DIR = Path("c:/Dashboard de Control MRU/analysis_output")
-
-def log(msg):
-    with open("integrity_log.txt", "a", encoding="utf-8") as f:
-        f.write(msg + "\n")
-    print(msg)
-
-def check_integrity():
-    if os.path.exists("integrity_log.txt"):
-        os.remove("integrity_log.txt")
-        
-    log("Checking data integrity for first 70 experiments...")
-    
-    missing_accel = []
-    empty_accel = []
-    valid_count = 0
-    total_checked = 0
-    
-    # Check remote 1-70
-    for i in range(1, 72):
-        folder_name = f"prueba_{i}_remoto"
-        folder_path = BASE_DIR / folder_name
-        
-        if not folder_path.exists():
-            continue
-            
-        if total_checked >= 70:
-            break
-            
-        csv_path = folder_path / "csv" / "accelerations.csv"
-        
-        if not csv_path.exists():
-            missing_accel.append(folder_name)
+import pymongo
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from mrua_manifest import MANIFEST_NAME, file_checksum, read_manifest
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+BASE_DIR = os.path.join(os.path.dirname(__file__), "analysis_output")
+REPORT_NAME = "integrity_report.json"
+CACHE_NAME = ".integrity_cache.json"
+CSV_SUBDIR = "csv"
+RAW_CSV = "raw_sensors_data.csv"
+ACCEL_CSV = "accelerations.csv"
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+HISTORY_BATCH_SIZE = 1000   # ids por consulta $in a 'history'
+TIME_TOLERANCE = 1e-9       # Los CSV guardan los tiempos con repr completo
+
+
+# ============ RECORRIDO ============
+def find_output_folders(base_dir: str) -> List[Tuple[str, str]]:
+    """
+    Carpetas de experimento bajo base_dir: (nombre, carpeta de los CSV).
+    Una carpeta cuenta si tiene 'csv/', manifiesto o raw_sensors_data.csv; así se
+    ignoran summary_graphs, global_statistics y similares.
+    """
+    folders = []
+    with os.scandir(base_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            csv_dir = os.path.join(entry.path, CSV_SUBDIR)
+            if os.path.isdir(csv_dir):
+                folders.append((entry.name, csv_dir))
+            elif any(os.path.exists(os.path.join(entry.path, name)) for name in (MANIFEST_NAME, RAW_CSV)):
+                folders.append((entry.name, entry.path))
+    return sorted(folders)
+
+
+def folder_signature(csv_dir: str) -> List[List]:
+    """Nombre, tamaño y mtime de cada fichero: cambia si se reescribe cualquier fichero."""
+    with os.scandir(csv_dir) as entries:
+        return sorted([entry.name, entry.stat().st_size, entry.stat().st_mtime_ns]
+                      for entry in entries if entry.is_file())
+
+
+def _mode_from_name(name: str) -> str:
+    name = name.lower()
+    return 'remote' if 'remoto' in name else 'presential' if 'presencial' in name else 'unknown'
+
+
+# ============ VERIFICACIÓN POR CARPETA ============
+def check_folder(task: Tuple[str, str, Optional[List]]) -> Dict:
+    """
+    Verifica una carpeta (se ejecuta en los procesos del pool).
+
+    Args:
+        task: (nombre, carpeta de los CSV, firma guardada o None)
+
+    Returns:
+        Resultado con firma, problemas y, si hay datos crudos de un único experimento,
+        su id, modalidad, fallo y tiempos por sensor (para contrastar con 'history').
+        Si la firma no cambió se devuelve {'unchanged': True}.
+    """
+    name, csv_dir, cached_signature = task
+    signature = folder_signature(csv_dir)
+    if cached_signature is not None and signature == cached_signature:
+        return {'folder': name, 'unchanged': True}
+
+    problems = []
+    manifest = read_manifest(csv_dir)
+    experiment = (manifest or {}).get('experiment') or {}
+    mode = experiment.get('mode') or _mode_from_name(name)
+
+    # 1. Ficheros contra el manifiesto
+    present = {entry[0] for entry in signature} - {MANIFEST_NAME}
+    if manifest is None:
+        problems.append(('no_manifest', MANIFEST_NAME))
+    else:
+        for file_name, expected in manifest.get('files', {}).items():
+            path = os.path.join(csv_dir, file_name)
+            if file_name not in present:
+                problems.append(('missing_file', file_name))
+            elif os.path.getsize(path) != expected['bytes'] or file_checksum(path) != expected['sha256']:
+                problems.append(('checksum_mismatch', file_name))
+        for file_name in sorted(present - set(manifest.get('files', {}))):
+            if file_name.endswith('.csv'):
+                problems.append(('unlisted_file', file_name))
+
+    # 2. Aceleración media
+    accel_path = os.path.join(csv_dir, ACCEL_CSV)
+    if ACCEL_CSV not in present:
+        problems.append(('missing_accelerations', ACCEL_CSV))
+    else:
+        try:
+            accel = pd.read_csv(accel_path, usecols=['sensor_from'])
+            if accel.empty:
+                problems.append(('empty_accelerations', ACCEL_CSV))
+            elif not accel['sensor_from'].isna().any():
+                problems.append(('no_average_acceleration', ACCEL_CSV))
+        except (ValueError, pd.errors.ParserError) as e:
+            problems.append(('unreadable', f"{ACCEL_CSV}: {e}"))
+
+    # 3. Datos crudos (filas contra el manifiesto; valores contra 'history' en el proceso principal)
+    raw = None
+    if RAW_CSV in present:
+        try:
+            df = pd.read_csv(os.path.join(csv_dir, RAW_CSV),
+                             usecols=['experiment_id', 'mode', 'failed', 'sensor_id', 'time_s'])
+            expected_rows = (manifest or {}).get('files', {}).get(RAW_CSV, {}).get('rows')
+            if expected_rows is not None and expected_rows != len(df):
+                problems.append(('row_count_mismatch', f"{RAW_CSV}: {len(df)} != {expected_rows}"))
+            if not df.empty and df['experiment_id'].nunique() == 1:
+                df = df.sort_values('sensor_id')
+                raw = {
+                    'id': str(df['experiment_id'].iloc[0]),
+                    'mode': df['mode'].iloc[0],
+                    'failed': bool(df['failed'].iloc[0]),
+                    'sensors': df['sensor_id'].astype(int).tolist(),
+                    'times': df['time_s'].astype(float).tolist(),
+                }
+                mode = raw['mode']
+        except (ValueError, pd.errors.ParserError) as e:
+            problems.append(('unreadable', f"{RAW_CSV}: {e}"))
+
+    return {'folder': name, 'mode': mode, 'signature': signature, 'problems': problems, 'raw': raw}
+
+
+# ============ CONTRASTE CON HISTORY ============
+def _history_query(ids: List[str]) -> Dict:
+    """
+    Documentos de 'history' de un lote de experiment_id. El bridge guarda 'id' como
+    número (Date.now()) y los simulados como texto; los documentos sin 'id' se
+    exportan con str(_id).
+    """
+    return {'$or': [
+        {'id': {'$in': ids + [int(value) for value in ids if value.isdigit()]}},
+        {'_id': {'$in': ids + [ObjectId(value) for value in ids if ObjectId.is_valid(value)]}},
+    ]}
+
+
+def check_against_history(db: pymongo.database.Database, results: List[Dict],
+                          batch_size: int = HISTORY_BATCH_SIZE) -> int:
+    """
+    Compara los datos crudos de cada carpeta con su documento de 'history' (consultas
+    $in por lotes sobre el índice id_1) y añade los problemas a cada resultado.
+    Las filas esperadas se generan con experiments_to_dataframe, igual que al exportar.
+
+    Returns:
+        Carpetas contrastadas
+    """
+    from analyze_mrua_experiments import experiments_to_dataframe
+
+    pending = [result for result in results if result.get('raw')]
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        docs = list(db[COLLECTION_NAME].find(_history_query([r['raw']['id'] for r in batch])))
+        expected = experiments_to_dataframe(docs) if docs else pd.DataFrame(columns=['experiment_id'])
+        by_id = {exp_id: rows.sort_values('sensor_id') for exp_id, rows in expected.groupby('experiment_id')}
+        for result in batch:
+            raw, rows = result['raw'], by_id.get(result['raw']['id'])
+            if rows is None:
+                result['problems'].append(('not_in_history', raw['id']))
+                continue
+            if rows['mode'].iloc[0] != raw['mode']:
+                result['problems'].append(('mode_mismatch', f"{raw['mode']} != {rows['mode'].iloc[0]}"))
+            if bool(rows['failed'].iloc[0]) != raw['failed']:
+                result['problems'].append(('failed_mismatch', f"{raw['failed']} != {bool(rows['failed'].iloc[0])}"))
+            if rows['sensor_id'].tolist() != raw['sensors']:
+                result['problems'].append(('history_rows_mismatch', f"sensores {raw['sensors']} != {rows['sensor_id'].tolist()}"))
+            elif not np.allclose(rows['time_s'].to_numpy(float), raw['times'], rtol=0, atol=TIME_TOLERANCE):
+                result['problems'].append(('time_mismatch', raw['id']))
+    return len(pending)
+
+
+# ============ INFORME ============
+def _load_cache(path: str) -> Dict[str, Dict]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(data, path: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def check_integrity(base_dir: str = BASE_DIR, db: pymongo.database.Database = None,
+                    workers: int = WORKERS, full: bool = False) -> Dict:
+    """
+    Verifica todas las carpetas de base_dir (solo las que cambiaron, salvo full=True)
+    y escribe el informe y la caché de firmas en base_dir. Con db, las carpetas que
+    la última vez no se contrastaron con 'history' se vuelven a verificar.
+
+    Returns:
+        Informe: totales, carpetas verificadas y reutilizadas, carpetas por modalidad,
+        problemas por tipo y lista de problemas (carpeta, modalidad, tipo, detalle)
+    """
+    start = time.perf_counter()
+    cache_path = os.path.join(base_dir, CACHE_NAME)
+    cache = {} if full else _load_cache(cache_path)
+    folders = find_output_folders(base_dir)
+    tasks = [(name, csv_dir, cache.get(name, {}).get('signature')
+              if db is None or cache.get(name, {}).get('history_checked', True) else None)
+             for name, csv_dir in folders]
+
+    if workers > 0 and len(tasks) > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(check_folder, tasks, chunksize=max(1, len(tasks) // (workers * 8))))
+    else:
+        results = [check_folder(task) for task in tasks]
+
+    changed = [result for result in results if not result.get('unchanged')]
+    verified, history_checked = 0, db is not None
+    if db is not None:
+        try:
+            verified = check_against_history(db, changed)
+        except PyMongoError as e:
+            print(f"[WARNING] No se pudo contrastar con '{COLLECTION_NAME}': {e}")
+            history_checked = False
+
+    # Caché nueva: carpetas actuales (las eliminadas desaparecen)
+    new_cache = {}
+    for result in results:
+        if result.get('unchanged'):
+            new_cache[result['folder']] = cache[result['folder']]
         else:
-            try:
-                df = pd.read_csv(csv_path)
-                if df.empty:
-                    empty_accel.append(folder_name)
-                    log(f"{folder_name}: Empty dataframe")
-                else:
-                    # Check if avg acceleration exists (sensor_from is empty)
-                    avg = df[df['sensor_from'].isna() | df['sensor_from'].isnull()]
-                    if avg.empty:
-                        empty_accel.append(f"{folder_name} (no average)")
-                        log(f"{folder_name}: No average acceleration row")
-                    else:
-                        valid_count += 1
-            except Exception as e:
-                log(f"Error reading {folder_name}: {e}")
-                
-        total_checked += 1
-        
-    log(f"\nChecked {total_checked} folders.")
-    log(f"Valid acceleration data found: {valid_count}")
-    
-    if missing_accel:
-        log("\nMissing accelerations.csv:")
-        for f in missing_accel: log(f" - {f}")
-        
-    if empty_accel:
-        log("\nEmpty or invalid accelerations.csv:")
-        for f in empty_accel: log(f" - {f}")
+            new_cache[result['folder']] = {
+                'signature': result['signature'],
+                'mode': result['mode'],
+                'problems': [list(problem) for problem in result['problems']],
+                'history_checked': history_checked,
+            }
+    _write_json(new_cache, cache_path)
+
+    problems = [{'folder': folder, 'mode': entry['mode'], 'problem': problem, 'detail': detail}
+                for folder, entry in sorted(new_cache.items()) for problem, detail in entry['problems']]
+    report = {
+        'generated_at': datetime.now().isoformat(),
+        'base_dir': os.path.abspath(base_dir),
+        'folders': len(results),
+        'rescanned': len(changed),
+        'reused': len(results) - len(changed),
+        'history_verified': verified,
+        'modes': dict(Counter(entry['mode'] for entry in new_cache.values())),
+        'problems_by_type': dict(Counter(problem['problem'] for problem in problems)),
+        'folders_with_problems': len({problem['folder'] for problem in problems}),
+        'elapsed_s': time.perf_counter() - start,
+        'problems': problems,
+    }
+    _write_json(report, os.path.join(base_dir, REPORT_NAME))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Integridad de las carpetas de resultados de analysis_output")
+    parser.add_argument('--base', default=BASE_DIR, help="Carpeta de resultados")
+    parser.add_argument('--full', action='store_true', help="Ignorar la cache y verificar todas las carpetas")
+    parser.add_argument('--no-db', action='store_true', help="No contrastar con 'history'")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="Procesos de verificacion (0 = sin pool)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.base):
+        print(f"[ERROR] No existe la carpeta {args.base}")
+        return
+    db = None
+    if not args.no_db:
+        try:
+            client = pymongo.MongoClient(MONGODB_URI)
+            client.admin.command('ping')
+            db = client[DATABASE_NAME]
+        except PyMongoError as e:
+            print(f"[WARNING] No se pudo conectar a MongoDB ({e}): se verifica sin contrastar con "
+                  f"'{COLLECTION_NAME}' (como --no-db)")
+    report = check_integrity(args.base, db, args.workers, args.full)
+
+    print(f"[INFO] {report['folders']} carpetas ({report['rescanned']} verificadas, "
+          f"{report['reused']} sin cambios) en {report['elapsed_s']:.2f} s")
+    for mode, count in sorted(report['modes'].items()):
+        print(f"  {mode}: {count}")
+    if report['problems_by_type']:
+        print(f"[WARNING] {report['folders_with_problems']} carpetas con problemas:")
+        for problem, count in sorted(report['problems_by_type'].items()):
+            print(f"  {problem}: {count}")
+    else:
+        print("[OK] Sin problemas de integridad")
+    print(f"[INFO] Informe: {os.path.join(args.base, REPORT_NAME)}")
+
 
 if __name__ == "__main__":
-    check_integrity()
+    main()
@@ -1,20 +1,28 @@
 import pymongo
 
+from mrua_health import collect_health
+
 try:
     client = pymongo.MongoClient("mongodb://localhost:27017/")
     db = client["mru"]
     collection = db["history"]
-    count = collection.count_documents({})
-    print(f"Total documents in 'history': {count}")
-    
+
+    # Todos los conteos en una sola agregacion ($facet) en vez de un count_documents por metrica
+    health = collect_health(db)
+    print(f"Total documents in 'history': {health['totals']['count']}")
+
     # Check for simulated data
-    simulated = collection.count_documents({"is_simulated": True})
+    simulated = health['totals']['simulated']
     print(f"Simulated documents: {simulated}")
-    
+
     # Check modes
-    remote = collection.count_documents({"mode": "remote"})
-    presential = collection.count_documents({"mode": "presential"})
+    modes = health['modes']
+    remote = modes.get('remote', {}).get('count', 0)
+    presential = modes.get('presential', {}).get('count', 0)
     print(f"Remote: {remote}, Presential: {presential}")
+    for mode, values in sorted(modes.items()):
+        print(f"  {mode}: {values['failed']} failed")
+    print(f"Newest fecha: {health['newest_fecha']}, Oldest fecha: {health['oldest_fecha']}")
 
     # Inspect the first simulated document if exists
     if simulated > 0:
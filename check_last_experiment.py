@@ -1,5 +1,7 @@
 from pymongo import MongoClient
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+
+from mrua_reconcile import COMPARE_FIELDS, values_differ, build_index, candidates, latest_records, load_history
 
 client = MongoClient('mongodb://localhost:27017/')
 db = client['mru']
@@ -27,33 +29,9 @@ if latest:
     print(f"t23: {latest.get('t23')} s")
     print(f"t34: {latest.get('t34')} s")
     
+    # La interfaz muestra la instantánea de 'latest': se reconcilia con 'history'
     print("\n" + "=" * 60)
-    print("COMPARACION CON INTERFAZ")
-    print("=" * 60)
-    print("Interfaz muestra:")
-    print("  - Tiempo Total: 2.24 s")
-    print("  - Velocidad Promedio: 0.67 m/s")
-    print("  - Aceleracion: 0.55 m/s²")
-    print("\nMongoDB tiene:")
-    print(f"  - Tiempo Total: {latest.get('tiempo')} s")
-    print(f"  - Velocidad Promedio: {latest.get('velocidad')} m/s")
-    print(f"  - Aceleracion: {latest.get('aceleracion')} m/s²")
-    
-    # Verificar si coinciden
-    tiempo_match = abs(latest.get('tiempo', 0) - 2.24) < 0.01
-    velocidad_match = abs(latest.get('velocidad', 0) - 0.67) < 0.01
-    aceleracion_match = abs(latest.get('aceleracion', 0) - 0.55) < 0.01
-    
-    print("\n" + "=" * 60)
-    print("VERIFICACION")
-    print("=" * 60)
-    print(f"Tiempo: {'[OK] COINCIDE' if tiempo_match else '[X] NO COINCIDE'}")
-    print(f"Velocidad: {'[OK] COINCIDE' if velocidad_match else '[X] NO COINCIDE'}")
-    print(f"Aceleracion: {'[OK] COINCIDE' if aceleracion_match else '[X] NO COINCIDE'}")
-    
-    # Verificar datos en coleccion latest
-    print("\n" + "=" * 60)
-    print("DATOS EN COLECCION 'latest'")
+    print("DATOS EN COLECCION 'latest' (lo que muestra la interfaz)")
     print("=" * 60)
     latest_doc = db['latest'].find_one({'_id': 'latest'})
     if latest_doc and 'data' in latest_doc:
@@ -62,37 +40,42 @@ if latest:
         print(f"Velocidad: {data.get('velocidad')} m/s")
         print(f"Aceleracion: {data.get('aceleracion')} m/s²")
         print(f"Status: {latest_doc.get('status')}")
-    
-    # Buscar experimento que coincida con los datos de latest
+
     print("\n" + "=" * 60)
-    print("BUSCANDO EXPERIMENTO QUE COINCIDA CON 'latest'")
+    print("RECONCILIACION DE 'latest' CON 'history'")
     print("=" * 60)
-    matching_exp = db['history'].find_one({
-        'tiempo': {'$gte': 2.2, '$lte': 2.3},
-        'velocidad': {'$gte': 0.66, '$lte': 0.68},
-        'aceleracion': {'$gte': 0.54, '$lte': 0.56}
-    }, sort=[('fecha', -1)])
-    
-    if matching_exp:
-        print("[OK] Se encontro experimento que coincide:")
-        print(f"  ID: {matching_exp.get('id', matching_exp.get('_id'))}")
-        print(f"  Fecha: {matching_exp.get('fecha')}")
-        print(f"  Tiempo: {matching_exp.get('tiempo')} s")
-        print(f"  Velocidad: {matching_exp.get('velocidad')} m/s")
-        print(f"  Aceleracion: {matching_exp.get('aceleracion')} m/s²")
+    records = latest_records(db)
+    if not records:
+        print("[INFO] 'latest' no corresponde a un experimento finalizado: no hay nada que reconciliar")
     else:
-        print("[X] NO se encontro experimento en 'history' que coincida con 'latest'")
-        print("    Esto significa que el experimento actual NO se guardo en 'history'")
-        print("    o se guardo con valores diferentes.")
-        
-        # Mostrar los ultimos 3 experimentos
-        print("\n--- Ultimos 3 experimentos en 'history' ---")
-        recent = list(db['history'].find().sort('fecha', -1).limit(3))
-        for i, exp in enumerate(recent, 1):
-            print(f"\n{i}. ID: {exp.get('id', exp.get('_id'))}")
-            print(f"   Fecha: {exp.get('fecha')}")
-            print(f"   Tiempo: {exp.get('tiempo')} s")
-            print(f"   Velocidad: {exp.get('velocidad')} m/s")
-            print(f"   Aceleracion: {exp.get('aceleracion')} m/s²")
+        record = records[0]
+        day = timedelta(days=1)
+        moment = datetime.fromtimestamp(record['key_ms'] / 1000, timezone.utc)
+        history = load_history(db, moment - day, moment + day)
+        matches = candidates(build_index(history), history, record['key_ms'], record['tiempo'])
+        if matches:
+            saved = history[matches[0]]
+            print(f"[OK] Se encontro el experimento en 'history' (ID: {saved.get('id', saved.get('_id'))})")
+            for field in COMPARE_FIELDS:
+                match = not values_differ(record[field], saved.get(field))
+                print(f"  {field}: {record[field]} / {saved.get(field)} "
+                      f"{'[OK] COINCIDE' if match else '[X] NO COINCIDE'}")
+            if len(matches) > 1:
+                print(f"[WARNING] El experimento esta guardado {len(matches)} veces")
+        else:
+            print("[X] NO se encontro experimento en 'history' que coincida con 'latest'")
+            print("    Esto significa que el experimento actual NO se guardo en 'history'")
+            print("    o se guardo con valores diferentes.")
+
+            # Mostrar los ultimos 3 experimentos
+            print("\n--- Ultimos 3 experimentos en 'history' ---")
+            recent = list(db['history'].find().sort('fecha', -1).limit(3))
+            for i, exp in enumerate(recent, 1):
+                print(f"\n{i}. ID: {exp.get('id', exp.get('_id'))}")
+                print(f"   Fecha: {exp.get('fecha')}")
+                print(f"   Tiempo: {exp.get('tiempo')} s")
+                print(f"   Velocidad: {exp.get('velocidad')} m/s")
+                print(f"   Aceleracion: {exp.get('aceleracion')} m/s²")
+    print("\n[INFO] Para reconciliar semanas de datos: python mrua_reconcile.py --days 28")
 else:
     print("No se encontraron experimentos")
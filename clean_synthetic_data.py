@@ -1,50 +1,228 @@
 """
 Script para ELIMINAR los datos sintéticos/generados de la base de datos.
 Elimina documentos donde 'is_simulated' es True o el ID comienza con 'sim_'.
+
+El borrado se hace por lotes acotados: cada lote se lee con una consulta por índice
+(is_simulated_1 e id_1, ver mongo_indexes.py), se borra por _id y se aplica en cascada
+antes de pasar al siguiente, con una pausa entre lotes para no bloquear 'history'
+durante purgas grandes. La cascada cubre:
+  - raw_experiments: datos crudos de los experimentos borrados (y huérfanos 'sim_')
+  - aggregates / rollups: se descuentan los experimentos borrados (salvo los duplicados
+    ya marcados por dedup_history.py, que se descontaron al marcarlos)
+  - analysis_output/prueba_* y sim_*: solo las carpetas cuyo experimento (según el
+    manifiesto o el CSV de datos crudos) es 'sim_*' o uno de los borrados; las carpetas
+    prueba_* de experimentos reales que escribe analyze_mrua_experiments.py se conservan
+
+Uso:
+    python clean_synthetic_data.py --dry-run        # Solo resumen de lo que se borraría
+    python clean_synthetic_data.py                  # Pide confirmación
+    python clean_synthetic_data.py --force --batch-size 200 --throttle 0.2
 """
 
+import argparse
+import os
+import shutil
+import time
+from typing import Dict, List, Set
+
+import pandas as pd
 import pymongo
 
+from mrua_aggregates import HISTORY_PROJECTION, remove_experiments
+from mrua_manifest import read_manifest
+
 # Configuración
 MONGODB_URI = "mongodb://localhost:27017/"
 DATABASE_NAME = "mru"
 COLLECTION_NAME = "history"
+RAW_DATA_COLLECTION = "raw_experiments"
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "analysis_output")
+EXPERIMENT_FOLDER_PREFIXES = ("prueba_", "sim_")  # Carpetas por experimento (análisis y generate_more_data.py)
+RAW_CSV = os.path.join("csv", "raw_sensors_data.csv")
+SYNTHETIC_ID_PREFIX = "^sim_"
+BATCH_SIZE = 500      # Documentos por lote (cada delete_many toca como mucho este número)
+THROTTLE_S = 0.05     # Pausa entre lotes para dejar pasar las escrituras del bridge
+
+# Una consulta por índice en lugar de un $or con regex: cada una usa su índice
+SYNTHETIC_QUERIES = [
+    {"is_simulated": True},
+    {"id": {"$regex": SYNTHETIC_ID_PREFIX}},
+]
+RAW_ORPHAN_QUERY = {"experiment_id": {"$regex": SYNTHETIC_ID_PREFIX}}
+DELETE_PROJECTION = {**HISTORY_PROJECTION, 'is_duplicate': 1}
+
+
+# ============ SELECCIÓN ============
+def folder_experiment_ids(path: str) -> Set[str]:
+    """experiment_id de una carpeta de resultados: del manifiesto o, si no hay, del CSV de datos crudos."""
+    manifest = read_manifest(path)
+    if manifest and manifest.get('experiment'):
+        return {str(manifest['experiment']['id'])}
+    try:
+        df = pd.read_csv(os.path.join(path, RAW_CSV), usecols=['experiment_id'], dtype=str, encoding='utf-8-sig')
+    except (OSError, ValueError):
+        return set()
+    return set(df['experiment_id'].dropna())
+
+
+def synthetic_folders(synthetic_ids: Set[str], output_dir: str = OUTPUT_DIR) -> List[str]:
+    """
+    Carpetas de salida cuyos experimentos son todos sintéticos ('sim_*' o de synthetic_ids).
+    Las carpetas sin experimento identificable se conservan.
+    """
+    if not os.path.isdir(output_dir):
+        return []
+    folders = []
+    for name in sorted(os.listdir(output_dir)):
+        path = os.path.join(output_dir, name)
+        if not name.startswith(EXPERIMENT_FOLDER_PREFIXES) or not os.path.isdir(path):
+            continue
+        ids = folder_experiment_ids(path)
+        if ids and all(exp_id.startswith('sim_') or exp_id in synthetic_ids for exp_id in ids):
+            folders.append(path)
+    return folders
+
+
+def _folder_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def _raw_ids(docs: List[dict]) -> List[str]:
+    """experiment_id de raw_experiments (save_raw_data_to_mongodb usa str(id), o str(_id) sin id)."""
+    return [str(doc.get('id', doc['_id'])) for doc in docs]
+
+
+def synthetic_experiment_ids(db: pymongo.database.Database, batch_size: int = BATCH_SIZE) -> Dict[object, str]:
+    """_id -> experiment_id de los experimentos sintéticos de 'history' (lecturas por lotes e índice)."""
+    ids = {}
+    for query in SYNTHETIC_QUERIES:
+        for doc in db[COLLECTION_NAME].find(query, {'_id': 1, 'id': 1}).batch_size(batch_size):
+            ids.setdefault(doc['_id'], _raw_ids([doc])[0])
+    return ids
+
+
+def dry_run_summary(db: pymongo.database.Database, ids: Dict[object, str], folders: List[str],
+                    batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Cuenta lo que borraría la limpieza sin modificar nada. Los datos crudos se cuentan
+    con consultas $in acotadas a batch_size y los huérfanos recorriendo por lotes los
+    'sim_*' de raw_experiments, sin enviar nunca la lista completa de ids en una consulta.
+    """
+    raw_ids = list(ids.values())
+    raw_collection = db[RAW_DATA_COLLECTION]
+    raw = sum(raw_collection.count_documents({'experiment_id': {'$in': raw_ids[i:i + batch_size]}})
+              for i in range(0, len(raw_ids), batch_size))
+    known = set(raw_ids)
+    raw_orphans = sum(1 for doc in raw_collection.find(RAW_ORPHAN_QUERY, {'experiment_id': 1}).batch_size(batch_size)
+                      if doc['experiment_id'] not in known)
+    return {
+        'history': len(ids),
+        'raw_experiments': raw + raw_orphans,
+        'folders': len(folders),
+        'folder_bytes': sum(_folder_size(path) for path in folders),
+    }
+
+
+# ============ BORRADO POR LOTES ============
+def delete_in_batches(db: pymongo.database.Database, batch_size: int = BATCH_SIZE,
+                      throttle_s: float = THROTTLE_S, total: int = None) -> Dict[str, int]:
+    """
+    Borra los experimentos sintéticos de 'history' por lotes y aplica la cascada de cada lote.
+
+    Cada lote se lee por índice con un límite, se borra por _id y se descuenta de
+    agregados y series por periodo (salvo los duplicados marcados, ya descontados);
+    sus datos crudos se borran de raw_experiments.
+    Como los documentos ya borrados dejan de coincidir, la siguiente consulta
+    empieza donde terminó la anterior sin mantener un cursor abierto.
+
+    Returns:
+        Documentos borrados de 'history' y de raw_experiments y número de lotes
+    """
+    collection, raw_collection = db[COLLECTION_NAME], db[RAW_DATA_COLLECTION]
+    summary = {'history': 0, 'raw_experiments': 0, 'batches': 0}
+    start = time.perf_counter()
+    for query in SYNTHETIC_QUERIES:
+        while True:
+            docs = list(collection.find(query, DELETE_PROJECTION).limit(batch_size))
+            if not docs:
+                break
+            result = collection.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+            remove_experiments(db, [doc for doc in docs if doc.get('is_duplicate') is not True])
+            raw = raw_collection.delete_many({'experiment_id': {'$in': _raw_ids(docs)}})
+
+            summary['history'] += result.deleted_count
+            summary['raw_experiments'] += raw.deleted_count
+            summary['batches'] += 1
+            elapsed = time.perf_counter() - start
+            progress = f"{summary['history']}/{total}" if total else f"{summary['history']}"
+            print(f"[INFO] Lote {summary['batches']}: {progress} experimentos eliminados "
+                  f"({summary['history'] / max(elapsed, 1e-9):.0f} doc/s)")
+            time.sleep(throttle_s)
+
+    # Datos crudos sintéticos cuyo experimento ya no está en 'history'
+    while True:
+        ids = [doc['_id'] for doc in raw_collection.find(RAW_ORPHAN_QUERY, {'_id': 1}).limit(batch_size)]
+        if not ids:
+            break
+        summary['raw_experiments'] += raw_collection.delete_many({'_id': {'$in': ids}}).deleted_count
+        time.sleep(throttle_s)
+    return summary
+
+
+def delete_folders(folders: List[str]) -> int:
+    removed = 0
+    for path in folders:
+        try:
+            shutil.rmtree(path)
+            removed += 1
+        except OSError as e:
+            print(f"[WARNING] No se pudo eliminar {path}: {e}")
+    return removed
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Eliminar datos sinteticos de MongoDB y de analysis_output")
+    parser.add_argument('--dry-run', action='store_true', help="Solo mostrar lo que se borraria")
+    parser.add_argument('--force', action='store_true', help="No pedir confirmacion")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Documentos por lote")
+    parser.add_argument('--throttle', type=float, default=THROTTLE_S, help="Pausa entre lotes en segundos")
+    parser.add_argument('--keep-folders', action='store_true', help="No borrar las carpetas de experimentos sinteticos")
+    args = parser.parse_args()
+
     try:
         client = pymongo.MongoClient(MONGODB_URI)
         db = client[DATABASE_NAME]
-        collection = db[COLLECTION_NAME]
-        
-        # Filtro para identificar datos simulados
-        query = {
-            "$or": [
-                {"is_simulated": True},
-                {"id": {"$regex": "^sim_"}}
-            ]
-        }
-        
-        # Contar antes de borrar
-        count = collection.count_documents(query)
-        
-        if count == 0:
+
+        # Contar antes de borrar (las carpetas se eligen con los ids de los experimentos a borrar)
+        ids = synthetic_experiment_ids(db, args.batch_size)
+        folders = [] if args.keep_folders else synthetic_folders(set(ids.values()))
+        summary = dry_run_summary(db, ids, folders, args.batch_size)
+        print(f"[INFO] Experimentos simulados en '{COLLECTION_NAME}': {summary['history']}")
+        print(f"[INFO] Documentos en '{RAW_DATA_COLLECTION}': {summary['raw_experiments']}")
+        print(f"[INFO] Carpetas en analysis_output: {len(folders)} ({summary['folder_bytes'] / 1e6:.1f} MB)")
+
+        if not summary['history'] and not summary['raw_experiments'] and not folders:
             print("[INFO] No se encontraron datos sintéticos para borrar.")
             return
+        if args.dry_run:
+            print("[INFO] Dry-run: no se ha borrado nada.")
+            return
 
-        print(f"[INFO] Se encontraron {count} experimentos simulados.")
-        
-        import sys
-        if "--force" in sys.argv:
+        if args.force:
             confirm = 's'
         else:
             confirm = input("¿Estás seguro de que quieres borrarlos permanentemente? (s/n): ")
-        
+
         if confirm.lower() == 's':
-            result = collection.delete_many(query)
-            print(f"[OK] Eliminados {result.deleted_count} documentos.")
+            result = delete_in_batches(db, args.batch_size, args.throttle, total=summary['history'])
+            print(f"[OK] Eliminados {result['history']} documentos en {result['batches']} lotes.")
+            print(f"[OK] Eliminados {result['raw_experiments']} documentos de '{RAW_DATA_COLLECTION}'.")
+            print("[OK] Agregados actualizados.")
+            if folders:
+                print(f"[OK] Eliminadas {delete_folders(folders)} carpetas de analysis_output.")
         else:
             print("[INFO] Operación cancelada.")
-            
+
     except Exception as e:
         print(f"[ERROR] Ocurrió un error: {e}")
 
@@ -0,0 +1,224 @@
+"""
+Deduplicación de 'history' por hash canónico de la medición.
+Tras reinicios del bridge (que solo evita duplicados contra sus últimos 50 registros en
+memoria) el mismo experimento puede guardarse varias veces y sesgar todas las medias.
+Este script calcula en una sola pasada en streaming un hash de 64 bits sobre los campos
+de la medición (t12, t23, t34, tiempo, modo y fecha redondeada), agrupa las colisiones
+en un mapa hash y marca o elimina los duplicados con operaciones en bloque. Cada
+experimento se compara con los de su intervalo de fecha y con los del anterior, para
+no perder los duplicados que caen a ambos lados de un límite (12:00:58 y 12:01:03).
+La memoria queda acotada: con --partitions P se hacen P pasadas y cada una solo
+guarda en el mapa 1/P de los hashes.
+
+Uso:
+    python dedup_history.py                        # Solo informe
+    python dedup_history.py --action flag          # Marcar duplicados (is_duplicate, duplicate_of)
+    python dedup_history.py --action delete        # Eliminar duplicados
+    python dedup_history.py --partitions 8 --fecha-round 120
+"""
+
+import argparse
+import hashlib
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import pymongo
+from pymongo import UpdateOne
+
+from mrua_aggregates import ACTIVE_FILTER, HISTORY_PROJECTION, remove_experiments
+from mrua_kinematics import documents_to_arrays
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+FECHA_ROUND_S = 60        # Duplicados guardados dentro del mismo minuto
+TIMING_DECIMALS = 3       # Resolución de milisegundos
+BATCH_SIZE = 5000
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+# ============ HASH CANÓNICO ============
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """Finalizador splitmix64 vectorizado (buena dispersión de bits)."""
+    x = x.astype(np.uint64)
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _string_code(value) -> int:
+    """Código estable de 64 bits para un texto (p. ej. el modo)."""
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def measurement_hashes(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    """Hash de 64 bits del modo y los tiempos de cada experimento (sin la fecha)."""
+    timings = np.round(arrays['raw'] * 10 ** TIMING_DECIMALS)
+    timings = np.where(np.isnan(timings), -1, timings).astype(np.int64)
+
+    codes = {mode: _string_code(mode) for mode in set(arrays['mode'])}
+    modes = np.array([codes[m] for m in arrays['mode']], dtype=np.uint64)
+
+    h = _mix64(modes)
+    with np.errstate(over='ignore'):
+        for column in timings.T:
+            h = _mix64(h ^ column.astype(np.uint64)) & _MASK64
+    return h
+
+
+def fecha_buckets(arrays: Dict[str, np.ndarray], fecha_round_s: int = FECHA_ROUND_S) -> np.ndarray:
+    """Intervalo de fecha (segundos desde epoch // fecha_round_s) de cada experimento; -1 si no hay fecha."""
+    fechas = pd.to_datetime(pd.Series(arrays['fecha']), errors='coerce', utc=True, format='mixed')
+    seconds = (fechas - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+    return np.where(np.isnan(seconds), -1, np.floor(seconds / fecha_round_s)).astype(np.int64)
+
+
+def _with_bucket(measurement: np.ndarray, buckets: np.ndarray) -> np.ndarray:
+    with np.errstate(over='ignore'):
+        return _mix64(measurement ^ buckets.astype(np.uint64)) & _MASK64
+
+
+def canonical_hashes(arrays: Dict[str, np.ndarray], fecha_round_s: int = FECHA_ROUND_S,
+                     bucket_shift: int = 0) -> np.ndarray:
+    """
+    Calcula el hash canónico de cada experimento de un lote.
+
+    Args:
+        arrays: Resultado de documents_to_arrays
+        fecha_round_s: Tamaño del intervalo (s) al que se redondea la fecha
+        bucket_shift: Desplazamiento del intervalo (-1 = clave del intervalo anterior)
+
+    Returns:
+        Array uint64 con un hash por experimento
+    """
+    buckets = fecha_buckets(arrays, fecha_round_s)
+    if bucket_shift:
+        buckets = np.where(buckets < 0, buckets, buckets + bucket_shift)
+    return _with_bucket(measurement_hashes(arrays), buckets)
+
+
+# ============ PASADA DE DEDUPLICACIÓN ============
+def _flush(db: pymongo.database.Database, action: str, duplicates: List[Dict]):
+    """Aplica en bloque la acción sobre un lote de duplicados."""
+    if not duplicates or action == 'report':
+        return
+    collection = db[COLLECTION_NAME]
+    if action == 'flag':
+        collection.bulk_write([
+            UpdateOne({'_id': d['_id']}, {'$set': {'is_duplicate': True, 'duplicate_of': d['duplicate_of']}})
+            for d in duplicates
+        ], ordered=False)
+    else:
+        collection.delete_many({'_id': {'$in': [d['_id'] for d in duplicates]}})
+    # En ambos casos el duplicado deja de contar en los agregados materializados
+    remove_experiments(db, duplicates)
+
+
+def deduplicate(db: pymongo.database.Database, action: str = 'report', partitions: int = 1,
+                fecha_round_s: int = FECHA_ROUND_S, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Recorre 'history' (más antiguos primero) y trata como duplicado todo documento
+    cuyo hash ya se vio; el original es siempre el de fecha más antigua.
+
+    Args:
+        db: Objeto Database de MongoDB
+        action: 'report', 'flag' o 'delete'
+        partitions: Número de pasadas (memoria del mapa ~ 1/partitions)
+        fecha_round_s: Redondeo de la fecha en segundos
+        batch_size: Documentos por lote de lectura y de escritura
+
+    Returns:
+        Resumen con documentos leídos, grupos con duplicados y duplicados tratados
+    """
+    collection = db[COLLECTION_NAME]
+    summary = {'scanned': 0, 'groups': 0, 'duplicates': 0}
+    projection = {**HISTORY_PROJECTION, 'timestamp': 1}
+
+    for partition in range(partitions):
+        seen: Dict[int, object] = {}
+        grouped = set()
+        pending: List[Dict] = []
+        cursor = collection.find(ACTIVE_FILTER, projection, batch_size=batch_size).sort('fecha', 1)
+
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) < batch_size:
+                continue
+            pending.extend(_scan_batch(batch, seen, grouped, partition, partitions, fecha_round_s))
+            batch = []
+            if len(pending) >= batch_size:
+                _flush(db, action, pending)
+                summary['duplicates'] += len(pending)
+                pending = []
+            if partition == 0:
+                summary['scanned'] += batch_size
+        if batch:
+            pending.extend(_scan_batch(batch, seen, grouped, partition, partitions, fecha_round_s))
+            if partition == 0:
+                summary['scanned'] += len(batch)
+        _flush(db, action, pending)
+        summary['duplicates'] += len(pending)
+        summary['groups'] += len(grouped)
+        if partitions > 1:
+            print(f"[INFO] Particion {partition + 1}/{partitions}: {len(seen)} hashes distintos")
+    return summary
+
+
+def _scan_batch(batch: List[Dict], seen: Dict[int, object], grouped: set, partition: int,
+                partitions: int, fecha_round_s: int) -> List[Dict]:
+    """
+    Procesa un lote y devuelve los duplicados encontrados en la partición actual.
+    Un experimento es duplicado si su clave coincide con la de un original de su mismo
+    intervalo de fecha o del anterior; solo los originales se guardan en el mapa.
+    La partición depende solo de la medición, así que ambas claves caen en la misma pasada.
+    """
+    arrays = documents_to_arrays(batch)
+    measurement = measurement_hashes(arrays)
+    buckets = fecha_buckets(arrays, fecha_round_s)
+    current = _with_bucket(measurement, buckets)
+    previous = _with_bucket(measurement, np.where(buckets < 0, buckets, buckets - 1))
+    in_partition = (measurement % np.uint64(partitions)) == partition
+    duplicates = []
+    for i in np.flatnonzero(in_partition):
+        key = int(current[i])
+        if key not in seen and int(previous[i]) in seen:
+            key = int(previous[i])
+        original = seen.get(key)
+        if original is None:
+            seen[key] = arrays['_id'][i]
+        else:
+            grouped.add(key)
+            duplicates.append({**batch[i], 'duplicate_of': original})
+    return duplicates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicacion de la coleccion history")
+    parser.add_argument('--action', choices=['report', 'flag', 'delete'], default='report')
+    parser.add_argument('--partitions', type=int, default=1, help="Pasadas para acotar la memoria")
+    parser.add_argument('--fecha-round', type=int, default=FECHA_ROUND_S, help="Redondeo de fecha (s)")
+    args = parser.parse_args()
+
+    try:
+        client = pymongo.MongoClient(MONGODB_URI)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+
+    summary = deduplicate(db, args.action, args.partitions, args.fecha_round)
+    print(f"[OK] Documentos analizados: {summary['scanned']}")
+    print(f"[OK] Grupos con duplicados: {summary['groups']}")
+    verb = {'report': 'encontrados', 'flag': 'marcados', 'delete': 'eliminados'}[args.action]
+    print(f"[OK] Duplicados {verb}: {summary['duplicates']}")
+
+
+if __name__ == "__main__":
+    main()
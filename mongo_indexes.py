@@ -0,0 +1,157 @@
+"""
+Gestión de índices de MongoDB para el pipeline de análisis MRUA.
+Crea de forma idempotente los índices que usan las consultas del pipeline
+(orden por 'fecha', filtros por 'mode'/'is_simulated', búsqueda por 'id' y upsert
+por 'experiment_id') y verifica con explain() que ninguna consulta caiga en COLLSCAN.
+
+Uso:
+    python mongo_indexes.py           # Crear índices y verificar planes de consulta
+    python mongo_indexes.py --check   # Solo verificar planes de consulta
+"""
+
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import pymongo
+from pymongo.errors import OperationFailure
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+RAW_DATA_COLLECTION = "raw_experiments"
+ROLLUPS_COLLECTION = "rollups"
+
+# Índices declarados por colección: (claves, opciones)
+INDEXES = {
+    COLLECTION_NAME: [
+        ([('fecha', pymongo.DESCENDING)], {'name': 'fecha_-1'}),
+        ([('mode', pymongo.ASCENDING), ('fecha', pymongo.DESCENDING)], {'name': 'mode_1_fecha_-1'}),
+        ([('id', pymongo.ASCENDING)], {'name': 'id_1'}),
+        ([('is_simulated', pymongo.ASCENDING)], {'name': 'is_simulated_1'}),
+        # Solo los documentos corregidos tienen updated_at (mrua_aggregates.correct_experiment)
+        ([('updated_at', pymongo.DESCENDING)], {'name': 'updated_at_-1', 'sparse': True}),
+    ],
+    RAW_DATA_COLLECTION: [
+        ([('experiment_id', pymongo.ASCENDING)], {'name': 'experiment_id_1', 'unique': True}),
+    ],
+    ROLLUPS_COLLECTION: [
+        ([('period', pymongo.ASCENDING), ('mode', pymongo.ASCENDING), ('start', pymongo.ASCENDING)],
+         {'name': 'period_1_mode_1_start_1'}),
+    ],
+}
+
+# Consultas representativas del pipeline: (descripción, colección, filtro, orden)
+PIPELINE_QUERIES = [
+    ("history ordenado por fecha (extract_experiments)", COLLECTION_NAME, {}, [('fecha', -1)]),
+    ("history por modo ordenado por fecha", COLLECTION_NAME, {'mode': 'remote'}, [('fecha', -1)]),
+    ("history simulados (check_db)", COLLECTION_NAME, {'is_simulated': True}, None),
+    ("history por prefijo de id (clean_synthetic_data)", COLLECTION_NAME, {'id': {'$regex': '^sim_'}}, None),
+    ("raw_experiments sinteticos por prefijo (clean_synthetic_data)", RAW_DATA_COLLECTION,
+     {'experiment_id': {'$regex': '^sim_'}}, None),
+    ("raw_experiments por experiment_id (save_raw_data_to_mongodb)", RAW_DATA_COLLECTION,
+     {'experiment_id': ''}, None),
+    ("rollups por periodo y ventana (mrua_rollups)", ROLLUPS_COLLECTION,
+     {'period': 'week', 'mode': 'remote', 'start': {'$gte': datetime(2025, 1, 1)}}, [('start', 1)]),
+]
+
+
+# ============ CREACIÓN DE ÍNDICES ============
+def ensure_indexes(db: pymongo.database.Database) -> Dict[str, List[str]]:
+    """
+    Crea los índices declarados en INDEXES si no existen.
+    create_index no hace nada si el índice ya existe con la misma especificación,
+    por lo que la función puede ejecutarse en cada corrida del pipeline.
+
+    Args:
+        db: Objeto Database de MongoDB
+
+    Returns:
+        Diccionario colección -> nombres de índices disponibles
+    """
+    created = {}
+    for collection, indexes in INDEXES.items():
+        created[collection] = []
+        for keys, options in indexes:
+            try:
+                created[collection].append(db[collection].create_index(keys, **options))
+            except OperationFailure as e:
+                if e.code == 11000:
+                    print(f"[WARNING] No se pudo crear el indice unico '{options['name']}' en '{collection}': "
+                          f"existen valores duplicados. Deduplique la coleccion y vuelva a ejecutar.")
+                else:
+                    print(f"[WARNING] Conflicto con el indice '{options['name']}' en '{collection}': {e}")
+    return created
+
+
+# ============ VERIFICACIÓN DE PLANES ============
+def _plan_stages(plan) -> List[str]:
+    """Recorre recursivamente un plan de explain() y devuelve todas sus etapas."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+def check_query_plans(db: pymongo.database.Database) -> List[Tuple[str, List[str]]]:
+    """
+    Ejecuta explain() sobre las consultas del pipeline y avisa de las que usan COLLSCAN.
+
+    Args:
+        db: Objeto Database de MongoDB
+
+    Returns:
+        Lista de (descripción, etapas del plan ganador) de las consultas con COLLSCAN
+    """
+    collscans = []
+    for description, collection, query, sort in PIPELINE_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explain = cursor.explain()
+        except OperationFailure as e:
+            print(f"[WARNING] explain() fallo para '{description}': {e}")
+            continue
+
+        winning = explain.get('queryPlanner', {}).get('winningPlan', {})
+        stages = _plan_stages(winning)
+        if 'COLLSCAN' in stages:
+            collscans.append((description, stages))
+            print(f"[WARNING] COLLSCAN en consulta: {description} (plan: {' <- '.join(stages)})")
+        else:
+            print(f"[OK] {description}: {' <- '.join(stages) or 'sin plan'}")
+    return collscans
+
+
+def main():
+    try:
+        client = pymongo.MongoClient(MONGODB_URI)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+
+    if "--check" not in sys.argv:
+        created = ensure_indexes(db)
+        for collection, names in created.items():
+            print(f"[OK] Indices en '{collection}': {', '.join(names)}")
+
+    collscans = check_query_plans(db)
+    if collscans:
+        print(f"[WARNING] {len(collscans)} consultas del pipeline hacen COLLSCAN")
+    else:
+        print("[OK] Todas las consultas del pipeline usan indices")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Cliente y broker MQTT 3.1.1 mínimos sobre asyncio (sin dependencias externas).
+Cubre lo que usan el bridge y el ESP32: CONNECT con usuario/contraseña, SUBSCRIBE
+con comodines (+ y #), PUBLISH QoS 0/1 y keepalive. LocalBroker es un sustituto
+local del broker EMQX/Mosquitto para pruebas y para reproducir sesiones grabadas.
+"""
+
+import asyncio
+import itertools
+import struct
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+
+# ============ TIPOS DE PAQUETE ============
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+# ============ CODIFICACIÓN ============
+def _encode_length(length: int) -> bytes:
+    """Codifica la longitud restante (entero de longitud variable)."""
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _encode_str(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return struct.pack('!H', len(data)) + data
+
+
+def _decode_str(data: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from('!H', data, offset)
+    start = offset + 2
+    return data[start:start + length].decode('utf-8'), start + length
+
+
+def _packet(packet_type: int, flags: int, body: bytes = b'') -> bytes:
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+
+def encode_publish(topic: str, payload: bytes, qos: int = 0, packet_id: int = 0) -> bytes:
+    """Construye un paquete PUBLISH."""
+    body = _encode_str(topic)
+    if qos:
+        body += struct.pack('!H', packet_id)
+    return _packet(PUBLISH, qos << 1, body + payload)
+
+
+def decode_publish(flags: int, body: bytes) -> Tuple[str, bytes, int, int]:
+    """Decodifica un PUBLISH y devuelve (topic, payload, qos, packet_id)."""
+    qos = (flags >> 1) & 0x03
+    topic, offset = _decode_str(body, 0)
+    packet_id = 0
+    if qos:
+        (packet_id,) = struct.unpack_from('!H', body, offset)
+        offset += 2
+    return topic, body[offset:], qos, packet_id
+
+
+async def read_packet(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    """Lee un paquete completo y devuelve (tipo, flags, cuerpo)."""
+    header = await reader.readexactly(1)
+    multiplier, length = 1, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            break
+        multiplier *= 128
+    body = await reader.readexactly(length) if length else b''
+    return header[0] >> 4, header[0] & 0x0F, body
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Comprueba si un topic coincide con un filtro de suscripción (+ y #)."""
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for i, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if i >= len(topic_parts) or (part != '+' and part != topic_parts[i]):
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def parse_broker_url(url: str) -> Tuple[str, int]:
+    """Obtiene (host, puerto) de una URL tipo mqtt://host:1883."""
+    parsed = urlparse(url if '://' in url else f'mqtt://{url}')
+    return parsed.hostname or 'localhost', parsed.port or 1883
+
+
+# ============ CLIENTE ============
+class MQTTClient:
+    """
+    Cliente MQTT 3.1.1 asíncrono.
+
+    Uso:
+        client = MQTTClient('localhost', 1883, username='admin', password='admin')
+        await client.connect()
+        await client.subscribe(['mru/data', 'mru/status'])
+        async for topic, payload in client.messages():
+            ...
+    """
+
+    def __init__(self, host: str, port: int = 1883, client_id: str = '', username: Optional[str] = None,
+                 password: Optional[str] = None, keepalive: int = 60):
+        self.host = host
+        self.port = port
+        self.client_id = client_id or f'mru-py-{id(self) & 0xFFFFFFFF:08x}'
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._packet_ids = itertools.cycle(range(1, 65536))
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    async def connect(self):
+        """Abre la conexión TCP y completa el handshake CONNECT/CONNACK."""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        flags = 0x02  # clean session
+        payload = _encode_str(self.client_id)
+        if self.username:
+            flags |= 0x80
+            payload += _encode_str(self.username)
+        if self.password:
+            flags |= 0x40
+            payload += _encode_str(self.password)
+        body = _encode_str('MQTT') + bytes([4, flags]) + struct.pack('!H', self.keepalive) + payload
+        self._writer.write(_packet(CONNECT, 0, body))
+        await self._writer.drain()
+
+        packet_type, _, body = await read_packet(self._reader)
+        if packet_type != CONNACK or body[1] != 0:
+            raise ConnectionError(f"CONNACK rechazado (codigo {body[1] if len(body) > 1 else '?'})")
+        self._tasks.append(asyncio.create_task(self._read_loop()))
+        if self.keepalive:
+            self._tasks.append(asyncio.create_task(self._ping_loop()))
+
+    async def subscribe(self, topics: List[str], qos: int = 0):
+        """Se suscribe a una lista de filtros de topic y espera el SUBACK."""
+        packet_id = next(self._packet_ids)
+        body = struct.pack('!H', packet_id) + b''.join(_encode_str(t) + bytes([qos]) for t in topics)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[packet_id] = future
+        self._writer.write(_packet(SUBSCRIBE, 0x02, body))
+        await self._writer.drain()
+        await future
+
+    async def publish(self, topic: str, payload: bytes, qos: int = 0):
+        """Publica un mensaje (QoS 0 o 1; con QoS 1 espera el PUBACK)."""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        packet_id = next(self._packet_ids) if qos else 0
+        future = None
+        if qos:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[packet_id] = future
+        self._writer.write(encode_publish(topic, payload, qos, packet_id))
+        await self._writer.drain()
+        if future:
+            await future
+
+    async def messages(self) -> AsyncIterator[Tuple[str, bytes]]:
+        """Itera sobre los mensajes recibidos como (topic, payload) hasta la desconexión."""
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            yield item
+
+    async def disconnect(self):
+        """Envía DISCONNECT y cierra la conexión."""
+        for task in self._tasks:
+            task.cancel()
+        if self._writer and not self._writer.is_closing():
+            try:
+                self._writer.write(_packet(DISCONNECT, 0))
+                await self._writer.drain()
+            except ConnectionError:
+                pass
+            self._writer.close()
+        self._queue.put_nowait(None)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                packet_type, flags, body = await read_packet(self._reader)
+                if packet_type == PUBLISH:
+                    topic, payload, qos, packet_id = decode_publish(flags, body)
+                    if qos == 1:
+                        self._writer.write(_packet(PUBACK, 0, struct.pack('!H', packet_id)))
+                    self._queue.put_nowait((topic, payload))
+                elif packet_type in (SUBACK, PUBACK):
+                    (packet_id,) = struct.unpack_from('!H', body)
+                    future = self._pending.pop(packet_id, None)
+                    if future and not future.done():
+                        future.set_result(body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self._queue.put_nowait(None)
+
+    async def _ping_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive / 2)
+            self._writer.write(_packet(PINGREQ, 0))
+            await self._writer.drain()
+
+
+# ============ BROKER LOCAL ============
+class LocalBroker:
+    """
+    Broker MQTT mínimo en memoria (QoS 0 hacia los suscriptores, sin retención
+    ni autenticación). Sustituye al broker real en pruebas locales y en replays.
+
+    Uso:
+        broker = LocalBroker()
+        port = await broker.start()   # puerto 0 = puerto libre asignado por el SO
+        ...
+        await broker.stop()
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._subscriptions: Dict[asyncio.StreamWriter, Set[str]] = {}
+        self.published = 0
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        for writer in list(self._subscriptions):
+            writer.close()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _route(self, topic: str, payload: bytes):
+        packet = encode_publish(topic, payload)
+        self.published += 1
+        for writer, filters in self._subscriptions.items():
+            if not writer.is_closing() and any(topic_matches(f, topic) for f in filters):
+                writer.write(packet)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._subscriptions[writer] = set()
+        try:
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+                if packet_type == CONNECT:
+                    writer.write(_packet(CONNACK, 0, b'\x00\x00'))
+                elif packet_type == SUBSCRIBE:
+                    (packet_id,) = struct.unpack_from('!H', body)
+                    offset, granted = 2, []
+                    while offset < len(body):
+                        topic_filter, offset = _decode_str(body, offset)
+                        granted.append(0)
+                        offset += 1
+                        self._subscriptions[writer].add(topic_filter)
+                    writer.write(_packet(SUBACK, 0, struct.pack('!H', packet_id) + bytes(granted)))
+                elif packet_type == PUBLISH:
+                    topic, payload, qos, packet_id = decode_publish(flags, body)
+                    if qos == 1:
+                        writer.write(_packet(PUBACK, 0, struct.pack('!H', packet_id)))
+                    self._route(topic, payload)
+                elif packet_type == PINGREQ:
+                    writer.write(_packet(PINGRESP, 0))
+                elif packet_type == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._subscriptions.pop(writer, None)
+            writer.close()
@@ -0,0 +1,341 @@
+"""
+Grabación y reproducción acelerada de sesiones MQTT del experimento MRUA.
+Graba los mensajes de mru/data y mru/status con su marca de tiempo en un archivo
+compacto (.mrec, registros binarios comprimidos con gzip) y los reproduce a N× la
+velocidad original o a una tasa objetivo de mensajes hacia:
+  - ingest:  IngestService en el mismo proceso (ruta de análisis en Python)
+  - broker:  un broker MQTT (LocalBroker por defecto) con IngestService suscrito
+  - history: una colección con el formato de 'history' en MongoDB
+El informe incluye throughput y percentiles de latencia extremo a extremo.
+
+Uso:
+    python mqtt_replay.py record sesion.mrec --duration 3600
+    python mqtt_replay.py synth sesion.mrec --experiments 500 --gap 20
+    python mqtt_replay.py replay sesion.mrec --speed 50 --target ingest
+    python mqtt_replay.py replay sesion.mrec --rate 2000 --copies 20 --target broker
+    python mqtt_replay.py replay sesion.mrec --speed 10 --target history --collection history_replay
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import struct
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from mqtt_lite import LocalBroker, MQTTClient, parse_broker_url
+from mrua_ingest_service import (
+    DATABASE_NAME, FINISHED_STATUS, MONGODB_URI, MQTT_BROKER_URL, MQTT_PASSWORD, MQTT_TOPIC_ANALYSIS,
+    MQTT_TOPIC_DATA, MQTT_TOPIC_STATUS, MQTT_USERNAME, IngestService, build_measurement,
+)
+
+
+# ============ CONFIGURACIÓN ============
+FILE_MAGIC = b'MRUREC1\n'
+HEADER = struct.Struct('<d')        # instante absoluto de inicio (epoch s)
+RECORD = struct.Struct('<dHI')      # desfase (s), longitud del topic, longitud del payload
+REPLAY_COLLECTION = "history_replay"  # Nunca reproducir sobre 'history' por defecto
+
+
+# ============ FORMATO DE ARCHIVO ============
+class SessionWriter:
+    """Escribe registros (desfase, topic, payload) en un archivo .mrec."""
+
+    def __init__(self, path: str, start: Optional[float] = None):
+        self.start = time.time() if start is None else start
+        self._file = gzip.open(path, 'wb')
+        self._file.write(FILE_MAGIC + HEADER.pack(self.start))
+        self.count = 0
+
+    def write(self, topic: str, payload: bytes, offset: Optional[float] = None):
+        if offset is None:
+            offset = time.time() - self.start
+        topic_bytes = topic.encode('utf-8')
+        self._file.write(RECORD.pack(offset, len(topic_bytes), len(payload)) + topic_bytes + payload)
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_session(path: str) -> Tuple[float, List[Tuple[float, str, bytes]]]:
+    """
+    Lee una sesión grabada.
+
+    Returns:
+        (instante de inicio, lista de (desfase s, topic, payload))
+    """
+    with gzip.open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(FILE_MAGIC):
+        raise ValueError(f"{path} no es una sesion MQTT grabada")
+    offset = len(FILE_MAGIC)
+    (start,) = HEADER.unpack_from(data, offset)
+    offset += HEADER.size
+
+    records = []
+    while offset < len(data):
+        t, topic_len, payload_len = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        topic = data[offset:offset + topic_len].decode('utf-8')
+        offset += topic_len
+        records.append((t, topic, data[offset:offset + payload_len]))
+        offset += payload_len
+    return start, records
+
+
+# ============ GRABACIÓN ============
+async def record_session(path: str, broker_url: str, duration: Optional[float]):
+    host, port = parse_broker_url(broker_url)
+    client = MQTTClient(host, port, username=MQTT_USERNAME, password=MQTT_PASSWORD)
+    await client.connect()
+    await client.subscribe([MQTT_TOPIC_DATA, MQTT_TOPIC_STATUS])
+    writer = SessionWriter(path)
+    print(f"[OK] Grabando {MQTT_TOPIC_DATA} y {MQTT_TOPIC_STATUS} de {broker_url} en {path}")
+
+    async def consume():
+        async for topic, payload in client.messages():
+            writer.write(topic, payload)
+
+    try:
+        await asyncio.wait_for(consume(), timeout=duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        writer.close()
+        await client.disconnect()
+        print(f"[OK] {writer.count} mensajes grabados")
+
+
+def synthesize_session(path: str, experiments: int, gap: float):
+    """
+    Genera una sesión sintética (un experimento MRUA cada 'gap' segundos) para
+    dimensionar el pipeline cuando aún no hay grabaciones reales.
+    """
+    writer = SessionWriter(path)
+    t = 0.0
+    for _ in range(experiments):
+        a = random.uniform(0.5, 1.5)
+        times = [round(float(np.sqrt(2 * x / a)) + random.gauss(0, 0.005), 4) for x in (0.5, 1.0, 1.5)]
+        data = {'tiempo': times[2], 'distancia': 1.5, 't12': times[0], 't23': times[1], 't34': times[2],
+                'velocidad': round(1.5 / times[2], 4), 'aceleracion': round(a, 4),
+                'mode': random.choice(['remote', 'presential'])}
+        writer.write(MQTT_TOPIC_STATUS, json.dumps({'status': 'Ejecutando'}).encode(), t)
+        writer.write(MQTT_TOPIC_DATA, json.dumps(data).encode(), t + times[2])
+        writer.write(MQTT_TOPIC_STATUS, json.dumps({'status': FINISHED_STATUS}).encode(), t + times[2] + 0.05)
+        t += gap
+    writer.close()
+    print(f"[OK] Sesion sintetica con {experiments} experimentos ({writer.count} mensajes): {path}")
+
+
+# ============ REPRODUCCIÓN ============
+def schedule(records: List[Tuple[float, str, bytes]], speed: float, rate: Optional[float],
+             copies: int) -> Iterator[Tuple[float, str, bytes]]:
+    """
+    Calcula el instante relativo de envío de cada mensaje. Con --copies, cada
+    experimento (mensajes entre dos 'Finalizado') se repite K veces seguidas para
+    simular varios montajes terminando a la vez.
+    """
+    burst, index = [], 0
+    for t, topic, payload in records:
+        burst.append((t, topic, payload))
+        if topic != MQTT_TOPIC_STATUS or json.loads(payload).get('status') != FINISHED_STATUS:
+            continue
+        for _ in range(copies):
+            for bt, btopic, bpayload in burst:
+                yield (index / rate if rate else bt / speed), btopic, bpayload
+                index += 1
+        burst = []
+    for bt, btopic, bpayload in burst:
+        yield (index / rate if rate else bt / speed), btopic, bpayload
+        index += 1
+
+
+def _is_finish(topic: str, payload: bytes) -> bool:
+    return topic == MQTT_TOPIC_STATUS and FINISHED_STATUS.encode() in payload
+
+
+def _publishes(plan: List[Tuple[float, str, bytes]]) -> List[bool]:
+    """
+    Marca los mensajes tras los que IngestService publica un resultado. No todos los
+    'Finalizado' lo hacen: el ESP también lo envía con tiempo=0 tras un fallo de sensores.
+    """
+    service = IngestService(dedup_window_ms=0, verbose=False)
+    return [service.handle_message(topic, payload) is not None for _, topic, payload in plan]
+
+
+async def _pace(start: float, due: float):
+    delay = start + due - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def replay_ingest(plan: List[Tuple[float, str, bytes]]) -> Tuple[List[float], int]:
+    """Reproduce directamente sobre IngestService.handle_message."""
+    service = IngestService(dedup_window_ms=0, verbose=False)
+    latencies = []
+    start = time.perf_counter()
+    for due, topic, payload in plan:
+        await _pace(start, due)
+        if service.handle_message(topic, payload) is not None:
+            latencies.append(time.perf_counter() - start - due)
+    return latencies, len(plan)
+
+
+async def replay_broker(plan: List[Tuple[float, str, bytes]], broker_url: Optional[str]) -> Tuple[List[float], int]:
+    """Reproduce a través de un broker MQTT con IngestService suscrito (ruta completa)."""
+    broker = None
+    if broker_url:
+        host, port = parse_broker_url(broker_url)
+        credentials = {'username': MQTT_USERNAME, 'password': MQTT_PASSWORD}
+    else:
+        broker = LocalBroker()
+        host, port = '127.0.0.1', await broker.start()
+        credentials = {}
+
+    service = IngestService(dedup_window_ms=0, verbose=False)
+    service_client = MQTTClient(host, port, client_id='mru-replay-ingest', **credentials)
+    publisher = MQTTClient(host, port, client_id='mru-replay-publisher', **credentials)
+    listener = MQTTClient(host, port, client_id='mru-replay-listener', **credentials)
+    for client in (service_client, publisher, listener):
+        await client.connect()
+    await listener.subscribe([MQTT_TOPIC_ANALYSIS])
+    service_task = asyncio.create_task(service.run(service_client))
+    await asyncio.sleep(0.05)
+
+    # Los resultados llegan en el mismo orden en que se envían los 'Finalizado' que los producen
+    publishes = _publishes(plan)
+    expected = sum(publishes)
+    sent_at: List[float] = []
+    latencies: List[float] = []
+
+    async def collect():
+        async for _ in listener.messages():
+            latencies.append(time.perf_counter() - sent_at[len(latencies)])
+            if len(latencies) >= expected:
+                return
+
+    collector = asyncio.create_task(collect())
+    start = time.perf_counter()
+    for (due, topic, payload), publishes_result in zip(plan, publishes):
+        await _pace(start, due)
+        if publishes_result:
+            sent_at.append(start + due)
+        await publisher.publish(topic, payload)
+    try:
+        if expected:
+            await asyncio.wait_for(collector, timeout=30)
+    except asyncio.TimeoutError:
+        print(f"[WARNING] Solo llegaron {len(latencies)} de {expected} resultados")
+    collector.cancel()
+
+    service_task.cancel()
+    for client in (service_client, publisher, listener):
+        await client.disconnect()
+    if broker:
+        await broker.stop()
+    return latencies, len(plan)
+
+
+async def replay_history(plan: List[Tuple[float, str, bytes]], collection_name: str) -> Tuple[List[float], int]:
+    """Reproduce guardando cada experimento finalizado en una colección tipo 'history'."""
+    import pymongo
+    collection = pymongo.MongoClient(MONGODB_URI)[DATABASE_NAME][collection_name]
+    loop = asyncio.get_running_loop()
+    latest: Dict = {}
+    latencies = []
+    sequence = 0
+    start = time.perf_counter()
+    for due, topic, payload in plan:
+        await _pace(start, due)
+        msg = json.loads(payload)
+        if topic == MQTT_TOPIC_DATA:
+            latest = {**msg, 'timestamp': int(time.time() * 1000)}
+        elif _is_finish(topic, payload) and (latest.get('tiempo') or 0) > 0:
+            measurement = build_measurement(latest)
+            sequence += 1
+            measurement['_id'] = f"replay_{measurement['id']}_{sequence}"
+            measurement['is_replay'] = True
+            await loop.run_in_executor(None, collection.insert_one, measurement)
+            latencies.append(time.perf_counter() - start - due)
+    return latencies, len(plan)
+
+
+def print_report(latencies: List[float], messages: int, elapsed: float, target: str) -> Dict:
+    """Imprime y devuelve el informe de throughput y latencia."""
+    lat_ms = np.array(latencies) * 1000
+    report = {
+        'target': target,
+        'messages': messages,
+        'experiments': len(latencies),
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(messages / elapsed, 1) if elapsed > 0 else None,
+        'experiments_per_s': round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+    }
+    if len(lat_ms):
+        for p in (50, 90, 95, 99):
+            report[f'latency_p{p}_ms'] = round(float(np.percentile(lat_ms, p)), 3)
+        report['latency_max_ms'] = round(float(lat_ms.max()), 3)
+
+    print("\n--- Informe de replay ---")
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grabacion y replay acelerado de sesiones MQTT MRUA")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    rec = sub.add_parser('record', help="Grabar mensajes de un broker")
+    rec.add_argument('path')
+    rec.add_argument('--broker', default=MQTT_BROKER_URL)
+    rec.add_argument('--duration', type=float, help="Segundos a grabar (por defecto hasta Ctrl+C)")
+
+    syn = sub.add_parser('synth', help="Generar una sesion sintetica")
+    syn.add_argument('path')
+    syn.add_argument('--experiments', type=int, default=100)
+    syn.add_argument('--gap', type=float, default=30.0, help="Segundos entre experimentos")
+
+    rep = sub.add_parser('replay', help="Reproducir una sesion grabada")
+    rep.add_argument('path')
+    rep.add_argument('--speed', type=float, default=1.0, help="Factor de aceleracion (N x)")
+    rep.add_argument('--rate', type=float, help="Tasa objetivo en mensajes/s (ignora --speed)")
+    rep.add_argument('--copies', type=int, default=1, help="Montajes simultaneos simulados por experimento")
+    rep.add_argument('--target', choices=['ingest', 'broker', 'history'], default='ingest')
+    rep.add_argument('--broker', help="Broker real para --target broker (por defecto LocalBroker)")
+    rep.add_argument('--collection', default=REPLAY_COLLECTION, help="Coleccion para --target history")
+    rep.add_argument('--report', help="Guardar el informe en JSON")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'record':
+            asyncio.run(record_session(args.path, args.broker, args.duration))
+        elif args.command == 'synth':
+            synthesize_session(args.path, args.experiments, args.gap)
+        else:
+            _, records = read_session(args.path)
+            plan = list(schedule(records, args.speed, args.rate, args.copies))
+            print(f"[INFO] Reproduciendo {len(plan)} mensajes hacia '{args.target}'...")
+            started = time.perf_counter()
+            if args.target == 'ingest':
+                latencies, messages = asyncio.run(replay_ingest(plan))
+            elif args.target == 'broker':
+                latencies, messages = asyncio.run(replay_broker(plan, args.broker))
+            else:
+                latencies, messages = asyncio.run(replay_history(plan, args.collection))
+            report = print_report(latencies, messages, time.perf_counter() - started, args.target)
+            if args.report:
+                with open(args.report, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2)
+                print(f"[OK] Informe guardado: {args.report}")
+    except KeyboardInterrupt:
+        print("\n[INFO] Interrumpido")
+
+
+if __name__ == "__main__":
+    main()
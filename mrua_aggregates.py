@@ -0,0 +1,414 @@
+"""
+Agregados materializados por modalidad (colección 'aggregates').
+Mantiene por modo y sensor las sumas necesarias para media, desviación estándar y
+conteo de tiempos, además de la aceleración media y la tasa de fallos. Cada alta,
+baja o corrección de un experimento se aplica como un $inc, de modo que leer las
+estadísticas resumen es O(1) sin recorrer 'history'.
+Los experimentos que el bridge guarda en 'history' se incorporan de forma incremental:
+una marca de agua por destino (colección 'sync_state': fecha más reciente incorporada
+y los _id con esa fecha) permite plegar solo los documentos nuevos al leer, verificar
+o desde mrua_ingest_service.py, aunque el servicio no estuviera en marcha cuando llegaron.
+
+Uso:
+    python mrua_aggregates.py show                    # Incorporar lo nuevo y mostrar agregados
+    python mrua_aggregates.py sync                    # Solo incorporar los experimentos nuevos
+    python mrua_aggregates.py rebuild                 # Reconstrucción completa desde 'history'
+    python mrua_aggregates.py check                   # Verificar consistencia contra 'history'
+    python mrua_aggregates.py correct <id> t23=1.41   # Corregir un experimento y sus agregados
+"""
+
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import pymongo
+from pymongo import ReplaceOne, UpdateOne
+
+from mrua_kinematics import TIME_FIELDS, analyze_arrays, documents_to_arrays
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+AGGREGATES_COLLECTION = "aggregates"
+SYNC_COLLECTION = "sync_state"
+SYNC_TARGETS = ['aggregates', 'rollups']  # Destinos con marca de agua propia
+HISTORY_PROJECTION = {'_id': 1, 'id': 1, 'mode': 1, 'failed': 1, 'fecha': 1, **{f: 1 for f in TIME_FIELDS}}
+# Documentos que cuentan para el análisis (dedup_history.py marca los duplicados)
+ACTIVE_FILTER = {'is_duplicate': {'$ne': True}}
+SENSORS = [1, 2, 3, 4]
+CONSISTENCY_TOLERANCE = 1e-6
+
+
+# ============ INCREMENTOS ============
+def _moment_fields(prefix: str, values: np.ndarray) -> Dict[str, float]:
+    values = values[~np.isnan(values)]
+    return {
+        f'{prefix}.n': int(len(values)),
+        f'{prefix}.sum': float(values.sum()),
+        f'{prefix}.sumsq': float((values ** 2).sum()),
+    }
+
+
+def experiment_increments(docs: Iterable[dict], sign: int = 1) -> Dict[str, Dict[str, float]]:
+    """
+    Calcula los incrementos ($inc) por modalidad que aporta un lote de experimentos.
+
+    Args:
+        docs: Documentos de 'history'
+        sign: +1 para altas, -1 para bajas
+
+    Returns:
+        Diccionario modo -> {campo: incremento}
+    """
+    arrays = documents_to_arrays(docs)
+    if len(arrays['id']) == 0:
+        return {}
+    kin = analyze_arrays(arrays['raw'])
+
+    increments = {}
+    for mode in np.unique(arrays['mode']):
+        mask = arrays['mode'] == mode
+        inc = {'count': int(mask.sum()), 'failed': int(arrays['failed'][mask].sum())}
+        for k, sensor in enumerate(SENSORS):
+            inc.update(_moment_fields(f'sensor_{sensor}', kin['times'][mask, k]))
+        inc.update(_moment_fields('acceleration', kin['acceleration_mean'][mask]))
+        increments[mode] = {field: value * sign for field, value in inc.items()}
+    return increments
+
+
+def apply_increments(db: pymongo.database.Database, increments: Dict[str, Dict[str, float]]):
+    """Aplica los incrementos a la colección de agregados en una sola escritura en bloque."""
+    if not increments:
+        return
+    now = datetime.now()
+    ops = [
+        UpdateOne({'_id': mode}, {'$inc': inc, '$set': {'updated_at': now}}, upsert=True)
+        for mode, inc in increments.items()
+    ]
+    db[AGGREGATES_COLLECTION].bulk_write(ops, ordered=False)
+
+
+def _apply(db: pymongo.database.Database, target: str, docs: List[dict], sign: int):
+    """Suma (sign=1) o descuenta (sign=-1) experimentos de un destino ('aggregates' o 'rollups')."""
+    if not docs:
+        return
+    if target == 'aggregates':
+        apply_increments(db, experiment_increments(docs, sign))
+    else:
+        from mrua_rollups import add_to_rollups
+        add_to_rollups(db, docs, sign)
+
+
+def remove_experiments(db: pymongo.database.Database, docs: List[dict]):
+    """
+    Descuenta de los agregados y de las series por periodo experimentos eliminados de
+    'history'. Solo se descuentan los ya incorporados (anteriores a la marca de agua):
+    los posteriores nunca se sumaron.
+    """
+    for target in SYNC_TARGETS:
+        state = read_watermark(db, target)
+        _apply(db, target, [doc for doc in docs if is_synced(state, doc)], -1)
+
+
+def remove_from_aggregates(db: pymongo.database.Database, docs: List[dict]):
+    """
+    Descuenta experimentos solo de los agregados. Las series por periodo los conservan:
+    se usa al archivar (archive_history.py), donde el experimento sale de 'history' pero
+    sigue formando parte de la historia de su día, semana y mes.
+    """
+    state = read_watermark(db, 'aggregates')
+    _apply(db, 'aggregates', [doc for doc in docs if is_synced(state, doc)], -1)
+
+
+# ============ INCORPORACIÓN INCREMENTAL ============
+def _fechas(docs: List[dict]) -> pd.Series:
+    """Fechas de los documentos (texto ISO del bridge o datetime) como Timestamp UTC (NaT si no son válidas)."""
+    return pd.to_datetime(pd.Series([doc.get('fecha') for doc in docs], dtype=object),
+                          utc=True, errors='coerce', format='ISO8601')
+
+
+def watermark_of(docs: List[dict], state: Optional[Dict] = None) -> Dict:
+    """
+    Marca de agua tras incorporar docs a partir de state: fecha más reciente
+    (texto ISO, None si no hay ninguna) y _id de los documentos con esa fecha.
+    """
+    newest = pd.Timestamp(state['fecha']) if state and state.get('fecha') else None
+    ids = list(state['ids']) if newest is not None else []
+    fechas = _fechas(docs)
+    if fechas.notna().any():
+        batch_newest = fechas.max()
+        batch_ids = [docs[i]['_id'] for i in np.flatnonzero((fechas == batch_newest).to_numpy())]
+        if newest is None or batch_newest > newest:
+            newest, ids = batch_newest, batch_ids
+        elif batch_newest == newest:
+            ids += [_id for _id in batch_ids if _id not in ids]
+    return {'fecha': newest.isoformat() if newest is not None else None, 'ids': ids}
+
+
+def read_watermark(db: pymongo.database.Database, target: str) -> Optional[Dict]:
+    """Marca de agua de un destino (None si nunca se reconstruyó)."""
+    return db[SYNC_COLLECTION].find_one({'_id': target})
+
+
+def save_watermark(db: pymongo.database.Database, target: str, watermark: Dict):
+    """Guarda la marca de agua tras una reconstrucción completa."""
+    db[SYNC_COLLECTION].update_one({'_id': target}, {'$set': watermark, '$inc': {'version': 1}}, upsert=True)
+
+
+def is_synced(state: Optional[Dict], doc: dict) -> bool:
+    """
+    Indica si un documento ya está sumado en el destino. Sin marca de agua se asume
+    que sí (destino mantenido solo con altas explícitas); los documentos sin fecha
+    válida solo entran en las reconstrucciones completas.
+    """
+    if state is None:
+        return True
+    ts = pd.to_datetime(doc.get('fecha'), utc=True, errors='coerce')
+    if pd.isna(ts):
+        return True
+    if state.get('fecha') is None:
+        return False
+    newest = pd.Timestamp(state['fecha'])
+    return ts < newest or (ts == newest and doc.get('_id') in state['ids'])
+
+
+def catch_up(db: pymongo.database.Database, target: str) -> int:
+    """
+    Incorpora a un destino los documentos activos de 'history' posteriores a su marca
+    de agua. La marca se avanza con una comparación de versión antes de aplicar los
+    incrementos, de modo que dos procesos a la vez no suman dos veces el mismo lote.
+    Sin marca de agua se reconstruye el destino completo.
+
+    Returns:
+        Experimentos incorporados (-1 si hubo que reconstruir)
+    """
+    from archive_history import fecha_range_filter
+    state = read_watermark(db, target)
+    if state is None:
+        if target == 'aggregates':
+            rebuild_aggregates(db)
+        else:
+            from mrua_rollups import rebuild_rollups
+            rebuild_rollups(db)
+        return -1
+
+    query = dict(ACTIVE_FILTER)
+    if state.get('fecha') is not None:
+        query.update(fecha_range_filter(state['fecha']))
+    docs = [doc for doc in db[COLLECTION_NAME].find(query, HISTORY_PROJECTION) if not is_synced(state, doc)]
+    if not docs:
+        return 0
+    claimed = db[SYNC_COLLECTION].update_one(
+        {'_id': target, 'version': state.get('version')},
+        {'$set': watermark_of(docs, state), '$inc': {'version': 1}}
+    )
+    if not claimed.modified_count:
+        return 0  # Otro proceso incorporó este lote
+    _apply(db, target, docs, 1)
+    return len(docs)
+
+
+def sync_history(db: pymongo.database.Database) -> Dict[str, int]:
+    """Incorpora los experimentos nuevos de 'history' a los agregados y a las series por periodo."""
+    return {target: catch_up(db, target) for target in SYNC_TARGETS}
+
+
+def correct_experiment(db: pymongo.database.Database, experiment_id, changes: Dict) -> bool:
+    """
+    Corrige campos de un experimento en 'history' y ajusta los agregados
+    (resta la versión anterior y suma la corregida), también en las series por periodo.
+    Marca el documento con 'updated_at' para que los lectores en memoria (mrua_service.py)
+    detecten la edición.
+
+    Args:
+        db: Objeto Database de MongoDB
+        experiment_id: Valor del campo 'id' del experimento
+        changes: Campos a modificar
+
+    Returns:
+        True si el experimento existía y fue corregido
+    """
+    collection = db[COLLECTION_NAME]
+    old = collection.find_one_and_update(
+        {'id': experiment_id}, {'$set': {**changes, 'updated_at': datetime.now()}}, projection=HISTORY_PROJECTION,
+        return_document=pymongo.ReturnDocument.BEFORE
+    )
+    if old is None:
+        return False
+    new = {**old, **changes}
+    for target in SYNC_TARGETS:
+        # Un experimento aún no incorporado entrará ya corregido en la próxima incorporación
+        state = read_watermark(db, target)
+        _apply(db, target, [old] if is_synced(state, old) else [], -1)
+        _apply(db, target, [new] if is_synced(state, new) else [], 1)
+    return True
+
+
+# ============ RECONSTRUCCIÓN Y LECTURA ============
+def compute_from_history(db: pymongo.database.Database, with_watermark: bool = False):
+    """
+    Calcula los agregados completos recorriendo 'history' con proyección.
+    Con with_watermark devuelve también la marca de agua de los documentos leídos.
+    """
+    docs = list(db[COLLECTION_NAME].find(ACTIVE_FILTER, HISTORY_PROJECTION))
+    totals = experiment_increments(docs)
+    return (totals, watermark_of(docs)) if with_watermark else totals
+
+
+def rebuild_aggregates(db: pymongo.database.Database) -> Dict[str, Dict[str, float]]:
+    """
+    Reconstruye la colección de agregados desde cero.
+
+    Returns:
+        Agregados calculados por modalidad
+    """
+    totals, watermark = compute_from_history(db, with_watermark=True)
+    now = datetime.now()
+    col = db[AGGREGATES_COLLECTION]
+    ops = [ReplaceOne({'_id': mode}, _nest({**inc, 'updated_at': now}), upsert=True) for mode, inc in totals.items()]
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    col.delete_many({'_id': {'$nin': list(totals)}})
+    save_watermark(db, 'aggregates', watermark)
+    print(f"[OK] Agregados reconstruidos para {len(totals)} modalidades")
+    return totals
+
+
+def _nest(flat: Dict) -> Dict:
+    """Convierte claves con punto ('sensor_1.n') en subdocumentos."""
+    nested = {}
+    for key, value in flat.items():
+        parts = key.split('.')
+        target = nested
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return nested
+
+
+def _flatten(doc: Dict, prefix: str = '') -> Dict:
+    flat = {}
+    for key, value in doc.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f'{name}.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _moments_to_stats(moments: Dict) -> Dict[str, float]:
+    n, total, sumsq = moments.get('n', 0), moments.get('sum', 0.0), moments.get('sumsq', 0.0)
+    mean = total / n if n else np.nan
+    var = (sumsq - n * mean ** 2) / (n - 1) if n > 1 else np.nan
+    return {'count': n, 'mean': mean, 'std': float(np.sqrt(max(var, 0.0))) if n > 1 else np.nan}
+
+
+def read_aggregates(db: pymongo.database.Database, sync: bool = True) -> Dict[str, pd.DataFrame]:
+    """
+    Lee los agregados materializados (una consulta sobre un documento por modalidad).
+    Con sync se incorporan antes los experimentos nuevos de 'history' (consulta por fecha).
+
+    Returns:
+        Diccionario con 'grouped' (mismo formato que calculate_statistics) y
+        'summary' (aceleración media y tasa de fallos por modalidad)
+    """
+    if sync:
+        catch_up(db, 'aggregates')
+    grouped, summary = [], []
+    for doc in db[AGGREGATES_COLLECTION].find():
+        mode = doc['_id']
+        for sensor in SENSORS:
+            stats = _moments_to_stats(doc.get(f'sensor_{sensor}', {}))
+            if stats['count']:
+                grouped.append({'sensor_id': sensor, 'mode': mode, 'time_mean': stats['mean'],
+                                'time_std': stats['std'], 'count': stats['count']})
+        accel = _moments_to_stats(doc.get('acceleration', {}))
+        count = doc.get('count', 0)
+        summary.append({
+            'mode': mode,
+            'total_experiments': count,
+            'failed_count': doc.get('failed', 0),
+            'failure_rate_pct': round(doc.get('failed', 0) / count * 100, 2) if count else 0.0,
+            'acceleration_mean': accel['mean'],
+            'acceleration_std': accel['std'],
+            'updated_at': doc.get('updated_at'),
+        })
+    return {'grouped': pd.DataFrame(grouped), 'summary': pd.DataFrame(summary)}
+
+
+def check_consistency(db: pymongo.database.Database, tolerance: float = CONSISTENCY_TOLERANCE) -> List[str]:
+    """
+    Compara los agregados materializados con un recálculo completo desde 'history'
+    (tras incorporar los experimentos nuevos).
+
+    Returns:
+        Lista de discrepancias (vacía si son consistentes)
+    """
+    catch_up(db, 'aggregates')
+    expected = compute_from_history(db)
+    stored = {doc['_id']: _flatten(doc) for doc in db[AGGREGATES_COLLECTION].find()}
+    issues = []
+    for mode in sorted(set(expected) | set(stored)):
+        exp_fields, got_fields = expected.get(mode, {}), stored.get(mode, {})
+        for field in sorted(set(exp_fields) | {f for f in got_fields if f not in ('_id', 'updated_at')}):
+            exp_value, got_value = exp_fields.get(field, 0), got_fields.get(field, 0)
+            if abs(exp_value - got_value) > tolerance * max(1.0, abs(exp_value)):
+                issues.append(f"{mode}.{field}: esperado {exp_value}, almacenado {got_value}")
+    return issues
+
+
+def _parse_value(text: str):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return {'true': True, 'false': False}.get(text.lower(), text)
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else 'show'
+    try:
+        client = pymongo.MongoClient(MONGODB_URI)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+
+    if command == 'rebuild':
+        rebuild_aggregates(db)
+    elif command == 'sync':
+        for target, added in sync_history(db).items():
+            print(f"[OK] {target}: " + ("reconstruido desde 'history'" if added < 0 else f"{added} experimentos nuevos"))
+    elif command == 'check':
+        issues = check_consistency(db)
+        if issues:
+            print(f"[WARNING] {len(issues)} discrepancias (ejecute 'rebuild' para corregir):")
+            for issue in issues:
+                print(f"   - {issue}")
+        else:
+            print("[OK] Agregados consistentes con 'history'")
+    elif command == 'correct' and len(sys.argv) > 3:
+        experiment_id = _parse_value(sys.argv[2])
+        changes = dict(arg.split('=', 1) for arg in sys.argv[3:])
+        changes = {field: _parse_value(value) for field, value in changes.items()}
+        if correct_experiment(db, experiment_id, changes):
+            print(f"[OK] Experimento {experiment_id} corregido: {changes}")
+        else:
+            print(f"[ERROR] No existe el experimento {experiment_id}")
+    else:
+        aggregates = read_aggregates(db)
+        print("\n--- Tiempos por Sensor (agregados) ---")
+        print(aggregates['grouped'].to_string(index=False))
+        print("\n--- Resumen por Modalidad ---")
+        print(aggregates['summary'].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Detección en línea de deriva y anomalías en las barreras de sensores.
+Por cada modalidad y canal (intervalos S1→S2, S2→S3, S3→S4 y aceleración del ajuste)
+se mantiene un estado de tamaño fijo que se actualiza en O(1) por experimento:
+  - línea base (media y desviación, Welford) aprendida en los primeros experimentos
+  - CUSUM bilateral sobre el valor normalizado: detecta deriva lenta (barrera
+    desplazada, cambio de montaje) y, tras avisar, vuelve a aprender la línea base
+  - EWMA del cuadrado del valor normalizado: detecta jitter (varianza muy por
+    encima de la de la línea base, p. ej. una barrera que rebota)
+Además, por sensor se cuentan experimentos consecutivos no fallidos con t12/t23/t34
+en cero o ausente (sensor atascado o desconectado).
+Funciona por lotes sobre 'history' (en orden de fecha) o en vivo con los resultados
+que mrua_ingest_service.py publica en mru/analysis. Las alertas se guardan en la
+colección 'alerts' con un _id determinista, de modo que repetir un análisis no duplica.
+
+Uso:
+    python mrua_drift.py batch                          # Todo 'history'
+    python mrua_drift.py batch --from 2026-01-01 --dry-run
+    python mrua_drift.py live                           # Suscrito a mru/analysis
+    python mrua_drift.py live --warmup 1000             # Línea base con los últimos 1000 experimentos
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pymongo
+from pymongo import UpdateOne
+
+from archive_history import fecha_range_filter
+from mqtt_lite import MQTTClient
+from mrua_aggregates import ACTIVE_FILTER, HISTORY_PROJECTION
+from mrua_ingest_service import MQTT_BROKER_URL, MQTT_TOPIC_ANALYSIS, run_with_reconnect
+from mrua_kinematics import analyze_arrays, documents_to_arrays
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+ALERTS_COLLECTION = "alerts"
+BATCH_SIZE = 5000
+CHANNELS = ['interval_12', 'interval_23', 'interval_34', 'fit_a']
+STUCK_FIELDS = ['t12', 't23', 't34']
+WARMUP = 200           # Experimentos para aprender (o reaprender) la línea base
+CUSUM_K = 0.5          # Holgura en desviaciones: cambios menores no acumulan
+CUSUM_H = 10.0         # Umbral de alarma del CUSUM
+JITTER_ALPHA = 0.05    # Peso del EWMA de z² (ventana efectiva ~20 experimentos)
+JITTER_RATIO = 4.0     # EWMA de z² por encima de este valor (1 = varianza de la línea base)
+JITTER_COOLDOWN = 100  # Experimentos sin repetir la alerta de jitter de un canal
+STUCK_RUN = 3          # Experimentos consecutivos con el sensor en cero
+MIN_BASELINE_STD = 1e-4
+
+
+# ============ ESTADO POR CANAL ============
+class ChannelState:
+    """Estado O(1) de un canal: línea base, CUSUM y EWMA de la varianza normalizada."""
+
+    __slots__ = ('count', 'mean', 'm2', 'std', 'cusum_pos', 'cusum_neg', 'jitter', 'cooldown')
+
+    def __init__(self):
+        self.count, self.mean, self.m2, self.std = 0, 0.0, 0.0, 0.0
+        self.cusum_pos = self.cusum_neg = 0.0
+        self.jitter = 1.0
+        self.cooldown = 0
+
+    def update(self, value: float) -> Optional[Dict]:
+        """Incorpora un valor; devuelve una alerta (tipo, estadístico, dirección) o None."""
+        if self.count < WARMUP:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+            if self.count == WARMUP:
+                self.std = max((self.m2 / (WARMUP - 1)) ** 0.5, MIN_BASELINE_STD)
+            return None
+
+        z = (value - self.mean) / self.std
+        self.cusum_pos = max(0.0, self.cusum_pos + z - CUSUM_K)
+        self.cusum_neg = max(0.0, self.cusum_neg - z - CUSUM_K)
+        self.jitter += JITTER_ALPHA * (z * z - self.jitter)
+        if self.cooldown:
+            self.cooldown -= 1
+
+        if self.cusum_pos > CUSUM_H or self.cusum_neg > CUSUM_H:
+            alert = {'type': 'drift', 'direction': 'up' if self.cusum_pos > CUSUM_H else 'down',
+                     'statistic': max(self.cusum_pos, self.cusum_neg),
+                     'baseline_mean': self.mean, 'baseline_std': self.std}
+            self.__init__()  # Nueva línea base a partir del nivel actual
+            return alert
+        if self.jitter > JITTER_RATIO and not self.cooldown:
+            self.cooldown = JITTER_COOLDOWN
+            return {'type': 'jitter', 'direction': None, 'statistic': self.jitter,
+                    'baseline_mean': self.mean, 'baseline_std': self.std}
+        return None
+
+
+# ============ DETECTOR ============
+class DriftDetector:
+    """
+    Estado de todos los canales por modalidad. update_arrays procesa un lote ya
+    convertido con documents_to_arrays (los cálculos por lote son vectoriales; solo
+    la actualización de estado recorre los experimentos) y devuelve las alertas.
+    """
+
+    def __init__(self):
+        self.channels: Dict[tuple, ChannelState] = {}
+        self.stuck_runs: Dict[tuple, int] = {}
+        self.processed = 0
+
+    def update_arrays(self, arrays: Dict[str, np.ndarray]) -> List[Dict]:
+        raw = arrays['raw']
+        if not len(raw):
+            return []
+        kin = analyze_arrays(raw)
+        values = np.column_stack([np.diff(kin['times'], axis=1), kin['fit_a']])
+        # Sensor en cero o ausente en un experimento con tiempo total (los fallidos no cuentan)
+        stuck = ~(raw[:, :3] > 0) & (raw[:, 3:4] > 0)
+        finite = np.isfinite(values)
+
+        alerts = []
+        modes, failed, ids, fechas = arrays['mode'], arrays['failed'], arrays['id'], arrays['fecha']
+        values_list, finite_list, stuck_list = values.tolist(), finite.tolist(), stuck.tolist()
+        for i in range(len(raw)):
+            if failed[i]:
+                continue
+            mode = modes[i]
+            row, ok = values_list[i], finite_list[i]
+            for j, channel in enumerate(CHANNELS):
+                if not ok[j]:
+                    continue
+                key = (mode, channel)
+                state = self.channels.get(key)
+                if state is None:
+                    state = self.channels[key] = ChannelState()
+                alert = state.update(row[j])
+                if alert is not None:
+                    alerts.append({**alert, 'mode': mode, 'channel': channel, 'value': row[j],
+                                   'experiment_id': ids[i], 'fecha': fechas[i]})
+            for j, field in enumerate(STUCK_FIELDS):
+                key = (mode, field)
+                if not stuck_list[i][j]:
+                    self.stuck_runs[key] = 0
+                    continue
+                run = self.stuck_runs[key] = self.stuck_runs.get(key, 0) + 1
+                if run == STUCK_RUN:
+                    alerts.append({'type': 'stuck_sensor', 'direction': None, 'statistic': run,
+                                   'baseline_mean': None, 'baseline_std': None, 'mode': mode,
+                                   'channel': field, 'value': 0.0, 'experiment_id': ids[i], 'fecha': fechas[i]})
+        self.processed += len(raw)
+        return alerts
+
+    def update(self, measurement: Dict) -> List[Dict]:
+        """Procesa una sola medición con el formato de 'history' (modo en vivo)."""
+        return self.update_arrays(documents_to_arrays([measurement]))
+
+
+# ============ ALERTAS ============
+def save_alerts(db: pymongo.database.Database, alerts: List[Dict], source: str) -> int:
+    """Guarda las alertas con _id determinista (tipo:modalidad:canal:experimento)."""
+    if not alerts:
+        return 0
+    now = datetime.now()
+    ops = [
+        UpdateOne({'_id': f"{alert['type']}:{alert['mode']}:{alert['channel']}:{alert['experiment_id']}"},
+                  {'$set': {**alert, 'source': source, 'updated_at': now}, '$setOnInsert': {'created_at': now}},
+                  upsert=True)
+        for alert in alerts
+    ]
+    db[ALERTS_COLLECTION].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def _print_alert(alert: Dict):
+    direction = f" ({alert['direction']})" if alert['direction'] else ''
+    print(f"[WARNING] {alert['type']}{direction}: {alert['mode']}/{alert['channel']} "
+          f"experimento {alert['experiment_id']} ({alert['fecha']}), valor {alert['value']:.4f}")
+
+
+# ============ EJECUCIÓN ============
+def history_batches(db: pymongo.database.Database, date_from=None, date_to=None, batch_size: int = BATCH_SIZE,
+                    newest: int = None):
+    """Lotes de arrays de 'history' en orden de fecha ascendente (newest = solo los N más recientes)."""
+    query = {**ACTIVE_FILTER, **fecha_range_filter(date_from, date_to)}
+    cursor = db[COLLECTION_NAME].find(query, HISTORY_PROJECTION)
+    if newest:
+        docs = list(cursor.sort('fecha', -1).limit(newest))[::-1]
+        for i in range(0, len(docs), batch_size):
+            yield documents_to_arrays(docs[i:i + batch_size])
+        return
+    batch = []
+    for doc in cursor.sort('fecha', 1).batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield documents_to_arrays(batch)
+            batch = []
+    if batch:
+        yield documents_to_arrays(batch)
+
+
+def run_batch(db: pymongo.database.Database, date_from=None, date_to=None, dry_run: bool = False) -> Dict:
+    """Recorre 'history' en orden de fecha y guarda las alertas. Devuelve el resumen."""
+    detector = DriftDetector()
+    start = time.perf_counter()
+    counts = {}
+    for arrays in history_batches(db, date_from, date_to):
+        alerts = detector.update_arrays(arrays)
+        for alert in alerts:
+            counts[alert['type']] = counts.get(alert['type'], 0) + 1
+        if not dry_run:
+            save_alerts(db, alerts, 'batch')
+    elapsed = time.perf_counter() - start
+    return {'experiments': detector.processed, 'alerts': counts, 'elapsed_s': elapsed,
+            'rate': detector.processed / elapsed if elapsed > 0 else 0.0}
+
+
+async def run_live(db: pymongo.database.Database, broker_url: str, warmup: int):
+    """
+    Aprende la línea base con los últimos experimentos y analiza cada resultado de mru/analysis.
+    Si se pierde la conexión con el broker se reconecta (run_with_reconnect) conservando
+    el estado del detector. Las alertas que no se pudieron guardar se reintentan con las siguientes.
+    """
+    detector = DriftDetector()
+    for arrays in history_batches(db, newest=warmup):
+        detector.update_arrays(arrays)  # Sin guardar: solo para partir de la línea base actual
+    print(f"[OK] Linea base con {detector.processed} experimentos recientes")
+
+    pending: List[Dict] = []  # Alertas cuyo guardado falló
+
+    def on_saved(future: asyncio.Future, alerts: List[Dict]):
+        error = future.exception()
+        if error is not None:
+            print(f"[WARNING] No se pudieron guardar {len(alerts)} alertas (se reintentara): {error}")
+            pending.extend(alerts)
+
+    async def session(client: MQTTClient):
+        await client.subscribe([MQTT_TOPIC_ANALYSIS])
+        print(f"[OK] Suscrito a {MQTT_TOPIC_ANALYSIS} en {broker_url}")
+        loop = asyncio.get_running_loop()
+        async for _, payload in client.messages():
+            try:
+                measurement = json.loads(payload)['experiment']
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"[WARNING] Resultado no valido en {MQTT_TOPIC_ANALYSIS}: {e}")
+                continue
+            alerts = detector.update(measurement)
+            for alert in alerts:
+                _print_alert(alert)
+            if alerts or pending:
+                alerts, pending[:] = pending + alerts, []
+                future = loop.run_in_executor(None, save_alerts, db, alerts, 'live')
+                future.add_done_callback(lambda f, alerts=alerts: on_saved(f, alerts))
+
+    await run_with_reconnect(broker_url, f'mru-drift-{os.getpid()}', session)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deriva, jitter y sensores atascados en tiempo real o por lotes")
+    parser.add_argument('command', choices=['batch', 'live'], nargs='?', default='batch')
+    parser.add_argument('--from', dest='date_from', default=None, help="Fecha inicial incluida (AAAA-MM-DD)")
+    parser.add_argument('--to', dest='date_to', default=None, help="Fecha final excluida (AAAA-MM-DD)")
+    parser.add_argument('--dry-run', action='store_true', help="No guardar alertas (batch)")
+    parser.add_argument('--broker', default=MQTT_BROKER_URL, help="URL del broker MQTT (live)")
+    parser.add_argument('--warmup', type=int, default=10 * WARMUP, help="Experimentos recientes para la linea base (live)")
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(MONGODB_URI)[DATABASE_NAME]
+    if args.command == 'live':
+        try:
+            asyncio.run(run_live(db, args.broker, args.warmup))
+        except KeyboardInterrupt:
+            print("\n[INFO] Detector detenido")
+        return
+
+    summary = run_batch(db, args.date_from, args.date_to, args.dry_run)
+    print(f"[OK] {summary['experiments']} experimentos en {summary['elapsed_s']:.2f} s "
+          f"({summary['rate']:.0f} exp/s)")
+    if not summary['alerts']:
+        print("[OK] Sin alertas")
+    for alert_type, count in sorted(summary['alerts'].items()):
+        print(f"[WARNING] {alert_type}: {count}")
+    if summary['alerts'] and not args.dry_run:
+        print(f"[INFO] Alertas guardadas en '{ALERTS_COLLECTION}'")
+
+
+if __name__ == "__main__":
+    main()
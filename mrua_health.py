@@ -0,0 +1,211 @@
+"""
+Métricas de salud de la base de datos del laboratorio.
+Todos los conteos de 'history' (total, simulados, duplicados marcados, por modalidad
+y fallidos por modalidad) y las fechas más nueva y más antigua salen de una única
+agregación con $facet, es decir, un solo recorrido de la colección en vez de una
+consulta por métrica. Los tamaños de 'history' y 'raw_experiments' se leen con
+collStats, que solo consulta metadatos. La lectura usa secondaryPreferred para que,
+con réplica, la monitorización no cargue el nodo primario.
+El resultado se escribe como fichero de texto de Prometheus (textfile collector de
+node_exporter) o como instantánea JSON, una vez o cada --interval segundos. Si
+MongoDB no responde se escribe mrua_up 0 y, con --interval, se sigue intentando.
+
+Uso:
+    python mrua_health.py                                  # Mostrar métricas
+    python mrua_health.py --format prom --output /var/lib/node_exporter/mrua.prom
+    python mrua_health.py --format json --output analysis_output/health.json --interval 60
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+import pandas as pd
+import pymongo
+from pymongo import ReadPreference
+from pymongo.errors import OperationFailure, PyMongoError
+
+from archive_history import to_timestamp
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+RAW_DATA_COLLECTION = "raw_experiments"
+SIZE_COLLECTIONS = [COLLECTION_NAME, RAW_DATA_COLLECTION]
+METRIC_PREFIX = "mrua"
+DEFAULT_INTERVAL_S = 60
+
+# Una sola pasada: cada faceta recibe los mismos documentos
+HEALTH_PIPELINE = [
+    {'$project': {'mode': 1, 'failed': 1, 'is_simulated': 1, 'is_duplicate': 1, 'fecha': 1}},
+    {'$facet': {
+        'modes': [{'$group': {
+            '_id': '$mode',
+            'count': {'$sum': 1},
+            'failed': {'$sum': {'$cond': [{'$eq': ['$failed', True]}, 1, 0]}},
+            'simulated': {'$sum': {'$cond': [{'$eq': ['$is_simulated', True]}, 1, 0]}},
+            'duplicates': {'$sum': {'$cond': [{'$eq': ['$is_duplicate', True]}, 1, 0]}},
+        }}],
+        # 'fecha' puede ser texto ISO (bridge) o datetime: $max/$min por tipo
+        'fecha_text': [{'$match': {'fecha': {'$type': 'string'}}},
+                       {'$group': {'_id': None, 'newest': {'$max': '$fecha'}, 'oldest': {'$min': '$fecha'}}}],
+        'fecha_date': [{'$match': {'fecha': {'$type': 'date'}}},
+                       {'$group': {'_id': None, 'newest': {'$max': '$fecha'}, 'oldest': {'$min': '$fecha'}}}],
+    }},
+]
+
+
+# ============ MÉTRICAS ============
+def collection_sizes(db: pymongo.database.Database, name: str) -> Dict[str, int]:
+    """Tamaño de datos, almacenamiento e índices de una colección (collStats, sin recorrerla)."""
+    try:
+        stats = db.command({'collStats': name})
+    except (OperationFailure, NotImplementedError) as e:
+        print(f"[WARNING] collStats no disponible para '{name}': {e}")
+        return {}
+    return {field: int(stats.get(field, 0)) for field in ('count', 'size', 'storageSize', 'totalIndexSize')}
+
+
+def collect_health(db: pymongo.database.Database) -> Dict[str, object]:
+    """
+    Instantánea de salud de 'history' con una agregación $facet y collStats.
+
+    Returns:
+        Diccionario con totales, métricas por modalidad, fechas extremas (ISO),
+        tamaños por colección y duración de la consulta
+    """
+    start = time.perf_counter()
+    collection = db.get_collection(COLLECTION_NAME, read_preference=ReadPreference.SECONDARY_PREFERRED)
+    facets = next(collection.aggregate(HEALTH_PIPELINE), {})
+
+    modes = {str(group['_id']): {key: group[key] for key in ('count', 'failed', 'simulated', 'duplicates')}
+             for group in facets.get('modes', [])}
+    totals = {key: sum(mode[key] for mode in modes.values())
+              for key in ('count', 'failed', 'simulated', 'duplicates')}
+
+    extremes = [to_timestamp(group[key]) for name in ('fecha_text', 'fecha_date')
+                for group in facets.get(name, []) for key in ('newest', 'oldest')]
+    extremes = [ts for ts in extremes if not pd.isna(ts)]
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'up': 1,
+        'totals': totals,
+        'modes': modes,
+        'newest_fecha': max(extremes).isoformat() if extremes else None,
+        'oldest_fecha': min(extremes).isoformat() if extremes else None,
+        'sizes': {name: collection_sizes(db, name) for name in SIZE_COLLECTIONS},
+        'elapsed_s': time.perf_counter() - start,
+    }
+
+
+def down_health(error: Exception) -> Dict[str, object]:
+    """Instantánea cuando MongoDB no responde: solo up = 0 y el error."""
+    return {'timestamp': datetime.now(timezone.utc).isoformat(), 'up': 0, 'error': str(error)}
+
+
+# ============ EXPORTACIÓN ============
+def to_prometheus(health: Dict[str, object]) -> str:
+    """Formato de texto de Prometheus (una métrica por línea, con HELP y TYPE)."""
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}" if label_text
+                         else f"{METRIC_PREFIX}_{name} {value}")
+
+    metric('up', "1 si MongoDB respondio a la consulta de salud", [({}, health['up'])])
+    if not health['up']:
+        return '\n'.join(lines) + '\n'
+    metric('history_documents', "Documentos en history", [({}, health['totals']['count'])])
+    for key, help_text in [('count', "Documentos por modalidad"), ('failed', "Experimentos fallidos por modalidad"),
+                           ('simulated', "Documentos simulados por modalidad"),
+                           ('duplicates', "Duplicados marcados por modalidad")]:
+        metric(f'history_mode_{key}', help_text,
+               [({'mode': mode}, values[key]) for mode, values in sorted(health['modes'].items())])
+    for key, help_text in [('newest_fecha', "Fecha mas reciente en history (epoch)"),
+                           ('oldest_fecha', "Fecha mas antigua en history (epoch)")]:
+        if health[key]:
+            metric(f'history_{key}_seconds', help_text, [({}, to_timestamp(health[key]).timestamp())])
+    for field in ('count', 'size', 'storageSize', 'totalIndexSize'):
+        samples = [({'collection': name}, sizes[field]) for name, sizes in health['sizes'].items() if field in sizes]
+        if samples:
+            metric(f'collection_{field.lower()}', f"collStats {field}", samples)
+    metric('health_query_seconds', "Duracion de la consulta de salud", [({}, round(health['elapsed_s'], 6))])
+    return '\n'.join(lines) + '\n'
+
+
+def write_snapshot(health: Dict[str, object], path: str, fmt: str):
+    """Escribe la instantánea de forma atómica (el colector nunca lee un fichero a medias)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        if fmt == 'prom':
+            f.write(to_prometheus(health))
+        else:
+            json.dump(health, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def print_health(health: Dict[str, object]):
+    totals = health['totals']
+    print(f"Documentos en 'history': {totals['count']}")
+    print(f"Simulados: {totals['simulated']}  |  Duplicados marcados: {totals['duplicates']}")
+    for mode, values in sorted(health['modes'].items()):
+        print(f"  {mode}: {values['count']} ({values['failed']} fallidos)")
+    print(f"Fecha mas reciente: {health['newest_fecha']}  |  Mas antigua: {health['oldest_fecha']}")
+    for name, sizes in health['sizes'].items():
+        if sizes:
+            print(f"  {name}: {sizes['count']} docs, {sizes['size'] / 1e6:.1f} MB datos, "
+                  f"{sizes['storageSize'] / 1e6:.1f} MB en disco, {sizes['totalIndexSize'] / 1e6:.1f} MB indices")
+    print(f"[INFO] Consulta de salud en {health['elapsed_s']:.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metricas de salud de 'history' en una sola agregacion")
+    parser.add_argument('--format', choices=['prom', 'json'], default='prom', help="Formato de --output")
+    parser.add_argument('--output', default=None, help="Fichero de salida (sin --output solo se muestra)")
+    parser.add_argument('--interval', type=float, default=None,
+                        help=f"Repetir cada N segundos (p. ej. {DEFAULT_INTERVAL_S})")
+    args = parser.parse_args()
+
+    try:
+        client = pymongo.MongoClient(MONGODB_URI)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except PyMongoError as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        if args.output:
+            write_snapshot(down_health(e), args.output, args.format)
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+
+    while True:
+        # Un error puntual de MongoDB no detiene el exportador: se publica up = 0 y se reintenta
+        try:
+            health = collect_health(db)
+        except PyMongoError as e:
+            print(f"[WARNING] Consulta de salud fallida: {e}")
+            health = down_health(e)
+        if args.output:
+            write_snapshot(health, args.output, args.format)
+            if health['up']:
+                print(f"[OK] {health['timestamp']}: {health['totals']['count']} documentos -> {args.output}")
+        elif health['up']:
+            print_health(health)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Servicio de ingesta en vivo de experimentos MRUA.
+Se suscribe a los mismos topics MQTT que mqtt-bridge/server.js (mru/data y mru/status)
+y, cuando un experimento finaliza, calcula al instante velocidades, aceleraciones y el
+ajuste cinemático, actualiza los agregados acumulados por modalidad y publica el
+resultado en mru/analysis (y opcionalmente en la colección 'live_analysis').
+
+Uso:
+    python mrua_ingest_service.py                 # Conectar al broker configurado
+    python mrua_ingest_service.py --no-mongo      # Sin persistir resultados en MongoDB
+    python mrua_ingest_service.py --aggregates    # Mantener también la colección 'aggregates'
+    python mrua_ingest_service.py --self-test     # Prueba contra un broker local sustituto
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from mqtt_lite import LocalBroker, MQTTClient, parse_broker_url
+from mrua_kinematics import MODES, RunningStats, analyze_arrays
+
+
+# ============ CONFIGURACIÓN ============
+# Mismas variables de entorno que mqtt-bridge/server.js
+MQTT_BROKER_URL = os.environ.get("MQTT_BROKER_URL", "mqtt://192.168.10.111:1883")
+MQTT_USERNAME = os.environ.get("MQTT_USERNAME", "admin")
+MQTT_PASSWORD = os.environ.get("MQTT_PASSWORD", "admin1981")
+MQTT_TOPIC_DATA = os.environ.get("MQTT_TOPIC_DATA", "mru/data")
+MQTT_TOPIC_STATUS = os.environ.get("MQTT_TOPIC_STATUS", "mru/status")
+MQTT_TOPIC_ANALYSIS = os.environ.get("MQTT_TOPIC_ANALYSIS", "mru/analysis")
+
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+LIVE_COLLECTION = "live_analysis"  # Resultados analizados en vivo
+
+FINISHED_STATUS = "Finalizado"
+FAILED_TIME_THRESHOLD_S = 3.0  # Igual que el bridge: tiempo > 3 s = fallido
+DUPLICATE_WINDOW_MS = 5000  # Ventana de duplicados del bridge
+RECENT_RESULTS = 50
+RECONNECT_MIN_S = 1.0   # Espera inicial antes de reconectar al broker
+RECONNECT_MAX_S = 60.0  # Espera máxima (se duplica en cada intento fallido)
+
+
+# ============ MEDICIONES ============
+def build_measurement(data: Dict) -> Dict:
+    """
+    Construye el documento de 'history' a partir de los últimos datos recibidos,
+    con los mismos campos y la misma regla de fallo que mqtt-bridge/server.js.
+
+    Args:
+        data: Últimos datos de mru/data (con 'timestamp' en ms)
+
+    Returns:
+        Documento con el formato de 'history'
+    """
+    return {
+        'id': data['timestamp'],
+        'fecha': datetime.now(timezone.utc).isoformat(),
+        'tiempo': data.get('tiempo'),
+        'distancia': data.get('distancia') or 1.5,
+        'velocidad': data.get('velocidad'),
+        'aceleracion': data.get('aceleracion'),
+        'v12': data.get('v12'),
+        'v23': data.get('v23'),
+        'v34': data.get('v34'),
+        't12': data.get('t12'),
+        't23': data.get('t23'),
+        't34': data.get('t34'),
+        'mode': data.get('mode') or 'remote',
+        'failed': data['tiempo'] > FAILED_TIME_THRESHOLD_S,
+        'timestamp': data['timestamp'],
+    }
+
+
+# ============ AGREGADOS POR MODALIDAD ============
+def _empty_aggregate() -> Dict:
+    return {
+        'count': 0,
+        'failed': 0,
+        'sensor_times': [RunningStats() for _ in range(4)],
+        'acceleration': RunningStats(),
+        'fit_acceleration': RunningStats(),
+    }
+
+
+def aggregate_summary(aggregate: Dict) -> Dict:
+    """Convierte un agregado acumulado a un diccionario serializable."""
+    count = aggregate['count']
+    return {
+        'count': count,
+        'failed': aggregate['failed'],
+        'failure_rate_pct': round(aggregate['failed'] / count * 100, 2) if count else 0.0,
+        'sensor_times': [s.to_dict() for s in aggregate['sensor_times']],
+        'acceleration': aggregate['acceleration'].to_dict(),
+        'fit_acceleration': aggregate['fit_acceleration'].to_dict(),
+    }
+
+
+def _clean(value):
+    """Convierte NaN/numpy a tipos JSON (NaN -> None)."""
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_clean(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+# ============ SERVICIO ============
+class IngestService:
+    """
+    Reproduce la lógica de guardado del bridge (datos -> estado Finalizado -> medición)
+    y analiza cada medición en cuanto se completa.
+
+    Args:
+        on_result: Callback opcional que recibe cada resultado analizado
+        save_result: Callback bloqueante opcional para persistir el resultado (se ejecuta en un hilo)
+        dedup_window_ms: Ventana de duplicados (0 la desactiva, p. ej. en replays acelerados)
+        verbose: Imprimir una línea por experimento analizado
+    """
+
+    def __init__(self, on_result: Optional[Callable[[Dict], None]] = None,
+                 save_result: Optional[Callable[[Dict], None]] = None,
+                 dedup_window_ms: int = DUPLICATE_WINDOW_MS, verbose: bool = True):
+        self.latest_data: Dict = {}
+        self.latest_status = "Listo"
+        self.recent: List[Dict] = []
+        self.aggregates: Dict[str, Dict] = {mode: _empty_aggregate() for mode in MODES}
+        self.on_result = on_result
+        self.save_result = save_result
+        self.dedup_window_ms = dedup_window_ms
+        self.verbose = verbose
+
+    def handle_message(self, topic: str, payload: bytes) -> Optional[Dict]:
+        """
+        Procesa un mensaje MQTT. Devuelve el resultado analizado si el mensaje cierra un experimento.
+        """
+        try:
+            msg = json.loads(payload)
+        except (ValueError, UnicodeDecodeError) as e:
+            print(f"[WARNING] Mensaje no valido en {topic}: {e}")
+            return None
+
+        if topic == MQTT_TOPIC_DATA:
+            self.latest_data = {**msg, 'timestamp': int(time.time() * 1000)}
+            return None
+
+        if topic == MQTT_TOPIC_STATUS and msg.get('status'):
+            self.latest_status = msg['status']
+            tiempo = self.latest_data.get('tiempo') or 0
+            if self.latest_status == FINISHED_STATUS and tiempo > 0:
+                return self._finish_experiment()
+        return None
+
+    def _is_duplicate(self, data: Dict) -> bool:
+        return any(
+            abs(r['timestamp'] - data['timestamp']) < self.dedup_window_ms and
+            abs((r['tiempo'] or 0) - data['tiempo']) < 0.01
+            for r in self.recent
+        )
+
+    def _finish_experiment(self) -> Optional[Dict]:
+        data = self.latest_data
+        if self._is_duplicate(data):
+            return None
+
+        measurement = build_measurement(data)
+        result = self.analyze_measurement(measurement)
+        self.recent.insert(0, measurement)
+        del self.recent[RECENT_RESULTS:]
+        return result
+
+    def analyze_measurement(self, measurement: Dict) -> Dict:
+        """
+        Calcula la cinemática de una medición y actualiza los agregados de su modalidad.
+
+        Args:
+            measurement: Medición con el formato de 'history'
+
+        Returns:
+            Resultado con velocidades, aceleraciones, ajuste y agregados actualizados
+        """
+        raw = np.array([[measurement.get(f) or 0.0 for f in ('t12', 't23', 't34', 'tiempo')]], dtype=np.float64)
+        kin = analyze_arrays(raw)
+        mode = measurement['mode']
+
+        aggregate = self.aggregates.setdefault(mode, _empty_aggregate())
+        aggregate['count'] += 1
+        aggregate['failed'] += int(bool(measurement['failed']))
+        for k, stats in enumerate(aggregate['sensor_times']):
+            stats.update(kin['times'][0, k])
+        aggregate['acceleration'].update(kin['acceleration_mean'][0])
+        aggregate['fit_acceleration'].update(kin['fit_a'][0])
+
+        return _clean({
+            'experiment': measurement,
+            'sensor_times_s': kin['times'][0],
+            'velocities_ms': kin['velocity'][0, 1:],
+            'accelerations_ms2': kin['acceleration'][0, 2:],
+            'acceleration_mean_ms2': kin['acceleration_mean'][0],
+            'fit': {'x0_m': kin['fit_x0'][0], 'v0_ms': kin['fit_v0'][0],
+                    'a_ms2': kin['fit_a'][0], 'r2': kin['fit_r2'][0]},
+            'aggregate': aggregate_summary(aggregate),
+        })
+
+    async def run(self, client: MQTTClient):
+        """Consume mensajes del cliente MQTT y publica los resultados en MQTT_TOPIC_ANALYSIS."""
+        await client.subscribe([MQTT_TOPIC_DATA, MQTT_TOPIC_STATUS])
+        print(f"[OK] Suscrito a {MQTT_TOPIC_DATA} y {MQTT_TOPIC_STATUS}")
+        loop = asyncio.get_running_loop()
+        async for topic, payload in client.messages():
+            received = time.perf_counter()
+            result = self.handle_message(topic, payload)
+            if result is None:
+                continue
+            result['analysis_ms'] = round((time.perf_counter() - received) * 1000, 3)
+            await client.publish(MQTT_TOPIC_ANALYSIS, json.dumps(result))
+            if self.on_result:
+                self.on_result(result)
+            if self.save_result:
+                loop.run_in_executor(None, self.save_result, result)
+            if not self.verbose:
+                continue
+            exp = result['experiment']
+            print(f"[OK] Experimento analizado ({exp['mode']}): a={result['acceleration_mean_ms2']} m/s², "
+                  f"ajuste a={result['fit']['a_ms2']} m/s² en {result['analysis_ms']} ms")
+
+
+def mongo_saver(uri: str = MONGODB_URI, database: str = DATABASE_NAME,
+                update_aggregates: bool = False) -> Callable[[Dict], None]:
+    """
+    Devuelve un callback que guarda cada resultado en la colección LIVE_COLLECTION
+    y, opcionalmente, incorpora a los agregados materializados (mrua_aggregates) los
+    experimentos nuevos de 'history'. Se leen de 'history' y no del resultado en vivo
+    para no contar dos veces lo que otro proceso ya incorporó; si el bridge aún no ha
+    guardado este experimento, entra en la siguiente incorporación.
+    """
+    import pymongo
+    from mrua_aggregates import sync_history
+    db = pymongo.MongoClient(uri)[database]
+    collection = db[LIVE_COLLECTION]
+
+    def save(result: Dict):
+        try:
+            collection.update_one({'_id': result['experiment']['id']}, {'$set': result}, upsert=True)
+            if update_aggregates:
+                sync_history(db)
+        except Exception as e:
+            print(f"[WARNING] Error guardando resultado en vivo: {e}")
+    return save
+
+
+# ============ PRUEBA CONTRA BROKER LOCAL ============
+async def self_test() -> bool:
+    """
+    Levanta un LocalBroker, conecta el servicio, simula un ESP32 que publica un
+    experimento completo y verifica que el análisis llega a MQTT_TOPIC_ANALYSIS.
+    """
+    broker = LocalBroker()
+    port = await broker.start()
+    service = IngestService()
+    service_client = MQTTClient('127.0.0.1', port, client_id='mru-ingest-test')
+    esp32 = MQTTClient('127.0.0.1', port, client_id='mru-esp32-test')
+    dashboard = MQTTClient('127.0.0.1', port, client_id='mru-dashboard-test')
+    for client in (service_client, esp32, dashboard):
+        await client.connect()
+    await dashboard.subscribe([MQTT_TOPIC_ANALYSIS])
+    service_task = asyncio.create_task(service.run(service_client))
+    await asyncio.sleep(0.05)
+
+    # x = ½·a·t² con a = 1.0 m/s² en sensores a 0.5, 1.0 y 1.5 m
+    times = [float(np.sqrt(2 * x / 1.0)) for x in (0.5, 1.0, 1.5)]
+    data = {'tiempo': times[2], 'distancia': 1.5, 't12': times[0], 't23': times[1], 't34': times[2],
+            'mode': 'remote'}
+    sent = time.perf_counter()
+    await esp32.publish(MQTT_TOPIC_DATA, json.dumps(data))
+    await esp32.publish(MQTT_TOPIC_STATUS, json.dumps({'status': FINISHED_STATUS}))
+
+    ok = False
+    try:
+        async for _, payload in dashboard.messages():
+            latency_ms = (time.perf_counter() - sent) * 1000
+            result = json.loads(payload)
+            ok = abs(result['fit']['a_ms2'] - 1.0) < 1e-6 and result['aggregate']['count'] == 1
+            print(f"[{'OK' if ok else 'ERROR'}] Resultado recibido en {latency_ms:.2f} ms "
+                  f"(a ajustada = {result['fit']['a_ms2']:.4f} m/s²)")
+            break
+    finally:
+        service_task.cancel()
+        for client in (service_client, esp32, dashboard):
+            await client.disconnect()
+        await broker.stop()
+    return ok
+
+
+async def run_with_reconnect(broker_url: str, client_id: str, session: Callable[[MQTTClient], Awaitable[None]]):
+    """
+    Conecta al broker y ejecuta session(client) indefinidamente. Si la conexión se
+    pierde (o no se puede abrir) se crea un cliente nuevo y se reintenta con espera
+    exponencial entre RECONNECT_MIN_S y RECONNECT_MAX_S.
+    """
+    host, port = parse_broker_url(broker_url)
+    delay = RECONNECT_MIN_S
+    while True:
+        client = MQTTClient(host, port, client_id=client_id, username=MQTT_USERNAME, password=MQTT_PASSWORD)
+        try:
+            await client.connect()
+            print(f"[OK] Conectado a MQTT: {broker_url}")
+            delay = RECONNECT_MIN_S
+            await session(client)
+            print("[WARNING] Conexion MQTT cerrada")
+        except (OSError, asyncio.IncompleteReadError) as e:
+            print(f"[WARNING] Error de conexion MQTT: {e}")
+        finally:
+            await client.disconnect()
+        print(f"[INFO] Reconectando en {delay:.1f} s...")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_S)
+
+
+async def run_service(broker_url: str, use_mongo: bool, update_aggregates: bool):
+    service = IngestService(save_result=mongo_saver(update_aggregates=update_aggregates) if use_mongo else None)
+    await run_with_reconnect(broker_url, f'mru-ingest-{os.getpid()}', service.run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta y analisis en vivo de experimentos MRUA")
+    parser.add_argument('--broker', default=MQTT_BROKER_URL, help="URL del broker MQTT")
+    parser.add_argument('--no-mongo', action='store_true', help="No guardar resultados en MongoDB")
+    parser.add_argument('--aggregates', action='store_true',
+                        help="Actualizar la coleccion 'aggregates' con cada experimento")
+    parser.add_argument('--self-test', action='store_true', help="Probar contra un broker local sustituto")
+    args = parser.parse_args()
+
+    if args.self_test:
+        ok = asyncio.run(self_test())
+        raise SystemExit(0 if ok else 1)
+
+    try:
+        asyncio.run(run_service(args.broker, not args.no_mongo, args.aggregates))
+    except KeyboardInterrupt:
+        print("\n[INFO] Servicio detenido")
+    except Exception as e:
+        print(f"[ERROR] Servicio de ingesta: {e}")
+
+
+if __name__ == "__main__":
+    main()
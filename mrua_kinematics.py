@@ -0,0 +1,275 @@
+"""
+Núcleo cinemático vectorizado para experimentos MRUA.
+Reproduce los cálculos de analyze_mrua_experiments (tiempos por sensor, velocidades
+entre sensores, aceleraciones y ajuste x = x0 + v0·t + ½·a·t²) sobre matrices
+(N experimentos x 4 sensores), de modo que un experimento aislado y un lote
+de millones se procesan con el mismo código.
+"""
+
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+
+# ============ CONFIGURACIÓN ============
+# Distancia entre sensores (en metros) - debe coincidir con el Arduino
+DISTANCE_BETWEEN_SENSORS = 0.50
+SENSOR_POSITIONS_M = np.arange(4) * DISTANCE_BETWEEN_SENSORS  # 0, 0.5, 1.0, 1.5 m
+TIME_FIELDS = ['t12', 't23', 't34', 'tiempo']
+MODES = ['remote', 'presential']
+
+
+# ============ CONVERSIÓN DE DOCUMENTOS ============
+def _as_float(value) -> float:
+    """Convierte un campo numérico de Mongo a float (ausente, None o texto inválido -> NaN)."""
+    try:
+        return float(value) if value is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def documents_to_arrays(docs: Iterable[dict]) -> Dict[str, np.ndarray]:
+    """
+    Convierte documentos de 'history' a arrays columnares.
+
+    Args:
+        docs: Documentos con el formato del bridge MQTT {id, fecha, mode, failed, t12, t23, t34, tiempo}
+
+    Returns:
+        Diccionario con '_id', 'id', 'mode', 'failed', 'fecha' (arrays 1D) y
+        'raw' (N x 4: t12, t23, t34, tiempo; NaN si el campo falta)
+    """
+    docs = docs if isinstance(docs, list) else list(docs)
+    rows = [[doc.get(field) for field in TIME_FIELDS] for doc in docs]
+    try:
+        # None se convierte a NaN directamente
+        raw = np.array(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        raw = np.array([[_as_float(v) for v in row] for row in rows], dtype=np.float64)
+
+    return {
+        '_id': np.array([doc.get('_id') for doc in docs], dtype=object),
+        'id': np.array([str(doc.get('id', doc.get('_id', f'exp_{i}'))) for i, doc in enumerate(docs)], dtype=object),
+        'mode': np.array([doc.get('mode', 'remote') for doc in docs], dtype=object),
+        'failed': np.array([bool(doc.get('failed', False)) for doc in docs], dtype=bool),
+        'fecha': np.array([doc.get('fecha') for doc in docs], dtype=object),
+        'raw': raw.reshape(-1, len(TIME_FIELDS)),
+    }
+
+
+def sensor_times(raw: np.ndarray) -> np.ndarray:
+    """
+    Reconstruye el tiempo de paso por cada sensor (misma regla que extract_experiments).
+    S1 = 0 si el experimento tiene tiempo, S2 = t12, S3 = t23, S4 = t34 (o 'tiempo').
+    Los sensores sin registro (tiempo <= 0 o ausente) quedan como NaN.
+
+    Args:
+        raw: Matriz N x 4 con columnas t12, t23, t34, tiempo
+
+    Returns:
+        Matriz N x 4 con el tiempo de paso por sensor
+    """
+    raw = np.atleast_2d(np.asarray(raw, dtype=np.float64))
+    t12, t23, t34, tiempo = raw.T
+    times = np.full((len(raw), 4), np.nan)
+    times[(tiempo > 0) | (t34 > 0), 0] = 0.0
+    times[:, 1] = np.where(t12 > 0, t12, np.nan)
+    times[:, 2] = np.where(t23 > 0, t23, np.nan)
+    final_time = np.where(t34 > 0, t34, tiempo)
+    times[:, 3] = np.where(final_time > 0, final_time, np.nan)
+    # Sin sensor inicial no hay experimento
+    times[np.isnan(times[:, 0])] = np.nan
+    return times
+
+
+# ============ CINEMÁTICA ============
+def _previous_valid(valid: np.ndarray) -> np.ndarray:
+    """Índice de la columna válida anterior a cada columna (-1 si no existe)."""
+    n_cols = valid.shape[1]
+    idx = np.where(valid, np.arange(n_cols), -1)
+    last = np.maximum.accumulate(idx, axis=1)
+    prev = np.full_like(last, -1)
+    prev[:, 1:] = last[:, :-1]
+    return prev
+
+
+def segment_velocities(times: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Velocidad media entre sensores consecutivos con registro.
+
+    Args:
+        times: Matriz N x 4 de tiempos por sensor (NaN = sin registro)
+
+    Returns:
+        Diccionario con 'velocity' (N x 4, columna k = velocidad al llegar al sensor k),
+        'interval' (N x 4, duración del tramo) y 'sensor_from' (N x 4, índice del sensor de origen)
+    """
+    valid = ~np.isnan(times)
+    prev = _previous_valid(valid)
+    rows = np.arange(len(times))[:, None]
+    safe_prev = np.maximum(prev, 0)
+
+    dt = times - times[rows, safe_prev]
+    dx = SENSOR_POSITIONS_M[None, :] - SENSOR_POSITIONS_M[safe_prev]
+    ok = valid & (prev >= 0) & (dt > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocity = np.where(ok, dx / dt, np.nan)
+    return {
+        'velocity': velocity,
+        'interval': np.where(ok, dt, np.nan),
+        'sensor_from': np.where(ok, prev, -1),
+    }
+
+
+def segment_accelerations(velocities: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Aceleración entre velocidades consecutivas: a = (v2 - v1) / t, con t el intervalo de v2.
+
+    Args:
+        velocities: Resultado de segment_velocities
+
+    Returns:
+        Diccionario con 'acceleration' (N x 4, columna k = tramo que termina en el sensor k),
+        'sensor_from' (N x 4) y 'mean' (N, aceleración promedio del experimento)
+    """
+    velocity = velocities['velocity']
+    valid = ~np.isnan(velocity)
+    prev = _previous_valid(valid)
+    rows = np.arange(len(velocity))[:, None]
+    safe_prev = np.maximum(prev, 0)
+
+    ok = valid & (prev >= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        accel = np.where(ok, (velocity - velocity[rows, safe_prev]) / velocities['interval'], np.nan)
+    with np.errstate(invalid='ignore'):
+        counts = (~np.isnan(accel)).sum(axis=1)
+        mean = np.where(counts > 0, np.nansum(accel, axis=1) / np.maximum(counts, 1), np.nan)
+    return {
+        'acceleration': accel,
+        'sensor_from': np.where(ok, prev, -1),
+        'mean': mean,
+    }
+
+
+def fit_kinematics(times: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Ajuste por mínimos cuadrados de x(t) = x0 + v0·t + ½·a·t² por experimento
+    (equivalente a np.polyfit(times, distances, 2) fila a fila).
+    Requiere al menos 3 sensores con registro; en caso contrario devuelve NaN.
+
+    Args:
+        times: Matriz N x 4 de tiempos por sensor (NaN = sin registro)
+
+    Returns:
+        Diccionario con 'x0', 'v0', 'a' y 'r2' (arrays de longitud N)
+    """
+    valid = ~np.isnan(times)
+    w = valid.astype(np.float64)
+    t = np.where(valid, times, 0.0)
+    x = np.broadcast_to(SENSOR_POSITIONS_M, t.shape)
+
+    # Ecuaciones normales ponderadas (la ponderación 0 excluye sensores sin registro)
+    basis = np.stack([np.ones_like(t), t, t ** 2], axis=2) * w[:, :, None]
+    ata = np.einsum('nki,nkj->nij', basis, basis)
+    atb = np.einsum('nki,nk->ni', basis, x * w)
+    enough = valid.sum(axis=1) >= 3
+    coeffs = np.full((len(t), 3), np.nan)
+    if enough.any():
+        try:
+            coeffs[enough] = np.linalg.solve(ata[enough], atb[enough][:, :, None])[:, :, 0]
+        except np.linalg.LinAlgError:
+            # Tiempos repetidos dejan el sistema singular: solución de mínima norma
+            coeffs[enough] = (np.linalg.pinv(ata[enough]) @ atb[enough][:, :, None])[:, :, 0]
+
+    pred = coeffs[:, 0:1] + coeffs[:, 1:2] * t + coeffs[:, 2:3] * t ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = (x * w).sum(axis=1) / w.sum(axis=1)
+        ss_res = (((x - pred) * w) ** 2).sum(axis=1)
+        ss_tot = (((x - x_mean[:, None]) * w) ** 2).sum(axis=1)
+        r2 = np.where(enough & (ss_tot > 0), 1 - ss_res / ss_tot, np.nan)
+    return {'x0': coeffs[:, 0], 'v0': coeffs[:, 1], 'a': coeffs[:, 2] * 2, 'r2': r2}
+
+
+def analyze_arrays(raw: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Ejecuta todo el cálculo cinemático sobre un lote de experimentos.
+
+    Args:
+        raw: Matriz N x 4 con columnas t12, t23, t34, tiempo
+
+    Returns:
+        Diccionario con 'times', 'velocity', 'acceleration', 'acceleration_mean' y el ajuste ('fit_*')
+    """
+    times = sensor_times(raw)
+    velocities = segment_velocities(times)
+    accelerations = segment_accelerations(velocities)
+    fit = fit_kinematics(times)
+    result = {
+        'times': times,
+        'velocity': velocities['velocity'],
+        'acceleration': accelerations['acceleration'],
+        'acceleration_mean': accelerations['mean'],
+    }
+    result.update({f'fit_{k}': v for k, v in fit.items()})
+    return result
+
+
+# ============ ESTADÍSTICAS ACUMULADAS ============
+class RunningStats:
+    """
+    Media y desviación estándar acumuladas (Welford) que se pueden fusionar (Chan et al.),
+    de modo que los resultados por lotes se combinan de forma exacta.
+    """
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, values) -> 'RunningStats':
+        """Agrega un valor o un array de valores (se ignoran los NaN)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.merge(RunningStats(len(values), float(values.mean()), float(((values - values.mean()) ** 2).sum())))
+        return self
+
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        """Fusiona otras estadísticas acumuladas en esta."""
+        if other.count == 0:
+            return self
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        return self
+
+    @property
+    def std(self) -> float:
+        """Desviación estándar muestral (ddof=1, como pandas)."""
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else float('nan')
+
+    def to_dict(self) -> Dict[str, float]:
+        return {'count': self.count, 'mean': self.mean if self.count else float('nan'), 'std': self.std}
+
+
+def mode_statistics(modes: np.ndarray, values: np.ndarray) -> Dict[str, List[RunningStats]]:
+    """
+    Agrupa una matriz de valores (N x K) por modalidad en estadísticas acumuladas por columna.
+
+    Args:
+        modes: Array de modalidades (longitud N)
+        values: Matriz N x K (p. ej. tiempos por sensor)
+
+    Returns:
+        Diccionario modo -> lista de K RunningStats
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    stats = {}
+    for mode in np.unique(modes):
+        subset = values[modes == mode]
+        stats[mode] = [RunningStats().update(subset[:, k]) for k in range(values.shape[1])]
+    return stats
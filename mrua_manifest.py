@@ -0,0 +1,78 @@
+"""
+Manifiesto de los CSV exportados por experimento.
+export_to_csv escribe junto a los CSV un manifest.json con la suma SHA-256, el
+tamaño y el número de filas de cada fichero, y el experimento de 'history' del
+que salen (id, modalidad, fallo). check_data_integrity.py lo usa para detectar
+ficheros modificados, truncados o ausentes sin volver a calcular el análisis.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+import pandas as pd
+
+
+# ============ CONFIGURACIÓN ============
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK_BYTES = 1 << 20
+
+
+# ============ SUMAS DE CONTROL ============
+def file_checksum(path: str) -> str:
+    """SHA-256 del contenido de un fichero (leído por bloques)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(output_dir: str, rows: Dict[str, int], df: pd.DataFrame = None) -> str:
+    """
+    Escribe el manifiesto de una carpeta de CSV.
+
+    Args:
+        output_dir: Carpeta de los CSV
+        rows: Nombre de fichero -> filas escritas (sin cabecera)
+        df: Datos de sensores exportados; si son de un único experimento se
+            registra su id, modalidad y fallo para verificarlo contra 'history'
+
+    Returns:
+        Ruta del manifiesto
+    """
+    experiment = None
+    if df is not None and not df.empty and df['experiment_id'].nunique() == 1:
+        first = df.iloc[0]
+        experiment = {'id': str(first['experiment_id']), 'mode': first['mode'], 'failed': bool(first['failed'])}
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'written_at': datetime.now().isoformat(),
+        'experiment': experiment,
+        'files': {
+            name: {
+                'sha256': file_checksum(os.path.join(output_dir, name)),
+                'bytes': os.path.getsize(os.path.join(output_dir, name)),
+                'rows': int(count),
+            }
+            for name, count in rows.items()
+        },
+    }
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_manifest(output_dir: str) -> Optional[Dict]:
+    """Manifiesto de una carpeta (None si no existe o no se puede leer)."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
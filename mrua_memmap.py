@@ -0,0 +1,235 @@
+"""
+Archivo binario de matrices de tiempos para np.memmap.
+Guarda una sola vez los tiempos de todos los experimentos en columnas de ancho fijo
+(matriz float32 N x 4 con t12, t23, t34 y tiempo, códigos de modo int8, indicador
+de fallo, fecha en milisegundos int64 y tabla de ids) junto a una cabecera JSON.
+Al abrirlo con np.memmap cualquier etapa obtiene vistas sin copia de millones de
+experimentos casi al instante, y varios procesos que lo abran comparten las mismas
+páginas en memoria en lugar de duplicar los datos.
+
+Uso:
+    python mrua_memmap.py build                  # Construir desde MongoDB
+    python mrua_memmap.py build --source mirror  # Construir desde el espejo SQLite
+    python mrua_memmap.py build --workers 8      # Leer MongoDB por rangos de fecha en paralelo
+    python mrua_memmap.py info                   # Resumen del archivo
+"""
+
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+import pymongo
+
+from mrua_aggregates import ACTIVE_FILTER, HISTORY_PROJECTION
+from mrua_kinematics import MODES, TIME_FIELDS, documents_to_arrays
+from mrua_mirror import MIRROR_PATH, load_mirror_arrays
+from parallel_extract import iter_ranges
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "analysis_output", "timings_archive")
+FORMAT_VERSION = 1
+ID_WIDTH = 32            # Bytes por id (Date.now() o 'sim_<modo>_<n>')
+BATCH_SIZE = 50000
+NAT_MS = np.iinfo(np.int64).min  # Fecha ausente o inválida (mismo valor que NaT en datetime64)
+
+# Archivo y tipo de cada columna; la forma la da la cabecera
+COLUMN_FILES = {
+    'timings': ('timings.f32', np.float32),
+    'mode_code': ('modes.i8', np.int8),
+    'failed': ('failed.i8', np.int8),
+    'fecha_ms': ('fecha.i64', np.int64),
+    'id': ('ids.bin', f'S{ID_WIDTH}'),
+}
+
+
+# ============ ESCRITURA ============
+def _encode_batch(arrays: Dict[str, np.ndarray], modes: list) -> Dict[str, np.ndarray]:
+    """Convierte un lote de documents_to_arrays a las columnas de ancho fijo."""
+    for mode in arrays['mode']:
+        if mode not in modes:
+            modes.append(mode)
+    codes = {mode: code for code, mode in enumerate(modes)}
+
+    fechas = pd.to_datetime(pd.Series(arrays['fecha']), errors='coerce', utc=True, format='mixed')
+    ms = (fechas - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy() * 1000
+    ids = arrays['id'].astype(str)
+    if len(ids) and max(len(i.encode('utf-8')) for i in ids) > ID_WIDTH:
+        raise ValueError(f"Hay ids de mas de {ID_WIDTH} bytes; aumente ID_WIDTH")
+
+    return {
+        'timings': arrays['raw'].astype(np.float32),
+        'mode_code': np.array([codes[m] for m in arrays['mode']], dtype=np.int8),
+        'failed': arrays['failed'].astype(np.int8),
+        'fecha_ms': np.where(np.isnan(ms), NAT_MS, np.round(ms)).astype(np.int64),
+        'id': np.char.encode(ids, 'utf-8').astype(f'S{ID_WIDTH}'),
+    }
+
+
+def write_archive(batches: Iterable[Dict[str, np.ndarray]], path: str = ARCHIVE_DIR,
+                  source: str = COLLECTION_NAME) -> Dict:
+    """
+    Escribe el archivo binario por lotes (añadiendo al final de cada columna), de modo
+    que no hace falta tener toda la colección en memoria. Se escribe en un directorio
+    temporal y se reemplaza el anterior al terminar.
+
+    Args:
+        batches: Lotes con el formato de documents_to_arrays
+        path: Directorio del archivo
+        source: Origen de los datos (se guarda en la cabecera)
+
+    Returns:
+        Cabecera escrita
+    """
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    modes = list(MODES)
+    n = 0
+    handles = {key: open(os.path.join(tmp_path, name), 'wb') for key, (name, _) in COLUMN_FILES.items()}
+    try:
+        for arrays in batches:
+            if len(arrays['id']) == 0:
+                continue
+            for key, column in _encode_batch(arrays, modes).items():
+                handles[key].write(np.ascontiguousarray(column).tobytes())
+            n += len(arrays['id'])
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    header = {
+        'version': FORMAT_VERSION,
+        'count': n,
+        'time_fields': TIME_FIELDS,
+        'modes': modes,
+        'id_width': ID_WIDTH,
+        'nat_ms': int(NAT_MS),
+        'source': source,
+        'created_at': datetime.now().isoformat(),
+    }
+    with open(os.path.join(tmp_path, 'header.json'), 'w', encoding='utf-8') as f:
+        json.dump(header, f, indent=2)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return header
+
+
+def mongo_batches(db: pymongo.database.Database, batch_size: int = BATCH_SIZE):
+    """Lee 'history' con proyección (más recientes primero) en lotes de arrays."""
+    cursor = db[COLLECTION_NAME].find(ACTIVE_FILTER, HISTORY_PROJECTION, batch_size=batch_size).sort('fecha', -1)
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield documents_to_arrays(batch)
+            batch = []
+    if batch:
+        yield documents_to_arrays(batch)
+
+
+# ============ LECTURA ============
+def open_archive(path: str = ARCHIVE_DIR, mode: str = 'r') -> Dict[str, object]:
+    """
+    Abre el archivo como vistas np.memmap (no se lee nada hasta que se accede a los datos).
+
+    Args:
+        path: Directorio del archivo
+        mode: Modo de np.memmap ('r' solo lectura, 'c' copia al escribir)
+
+    Returns:
+        Diccionario con 'header' y las columnas 'timings' (N x 4), 'mode_code', 'failed',
+        'fecha_ms' e 'id'
+    """
+    header_path = os.path.join(path, 'header.json')
+    if not os.path.exists(header_path):
+        raise FileNotFoundError(f"No existe el archivo binario {path} (ejecute 'python mrua_memmap.py build')")
+    with open(header_path, encoding='utf-8') as f:
+        header = json.load(f)
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f"Version de formato {header['version']} no soportada")
+
+    n = header['count']
+    archive = {'header': header}
+    for key, (name, dtype) in COLUMN_FILES.items():
+        if key == 'id':
+            dtype = f"S{header['id_width']}"
+        shape = (n, len(header['time_fields'])) if key == 'timings' else (n,)
+        # np.memmap no admite archivos vacíos
+        archive[key] = np.memmap(os.path.join(path, name), dtype=dtype, mode=mode, shape=shape) if n else np.empty(shape, dtype)
+    return archive
+
+
+def archive_to_arrays(archive: Dict[str, object], rows=slice(None)) -> Dict[str, np.ndarray]:
+    """
+    Devuelve (una parte de) el archivo con las claves de documents_to_arrays para
+    reutilizar mrua_kinematics, mrua_validation, etc. Con un slice son vistas sin copia
+    del memmap: 'raw' float32, 'fecha' datetime64[ms] (NAT_MS es NaT), 'failed' bool e
+    'id'/'_id' bytes de ancho fijo. Solo 'mode' se materializa (indexado de la tabla de
+    modos). Quien necesite textos u objetos los convierte (np.char.decode, pd.to_datetime).
+
+    Args:
+        archive: Resultado de open_archive
+        rows: Selección de filas (slice, máscara o índices)
+    """
+    modes = np.array(archive['header']['modes'], dtype=object)
+    ids = np.asarray(archive['id'][rows])
+    return {
+        '_id': ids,
+        'id': ids,
+        'mode': modes[np.asarray(archive['mode_code'][rows])],
+        'failed': np.asarray(archive['failed'][rows]).view(np.bool_),
+        'fecha': np.asarray(archive['fecha_ms'][rows]).view('datetime64[ms]'),
+        'raw': np.asarray(archive['timings'][rows]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archivo binario de tiempos para np.memmap")
+    parser.add_argument('command', choices=['build', 'info'], nargs='?', default='info')
+    parser.add_argument('--source', choices=['mongo', 'mirror'], default='mongo')
+    parser.add_argument('--path', default=ARCHIVE_DIR, help="Directorio del archivo")
+    parser.add_argument('--workers', type=int, default=1, help="Hilos de lectura de MongoDB (parallel_extract.py)")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = datetime.now()
+        if args.source == 'mirror':
+            header = write_archive([load_mirror_arrays(MIRROR_PATH)], args.path, source=MIRROR_PATH)
+        else:
+            try:
+                client = pymongo.MongoClient(MONGODB_URI)
+                db = client[DATABASE_NAME]
+                client.admin.command('ping')
+            except Exception as e:
+                print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+                return
+            batches = iter_ranges(db, 'fecha', args.workers) if args.workers > 1 else mongo_batches(db)
+            header = write_archive(batches, args.path)
+        elapsed = (datetime.now() - start).total_seconds()
+        print(f"[OK] Archivo binario escrito en {elapsed:.2f} s: {header['count']} experimentos en {args.path}")
+        return
+
+    start = datetime.now()
+    archive = open_archive(args.path)
+    elapsed = (datetime.now() - start).total_seconds() * 1000
+    header = archive['header']
+    size = sum(os.path.getsize(os.path.join(args.path, name)) for name, _ in COLUMN_FILES.values())
+    print(f"[OK] {header['count']} experimentos ({size / 1e6:.1f} MB), abierto en {elapsed:.1f} ms")
+    print(f"   Origen: {header['source']} ({header['created_at']})")
+    codes, counts = np.unique(archive['mode_code'], return_counts=True)
+    for code, count in zip(codes, counts):
+        print(f"   - {header['modes'][code]}: {count} experimentos")
+
+
+if __name__ == "__main__":
+    main()
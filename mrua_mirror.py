@@ -0,0 +1,309 @@
+"""
+Espejo analítico local de 'history' en SQLite.
+Copia los experimentos activos (proyectados, con columnas tipadas) a un archivo
+SQLite con índices por fecha, modo e id, de modo que los análisis repetidos se
+ejecuten sin servidor de base de datos. La sincronización es incremental: solo se
+piden a MongoDB los documentos con fecha >= a la más reciente del espejo y los
+corregidos después de la última sincronización ('updated_at', que escribe
+mrua_aggregates.correct_experiment); si el número de documentos activos no coincide
+(bajas, duplicados marcados, cuarentena) se reconcilian los _id sin volver a
+transferir los documentos completos.
+
+Uso:
+    python mrua_mirror.py sync            # Sincronización incremental
+    python mrua_mirror.py sync --full     # Reconstruir el espejo desde cero
+    python mrua_mirror.py info            # Resumen del espejo
+"""
+
+import argparse
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+
+import numpy as np
+import pymongo
+
+from mrua_aggregates import ACTIVE_FILTER
+from mrua_kinematics import TIME_FIELDS
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+MIRROR_PATH = os.path.join(os.path.dirname(__file__), "analysis_output", "history_mirror.sqlite")
+BATCH_SIZE = 5000
+
+# Campos adicionales que se conservan para save_raw_data_to_mongodb
+EXTRA_FIELDS = ['distancia', 'velocidad', 'aceleracion', 'v12', 'v23', 'v34']
+REAL_FIELDS = TIME_FIELDS + EXTRA_FIELDS
+MIRROR_PROJECTION = {'_id': 1, 'id': 1, 'mode': 1, 'failed': 1, 'fecha': 1, 'is_simulated': 1,
+                     **{f: 1 for f in REAL_FIELDS}}
+COLUMNS = ['_id', 'id', 'mode', 'failed', 'fecha', 'is_simulated'] + REAL_FIELDS
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS history (
+    _id PRIMARY KEY,
+    id,
+    mode TEXT,
+    failed INTEGER,
+    fecha TEXT,
+    is_simulated INTEGER,
+    {', '.join(f'{field} REAL' for field in REAL_FIELDS)}
+);
+CREATE INDEX IF NOT EXISTS history_fecha ON history (fecha);
+CREATE INDEX IF NOT EXISTS history_mode_fecha ON history (mode, fecha);
+CREATE INDEX IF NOT EXISTS history_id ON history (id);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+# ============ CONVERSIÓN ============
+def _key(value):
+    """Clave primaria en SQLite: enteros y textos tal cual, el resto (ObjectId) como texto."""
+    return value if isinstance(value, (int, str)) and not isinstance(value, bool) else str(value)
+
+
+def _real(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_row(doc: dict) -> tuple:
+    fecha = doc.get('fecha')
+    if isinstance(fecha, datetime):
+        fecha = fecha.isoformat()
+    return (
+        _key(doc['_id']),
+        _key(doc['id']) if doc.get('id') is not None else None,
+        doc.get('mode'),
+        int(bool(doc['failed'])) if 'failed' in doc else None,
+        str(fecha) if fecha is not None else None,
+        int(bool(doc['is_simulated'])) if 'is_simulated' in doc else None,
+        *[_real(doc.get(field)) for field in REAL_FIELDS],
+    )
+
+
+def _to_doc(row: tuple) -> dict:
+    """Reconstruye el documento de 'history' (sin los campos nulos, como en MongoDB)."""
+    doc = {column: value for column, value in zip(COLUMNS, row) if value is not None}
+    for flag in ('failed', 'is_simulated'):
+        if flag in doc:
+            doc[flag] = bool(doc[flag])
+    return doc
+
+
+# ============ ESPEJO ============
+def open_mirror(path: str = MIRROR_PATH) -> sqlite3.Connection:
+    """Abre (o crea) el archivo del espejo con su esquema e índices."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _upsert(conn: sqlite3.Connection, docs: Iterable[dict], batch_size: int = BATCH_SIZE) -> int:
+    placeholders = ', '.join('?' for _ in COLUMNS)
+    sql = f"INSERT OR REPLACE INTO history ({', '.join(COLUMNS)}) VALUES ({placeholders})"
+    total, batch = 0, []
+    for doc in docs:
+        batch.append(_to_row(doc))
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+def _reconcile(conn: sqlite3.Connection, collection, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Iguala el conjunto de _id del espejo con los documentos activos de MongoDB."""
+    remote = {_key(doc['_id']): doc['_id'] for doc in collection.find(ACTIVE_FILTER, {'_id': 1}, batch_size=batch_size)}
+    local = {row[0] for row in conn.execute('SELECT _id FROM history')}
+    stale = list(local - set(remote))
+    missing = [remote[key] for key in set(remote) - local]
+    for start in range(0, len(stale), batch_size):
+        chunk = stale[start:start + batch_size]
+        conn.execute(f"DELETE FROM history WHERE _id IN ({', '.join('?' for _ in chunk)})", chunk)
+    added = 0
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        added += _upsert(conn, collection.find({'_id': {'$in': chunk}}, MIRROR_PROJECTION))
+    return {'removed': len(stale), 'added': added}
+
+
+def _meta(conn: sqlite3.Connection, key: str):
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _last_update(collection):
+    """'updated_at' más reciente de 'history' (None si ningún documento se ha corregido)."""
+    doc = collection.find_one({'updated_at': {'$exists': True}}, {'updated_at': 1}, sort=[('updated_at', -1)])
+    return doc['updated_at'] if doc else None
+
+
+def sync_mirror(db: pymongo.database.Database, path: str = MIRROR_PATH, full: bool = False,
+                batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Sincroniza el espejo con 'history'.
+
+    Args:
+        db: Objeto Database de MongoDB
+        path: Ruta del archivo SQLite
+        full: Si es True, vacía el espejo y lo copia completo
+        batch_size: Documentos por lote de lectura y de escritura
+
+    Returns:
+        Resumen con documentos copiados, corregidos, añadidos y eliminados en la
+        reconciliación y total
+    """
+    collection = db[COLLECTION_NAME]
+    conn = open_mirror(path)
+    try:
+        if full:
+            conn.execute('DELETE FROM history')
+            conn.execute("DELETE FROM meta WHERE key = 'updated_at'")
+        # Antes de copiar: una corrección durante la sincronización se vuelve a pedir la próxima vez
+        newest_update = _last_update(collection)
+        last_update = _meta(conn, 'updated_at')
+        watermark = conn.execute('SELECT MAX(fecha) FROM history').fetchone()[0]
+        query = dict(ACTIVE_FILTER)
+        if watermark is not None:
+            # $gte: los documentos con la misma fecha que la marca se vuelven a copiar (upsert idempotente)
+            query['fecha'] = {'$gte': watermark}
+        cursor = collection.find(query, MIRROR_PROJECTION, batch_size=batch_size).sort('fecha', 1)
+        summary = {'copied': _upsert(conn, cursor, batch_size), 'added': 0, 'removed': 0}
+
+        corrected = {'$gt': datetime.fromisoformat(last_update)} if last_update else {'$exists': True}
+        cursor = collection.find({**ACTIVE_FILTER, 'updated_at': corrected}, MIRROR_PROJECTION, batch_size=batch_size)
+        summary['corrected'] = _upsert(conn, cursor, batch_size)
+        if newest_update is not None:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('updated_at', ?)", (newest_update.isoformat(),))
+
+        local_count = conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+        if collection.count_documents(ACTIVE_FILTER) != local_count:
+            summary.update(_reconcile(conn, collection, batch_size))
+        summary['total'] = conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('last_sync', ?)", (datetime.now().isoformat(),))
+        conn.commit()
+    finally:
+        conn.close()
+    return summary
+
+
+# ============ LECTURA ============
+def iter_mirror_experiments(path: str = MIRROR_PATH, batch_size: int = BATCH_SIZE) -> Iterator[dict]:
+    """
+    Recorre los experimentos del espejo con el mismo orden que extract_experiments
+    (más recientes primero) leyendo batch_size filas cada vez.
+
+    Yields:
+        Documentos con el formato de 'history'
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe el espejo {path} (ejecute 'python mrua_mirror.py sync')")
+    conn = sqlite3.connect(path)
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM history ORDER BY fecha DESC")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _to_doc(row)
+    finally:
+        conn.close()
+
+
+def load_mirror_experiments(path: str = MIRROR_PATH) -> List[dict]:
+    """
+    Lee los experimentos del espejo con el mismo orden que extract_experiments (más recientes primero).
+
+    Returns:
+        Lista de documentos con el formato de 'history'
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe el espejo {path} (ejecute 'python mrua_mirror.py sync')")
+    return list(iter_mirror_experiments(path))
+
+
+def load_mirror_arrays(path: str = MIRROR_PATH) -> Dict[str, np.ndarray]:
+    """
+    Lee el espejo directamente en arrays columnares (mismo formato que documents_to_arrays),
+    sin construir documentos intermedios.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No existe el espejo {path} (ejecute 'python mrua_mirror.py sync')")
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            f"SELECT _id, CAST(COALESCE(id, _id) AS TEXT), COALESCE(mode, 'remote'), COALESCE(failed, 0), fecha, "
+            f"{', '.join(TIME_FIELDS)} FROM history ORDER BY fecha DESC"
+        ).fetchall()
+    finally:
+        conn.close()
+    columns = list(zip(*rows)) if rows else [()] * (5 + len(TIME_FIELDS))
+    return {
+        '_id': np.array(columns[0], dtype=object),
+        'id': np.array(columns[1], dtype=object),
+        'mode': np.array(columns[2], dtype=object),
+        'failed': np.array(columns[3], dtype=bool),
+        'fecha': np.array(columns[4], dtype=object),
+        'raw': np.array(columns[5:], dtype=np.float64).T.reshape(-1, len(TIME_FIELDS)),
+    }
+
+
+def mirror_info(path: str = MIRROR_PATH) -> Dict[str, object]:
+    """Número de experimentos por modo, rango de fechas y última sincronización del espejo."""
+    conn = open_mirror(path)
+    try:
+        by_mode = dict(conn.execute('SELECT mode, COUNT(*) FROM history GROUP BY mode').fetchall())
+        oldest, newest = conn.execute('SELECT MIN(fecha), MAX(fecha) FROM history').fetchone()
+        last_sync = conn.execute("SELECT value FROM meta WHERE key = 'last_sync'").fetchone()
+    finally:
+        conn.close()
+    return {'by_mode': by_mode, 'oldest': oldest, 'newest': newest,
+            'last_sync': last_sync[0] if last_sync else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Espejo SQLite de la coleccion history")
+    parser.add_argument('command', choices=['sync', 'info'], nargs='?', default='sync')
+    parser.add_argument('--full', action='store_true', help="Reconstruir el espejo desde cero")
+    parser.add_argument('--path', default=MIRROR_PATH, help="Archivo SQLite del espejo")
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        info = mirror_info(args.path)
+        print(f"[OK] Espejo: {args.path}")
+        for mode, count in info['by_mode'].items():
+            print(f"   - {mode}: {count} experimentos")
+        print(f"   Rango de fechas: {info['oldest']} a {info['newest']}")
+        print(f"   Ultima sincronizacion: {info['last_sync']}")
+        return
+
+    try:
+        client = pymongo.MongoClient(MONGODB_URI)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+
+    start = datetime.now()
+    summary = sync_mirror(db, args.path, full=args.full)
+    elapsed = (datetime.now() - start).total_seconds()
+    print(f"[OK] Espejo sincronizado en {elapsed:.2f} s: {summary['copied']} copiados, "
+          f"{summary['corrected']} corregidos, {summary['added']} añadidos y {summary['removed']} eliminados en la reconciliacion")
+    print(f"[OK] {summary['total']} experimentos en {args.path}")
+
+
+if __name__ == "__main__":
+    main()
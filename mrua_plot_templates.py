@@ -0,0 +1,455 @@
+"""
+Motor de gráficas por experimento con plantillas reutilizables.
+Cada una de las cinco gráficas de analyze_mrua_experiments (tiempo vs sensor, error
+relativo, velocidad vs posición, aceleración y experimental vs teórico) se construye
+una sola vez por hilo/proceso: figura, ejes, estilos, títulos y leyenda. Para cada
+experimento solo se actualizan los datos de los artistas y los límites de los ejes
+y se guarda la figura. Las figuras usan directamente el lienzo Agg (sin pyplot ni
+backend interactivo) y tienen márgenes fijos, por lo que no se recalcula
+tight_layout ni el recorte 'tight' en cada guardado.
+Medido con --benchmark 20 a 300 dpi: 170-200 ms por figura frente a 580-630 ms de las
+funciones plot_* originales (unas 3 veces más rápido, a cambio de PNG 1.6 veces más
+grandes: 199 kB frente a 128 kB); de ese tiempo, la mitad es el dibujo con Agg y la
+otra mitad la compresión.
+
+Uso:
+    python mrua_plot_templates.py --benchmark 50                # Comparar con las funciones plot_* originales
+    python mrua_plot_templates.py --benchmark 50 --tier draft   # Idem con el nivel borrador
+"""
+
+import argparse
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from matplotlib import cbook
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.path import Path
+from PIL import Image
+
+
+# ============ CONFIGURACIÓN ============
+DEFAULT_DPI = 300
+FIGSIZE = (10, 6)
+MARGINS = {'left': 0.08, 'right': 0.97, 'bottom': 0.1, 'top': 0.92}
+AXIS_MARGIN = 0.05
+MODE_STYLES = {
+    'remote': {'label': 'Remoto', 'marker': 'o', 'color': 'C0'},
+    'presential': {'label': 'Presencial', 'marker': 's', 'color': 'C1'},
+}
+BOX_WIDTH = 0.6
+# La codificación PNG domina el tiempo de guardado a 300 dpi: se codifica en RGB
+# (el fondo es opaco, el canal alfa no aporta nada), sin filtro por fila y con zlib
+# nivel 1 (unas 2 veces más rápido que el codificador de Pillow; tamaño en la cabecera)
+PNG_COMPRESS_LEVEL = 1
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Niveles de render: el borrador se genera durante el análisis (72 dpi, PNG con paleta
+# de 64 colores, unas 13 veces menos bytes) y la resolución completa bajo demanda
+# (ver mrua_render.py)
+DRAFT_DPI = 72
+DRAFT_COLORS = 64
+DRAFT_COMPRESS_LEVEL = 6  # A 72 dpi la imagen es pequeña y comprimir más apenas cuesta
+TIERS = {
+    'draft': {'dpi': DRAFT_DPI, 'colors': DRAFT_COLORS},
+    'full': {'dpi': DEFAULT_DPI, 'colors': None},
+}
+
+
+# ============ UTILIDADES ============
+def _new_figure():
+    fig = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    fig.subplots_adjust(**MARGINS)
+    return fig, ax
+
+
+def _style(ax, xlabel: str, ylabel: str, title: str, grid_axis: str = 'both'):
+    if xlabel:
+        ax.set_xlabel(xlabel, fontsize=12)
+    ax.set_ylabel(ylabel, fontsize=12)
+    ax.set_title(title, fontsize=14, fontweight='bold')
+    ax.grid(True, alpha=0.3, axis=grid_axis)
+
+
+def _limits(values: List[np.ndarray], include_zero: bool = False):
+    """Rango (min, max) de los valores finitos con un margen relativo; None si no hay datos."""
+    finite = np.concatenate([np.asarray(v, dtype=np.float64).ravel() for v in values] or [np.array([])])
+    finite = finite[np.isfinite(finite)]
+    if include_zero:
+        finite = np.append(finite, 0.0)
+    if len(finite) == 0:
+        return None
+    lo, hi = finite.min(), finite.max()
+    span = (hi - lo) or abs(hi) or 1.0
+    return lo - AXIS_MARGIN * span, hi + AXIS_MARGIN * span
+
+
+def _set_limits(ax, xs: List[np.ndarray], ys: List[np.ndarray], include_zero_y: bool = False):
+    xlim, ylim = _limits(xs), _limits(ys, include_zero_y)
+    if xlim:
+        ax.set_xlim(*xlim)
+    if ylim:
+        ax.set_ylim(*ylim)
+
+
+def _mode_style(mode: str, index: int) -> Dict[str, str]:
+    return MODE_STYLES.get(mode, {'label': str(mode).capitalize(), 'marker': 'D', 'color': f'C{index + 2}'})
+
+
+# ============ PLANTILLAS ============
+class TimeVsSensorTemplate:
+    """Tiempo de paso vs número de sensor (remoto vs presencial) con barras de error."""
+
+    def __init__(self):
+        self.fig, self.ax = _new_figure()
+        self.series = {}
+        for mode, style in MODE_STYLES.items():
+            self.series[mode] = self.ax.errorbar(
+                [1, 2, 3, 4], [0, 0, 0, 0], yerr=[0, 0, 0, 0], marker=style['marker'], linestyle='--',
+                label=style['label'], color=style['color'], capsize=5, capthick=2
+            )
+        _style(self.ax, 'Número de Sensor', 'Tiempo de Paso (s)', 'Tiempo de Paso vs Sensor: Remoto vs Presencial')
+        self.ax.legend(loc='upper left')
+
+    def update(self, stats: Dict[str, pd.DataFrame]):
+        xs, ys = [], []
+        for mode, container in self.series.items():
+            data = stats[mode]
+            x = data['sensor_id'].to_numpy(dtype=np.float64)
+            y = data['time_mean'].to_numpy(dtype=np.float64)
+            err = data['time_std'].to_numpy(dtype=np.float64)
+            line, caps, bars = container.lines
+            line.set_data(x, y)
+            caps[0].set_data(x, y - err)
+            caps[1].set_data(x, y + err)
+            bars[0].set_segments([[(xi, lo), (xi, hi)] for xi, lo, hi in zip(x, y - err, y + err)])
+            xs.append(x)
+            ys.extend([y, y - err, y + err])
+        _set_limits(self.ax, xs, ys)
+
+
+class RelativeErrorTemplate:
+    """Error relativo (%) por sensor, con una barra y una anotación por sensor."""
+
+    SENSORS = [1, 2, 3, 4]
+
+    def __init__(self):
+        self.fig, self.ax = _new_figure()
+        self.bars = self.ax.bar(self.SENSORS, [0] * 4, color='green', alpha=0.7, edgecolor='black', linewidth=1.5)
+        self.labels = [self.ax.text(s, 0, '', ha='center') for s in self.SENSORS]
+        self.ax.axhline(y=0, color='black', linestyle='-', linewidth=1)
+        _style(self.ax, 'Número de Sensor', 'Error Relativo (%)',
+               'Error Relativo entre Modalidad Remota y Presencial', grid_axis='y')
+        self.ax.set_xlim(0.4, 4.6)
+
+    def update(self, stats: Dict[str, pd.DataFrame]):
+        comparison = stats['comparison']
+        errors = dict(zip(comparison['sensor_id'], comparison['error_relativo_pct']))
+        for sensor, bar, label in zip(self.SENSORS, self.bars, self.labels):
+            error = errors.get(sensor)
+            visible = error is not None
+            bar.set_visible(visible)
+            label.set_visible(visible)
+            if not visible:
+                continue
+            bar.set_height(error)
+            bar.set_facecolor('red' if error < 0 else 'green')
+            label.set_position((sensor, error))
+            label.set_text(f'{error:.2f}%')
+            label.set_verticalalignment('bottom' if error > 0 else 'top')
+        _set_limits(self.ax, [], [np.array(list(errors.values()), dtype=np.float64)], include_zero_y=True)
+
+
+class VelocityVsPositionTemplate:
+    """Velocidad promedio vs posición del sensor."""
+
+    def __init__(self):
+        self.fig, self.ax = _new_figure()
+        self.lines = {
+            mode: self.ax.plot([], [], marker=style['marker'], linestyle='--', label=style['label'],
+                               color=style['color'], linewidth=2, markersize=8)[0]
+            for mode, style in MODE_STYLES.items()
+        }
+        _style(self.ax, 'Posición del Sensor (cm)', 'Velocidad Promedio (m/s)', 'Velocidad Promedio vs Posición del Sensor')
+        self.ax.legend(loc='upper left')
+
+    def update(self, velocities_df: pd.DataFrame):
+        velocity_stats = velocities_df.groupby(['position_cm', 'mode'])['velocity_ms'].mean().reset_index()
+        xs, ys = [], []
+        for mode, line in self.lines.items():
+            data = velocity_stats[velocity_stats['mode'] == mode]
+            line.set_data(data['position_cm'], data['velocity_ms'])
+            xs.append(data['position_cm'].to_numpy(dtype=np.float64))
+            ys.append(data['velocity_ms'].to_numpy(dtype=np.float64))
+        _set_limits(self.ax, xs, ys)
+
+
+class AccelerationComparisonTemplate:
+    """Distribución de la aceleración por modalidad (boxplot actualizado con boxplot_stats)."""
+
+    def __init__(self):
+        self.fig, self.ax = _new_figure()
+        self.bp = self.ax.boxplot([[0.0, 1.0], [0.0, 1.0]], patch_artist=True, widths=BOX_WIDTH)
+        self.ax.set_xticks([1, 2], [MODE_STYLES['remote']['label'], MODE_STYLES['presential']['label']])
+        for patch, color in zip(self.bp['boxes'], ['lightblue', 'lightgreen']):
+            patch.set_facecolor(color)
+            patch.set_alpha(0.7)
+        self.means = [self.ax.text(i + 1, 0, '', ha='center', va='bottom', fontweight='bold') for i in range(2)]
+        _style(self.ax, None, 'Aceleración (m/s²)', 'Distribución de Aceleración: Remoto vs Presencial', grid_axis='y')
+        self.ax.set_xlim(0.5, 2.5)
+
+    def update(self, accelerations_df: pd.DataFrame):
+        ys = []
+        half_box, half_cap = BOX_WIDTH / 2, BOX_WIDTH / 4
+        for i, mode in enumerate(['remote', 'presential']):
+            data = accelerations_df.loc[accelerations_df['mode'] == mode, 'acceleration_ms2'].dropna().to_numpy()
+            pos = i + 1
+            if len(data):
+                s = cbook.boxplot_stats(data)[0]
+                q1, med, q3, lo, hi, fliers = s['q1'], s['med'], s['q3'], s['whislo'], s['whishi'], s['fliers']
+            else:
+                q1 = med = q3 = lo = hi = np.nan
+                fliers = np.array([])
+            self.bp['boxes'][i].set_path(Path(
+                [(pos - half_box, q1), (pos + half_box, q1), (pos + half_box, q3), (pos - half_box, q3), (pos - half_box, q1)],
+                closed=True))
+            self.bp['medians'][i].set_data([pos - half_box, pos + half_box], [med, med])
+            self.bp['whiskers'][2 * i].set_data([pos, pos], [q1, lo])
+            self.bp['whiskers'][2 * i + 1].set_data([pos, pos], [q3, hi])
+            self.bp['caps'][2 * i].set_data([pos - half_cap, pos + half_cap], [lo, lo])
+            self.bp['caps'][2 * i + 1].set_data([pos - half_cap, pos + half_cap], [hi, hi])
+            self.bp['fliers'][i].set_data(np.full(len(fliers), pos), fliers)
+            mean_val = data.mean() if len(data) else np.nan
+            self.means[i].set_position((pos, mean_val))
+            self.means[i].set_text(f'μ={mean_val:.3f}')
+            ys.extend([np.array([lo, hi, mean_val]), np.asarray(fliers, dtype=np.float64)])
+        _set_limits(self.ax, [], ys)
+
+
+class ExperimentalVsTheoreticalTemplate:
+    """Puntos experimentales y curva teórica x = ½·a·t² por modalidad."""
+
+    def __init__(self):
+        self.fig, self.ax = _new_figure()
+        self.series = {}
+        _style(self.ax, 'Tiempo (s)', 'Distancia (cm)', 'Comparación Experimental vs Modelo Teórico MRUA')
+
+    def _artists(self, mode: str):
+        if mode not in self.series:
+            style = _mode_style(mode, len(self.series))
+            line = self.ax.plot([], [], linestyle='--', linewidth=2, color=style['color'])[0]
+            points = self.ax.scatter([], [], marker=style['marker'], s=100, alpha=0.7, color=style['color'],
+                                     edgecolors='black', linewidths=1.5)
+            self.series[mode] = (line, points)
+        return self.series[mode]
+
+    def update(self, df: pd.DataFrame):
+        for line, points in self.series.values():
+            line.set_visible(False)
+            points.set_visible(False)
+        handles, xs, ys = [], [], []
+        for mode, mode_data in df.groupby('mode', sort=False):
+
+            # Mismo ajuste que plot_experimental_vs_theoretical
+            accelerations = []
+            for _, exp_data in mode_data.groupby('experiment_id', sort=False):
+                exp_data = exp_data.sort_values('sensor_id')
+                if len(exp_data) >= 2:
+                    coeffs = np.polyfit(exp_data['time_s'].values, exp_data['distance_cm'].values / 100.0, 2)
+                    accelerations.append(coeffs[0] * 2)
+            if not accelerations:
+                continue
+            a_mean = np.mean(accelerations)
+            t_theoretical = np.linspace(0, mode_data['time_s'].max(), 100)
+            x_theoretical = 0.5 * a_mean * t_theoretical ** 2 * 100
+            exp_grouped = mode_data.groupby('time_s')['distance_cm'].mean()
+
+            line, points = self._artists(mode)
+            line.set_data(t_theoretical, x_theoretical)
+            line.set_label(f'{mode.capitalize()} - Teórico (a={a_mean:.3f} m/s²)')
+            points.set_offsets(np.column_stack([exp_grouped.index.to_numpy(dtype=np.float64), exp_grouped.values]))
+            points.set_label(f'{mode.capitalize()} - Experimental')
+            line.set_visible(True)
+            points.set_visible(True)
+            handles.extend([line, points])
+            xs.extend([t_theoretical, exp_grouped.index.to_numpy(dtype=np.float64)])
+            ys.extend([x_theoretical, exp_grouped.to_numpy(dtype=np.float64)])
+        # La leyenda depende de los modos presentes y de la aceleración: se regenera
+        self.ax.legend(handles=handles, loc='upper left')
+        _set_limits(self.ax, xs, ys)
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack('!I', len(data)) + tag + data + struct.pack('!I', zlib.crc32(tag + data))
+
+
+def write_png_rgb(output_path: str, rgba: np.ndarray, dpi: int):
+    """
+    Escribe un búfer RGBA (alto x ancho x 4) como PNG RGB de 8 bits sin filtro por fila:
+    las filas se montan con numpy y se comprimen con una sola llamada a zlib.
+    """
+    height, width, _ = rgba.shape
+    rows = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 0] = 0  # Filtro 'None'
+    rows[:, 1:].reshape(height, width, 3)[:] = rgba[:, :, :3]
+    pixels_per_meter = round(dpi / 0.0254)
+    with open(output_path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        f.write(_png_chunk(b'IHDR', struct.pack('!IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(_png_chunk(b'pHYs', struct.pack('!IIB', pixels_per_meter, pixels_per_meter, 1)))
+        f.write(_png_chunk(b'IDAT', zlib.compress(rows, PNG_COMPRESS_LEVEL)))
+        f.write(_png_chunk(b'IEND', b''))
+
+
+def _save_png(fig: Figure, output_path: str, dpi: int, colors: int = None):
+    """Dibuja la figura con Agg y guarda el búfer como PNG RGB (o con paleta si se indica colors)."""
+    if fig.dpi != dpi:
+        fig.set_dpi(dpi)
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    if colors:
+        image = Image.fromarray(rgba[:, :, :3]).quantize(colors, method=Image.Quantize.FASTOCTREE)
+        image.save(output_path, compress_level=DRAFT_COMPRESS_LEVEL, dpi=(dpi, dpi))
+    else:
+        write_png_rgb(output_path, rgba, dpi)
+
+
+TEMPLATES = {
+    'time_vs_sensor': TimeVsSensorTemplate,
+    'relative_error': RelativeErrorTemplate,
+    'velocity_vs_position': VelocityVsPositionTemplate,
+    'acceleration_comparison': AccelerationComparisonTemplate,
+    'experimental_vs_theoretical': ExperimentalVsTheoreticalTemplate,
+}
+
+# Una instancia de cada plantilla por hilo (y por tanto por proceso del pool de render)
+_local = threading.local()
+
+
+def get_template(kind: str):
+    """Devuelve la plantilla del hilo actual, creándola la primera vez."""
+    templates = getattr(_local, 'templates', None)
+    if templates is None:
+        templates = _local.templates = {}
+    if kind not in templates:
+        templates[kind] = TEMPLATES[kind]()
+    return templates[kind]
+
+
+def render(kind: str, data, output_path: str, dpi: int = DEFAULT_DPI, colors: int = None) -> str:
+    """
+    Actualiza la plantilla con los datos de un experimento y la guarda.
+
+    Args:
+        kind: Clave de TEMPLATES
+        data: Datos que espera el update() de la plantilla
+        output_path: Ruta del archivo de salida
+        dpi: Resolución
+        colors: Número de colores de la paleta PNG (None = RGB completo)
+
+    Returns:
+        Ruta escrita
+    """
+    template = get_template(kind)
+    template.update(data)
+    if output_path.endswith('.png'):
+        _save_png(template.fig, output_path, dpi, colors)
+    else:
+        template.fig.savefig(output_path, dpi=dpi)
+    return output_path
+
+
+def experiment_jobs(stats: Dict[str, pd.DataFrame], velocities_df: pd.DataFrame,
+                    accelerations_df: pd.DataFrame, exp_data: pd.DataFrame) -> List[tuple]:
+    """Pares (plantilla, datos) de las gráficas de un experimento, en el orden de guardado."""
+    jobs = [('time_vs_sensor', stats), ('relative_error', stats)]
+    if velocities_df is not None and not velocities_df.empty:
+        jobs.append(('velocity_vs_position', velocities_df))
+    if accelerations_df is not None and not accelerations_df.empty:
+        jobs.append(('acceleration_comparison', accelerations_df))
+    jobs.append(('experimental_vs_theoretical', exp_data))
+    return jobs
+
+
+def render_experiment(stats: Dict[str, pd.DataFrame], velocities_df: pd.DataFrame,
+                      accelerations_df: pd.DataFrame, exp_data: pd.DataFrame, graphs_dir: str,
+                      dpi: int = DEFAULT_DPI, fmt: str = 'png', colors: int = None,
+                      kinds: List[str] = None) -> List[str]:
+    """
+    Genera las gráficas de un experimento con los mismos nombres de archivo que
+    render_experiment_graphs de analyze_mrua_experiments.
+
+    Args:
+        dpi, colors: Resolución y paleta (ver TIERS)
+        fmt: Formato de archivo
+        kinds: Solo estas plantillas (None = todas)
+
+    Returns:
+        Rutas escritas
+    """
+    return [render(kind, data, os.path.join(graphs_dir, f'{kind}.{fmt}'), dpi, colors)
+            for kind, data in experiment_jobs(stats, velocities_df, accelerations_df, exp_data)
+            if kinds is None or kind in kinds]
+
+
+def _benchmark(n: int, output_dir: str, tier: str = 'full'):
+    """Compara el tiempo y el tamaño por figura de las funciones plot_* originales con las plantillas."""
+    import analyze_mrua_experiments as analysis
+
+    rng = np.random.default_rng(0)
+    experiments = []
+    for i in range(n):
+        t12 = rng.uniform(0.5, 1.0)
+        experiments.append({'id': i, 'mode': 'remote' if i % 2 else 'presential', 'failed': False,
+                            'fecha': '2025-01-01T00:00:00.000Z', 't12': t12, 't23': t12 + 0.4,
+                            't34': t12 + 0.7, 'tiempo': t12 + 0.7})
+    df = analysis.experiments_to_dataframe(experiments)
+    results = [(exp_data, analysis.compute_experiment(exp_data)) for _, exp_data in df.groupby('experiment_id')]
+
+    def render_original(stats, velocities_df, accelerations_df, exp_data, graphs_dir):
+        analysis.plot_time_vs_sensor(stats, os.path.join(graphs_dir, 'time_vs_sensor.png'))
+        analysis.plot_relative_error(stats, os.path.join(graphs_dir, 'relative_error.png'))
+        analysis.plot_velocity_vs_position(velocities_df, os.path.join(graphs_dir, 'velocity_vs_position.png'))
+        analysis.plot_acceleration_comparison(accelerations_df, os.path.join(graphs_dir, 'acceleration_comparison.png'))
+        analysis.plot_experimental_vs_theoretical(exp_data, os.path.join(graphs_dir, 'experimental_vs_theoretical.png'))
+
+    def render_templates(*args):
+        return render_experiment(*args, **TIERS[tier])
+
+    timings, sizes = {}, {}
+    for label, renderer in [('plantillas', render_templates), ('original', render_original)]:
+        target = os.path.join(output_dir, label)
+        os.makedirs(target, exist_ok=True)
+        start = time.perf_counter()
+        figures = 0
+        for exp_data, r in results:
+            written = renderer(r['stats'], r['velocities_df'], r['accelerations_df'], exp_data, target)
+            figures += len(written) if written else 5
+        timings[label] = (time.perf_counter() - start) / max(figures, 1)
+        files = [os.path.join(target, name) for name in os.listdir(target)]
+        sizes[label] = sum(os.path.getsize(path) for path in files) / max(len(files), 1)
+    for label, seconds in timings.items():
+        print(f"[OK] {label}: {seconds * 1000:.1f} ms y {sizes[label] / 1e3:.1f} kB por figura")
+    print(f"[OK] Aceleracion: x{timings['original'] / timings['plantillas']:.1f}, "
+          f"tamaño por figura: x{sizes['plantillas'] / sizes['original']:.2f} respecto al original")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motor de graficas con plantillas reutilizables")
+    parser.add_argument('--benchmark', type=int, default=20, metavar='N', help="Experimentos sinteticos a graficar")
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(__file__), "analysis_output", "plot_benchmark"))
+    parser.add_argument('--tier', choices=list(TIERS), default='full', help="Nivel de render de las plantillas")
+    args = parser.parse_args()
+    _benchmark(args.benchmark, args.output, args.tier)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Reconciliación entre los experimentos que el bridge debía guardar y 'history'.
+Registros esperados (uno por experimento finalizado), según la fuente:
+  - latest:   instantánea de mqtt-bridge/server.js ({_id: 'latest', data, status}); si el
+              estado es Finalizado con tiempo > 0, su medición debe estar en 'history'
+  - live:     colección 'live_analysis' de mrua_ingest_service.py, que recibe los mismos
+              mensajes MQTT en otro proceso
+  - session:  sesiones MQTT grabadas con mqtt_replay.py (.mrec)
+Cada registro se empareja con 'history' en una sola pasada de hash-join: los documentos
+de la ventana se leen con una consulta, se indexan por cubeta de timestamp (la ventana
+de duplicados del bridge, 5 s) y cada registro solo mira su cubeta y las dos vecinas,
+con la misma regla que el bridge (|Δtimestamp| < 5 s y |Δtiempo| < 0.01 s). Se informa:
+  - missing:    registro sin medición en 'history' (fallo de guardado)
+  - mismatch:   medición encontrada con algún campo distinto
+  - duplicate:  más de una medición para el mismo registro, o dos mediciones de 'history'
+                que el bridge debía haber considerado la misma (guardado repetido)
+
+Uso:
+    python mrua_reconcile.py                          # Últimos 7 días: latest + live_analysis
+    python mrua_reconcile.py --days 28 --output analysis_output/reconciliation.csv
+    python mrua_reconcile.py --from 2026-01-01 --to 2026-02-01
+    python mrua_reconcile.py --session sesion.mrec --days 1
+"""
+
+import argparse
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List
+
+import pandas as pd
+import pymongo
+
+from archive_history import fecha_range_filter, to_timestamp
+from mqtt_replay import _is_finish, read_session
+from mrua_aggregates import ACTIVE_FILTER
+from mrua_ingest_service import (
+    DUPLICATE_WINDOW_MS, FAILED_TIME_THRESHOLD_S, FINISHED_STATUS, LIVE_COLLECTION, MQTT_TOPIC_DATA,
+)
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+LATEST_COLLECTION = "latest"
+OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "analysis_output", "reconciliation.csv")
+DEFAULT_DAYS = 7
+MATCH_WINDOW_MS = DUPLICATE_WINDOW_MS  # Misma ventana que el bridge
+TIEMPO_TOLERANCE_S = 0.01              # Mismo criterio de "mismo tiempo" que el bridge
+FIELD_TOLERANCE = 1e-6                 # Los valores se copian tal cual: cualquier diferencia es un error
+EDGE_PADDING = timedelta(minutes=5)    # 'history' se lee un poco más allá de la ventana
+COMPARE_FIELDS = ['tiempo', 'distancia', 'velocidad', 'aceleracion', 't12', 't23', 't34', 'mode', 'failed']
+HISTORY_FIELDS = {field: 1 for field in COMPARE_FIELDS + ['id', 'fecha', 'timestamp']}
+
+
+# ============ REGISTROS ============
+def _key_ms(doc: dict) -> int:
+    """Instante del experimento en ms: 'timestamp' del bridge, 'id' (Date.now()) o la fecha."""
+    for field in ('timestamp', 'id'):
+        value = doc.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+    ts = to_timestamp(doc.get('fecha'))
+    return -1 if pd.isna(ts) else ts.value // 10 ** 6
+
+
+def _record(source: str, data: dict) -> Dict:
+    """Registro esperado con los campos que el bridge copia a 'history' (mismos valores por defecto)."""
+    record = {field: data.get(field) for field in COMPARE_FIELDS}
+    record['distancia'] = data.get('distancia') or 1.5
+    record['mode'] = data.get('mode') or 'remote'
+    # Como el bridge (server.js) y build_measurement: se ignora el 'failed' del ESP, que
+    # también lo envía tras un timeout de sensores con tiempo <= 3 s
+    record['failed'] = (data.get('tiempo') or 0) > FAILED_TIME_THRESHOLD_S
+    record.update(source=source, key_ms=int(data['timestamp']))
+    return record
+
+
+def latest_records(db: pymongo.database.Database) -> List[Dict]:
+    """Instantáneas de 'latest' que corresponden a un experimento finalizado."""
+    records = []
+    for doc in db[LATEST_COLLECTION].find({}):
+        data = doc.get('data') or {}
+        if doc.get('status') == FINISHED_STATUS and (data.get('tiempo') or 0) > 0 and data.get('timestamp'):
+            records.append(_record(LATEST_COLLECTION, data))
+    return records
+
+
+def live_records(db: pymongo.database.Database, start_ms: int, end_ms: int) -> List[Dict]:
+    """Experimentos recibidos por MQTT y guardados por mrua_ingest_service.py en [start_ms, end_ms)."""
+    cursor = db[LIVE_COLLECTION].find({'_id': {'$gte': start_ms, '$lt': end_ms}}, {'experiment': 1})
+    return [_record('live', doc['experiment']) for doc in cursor if doc.get('experiment', {}).get('timestamp')]
+
+
+def session_records(path: str) -> List[Dict]:
+    """
+    Experimentos de una sesión MQTT grabada, con la lógica del bridge: el timestamp es el
+    instante de recepción del último mru/data y se ignoran los 'Finalizado' repetidos.
+    """
+    start, messages = read_session(path)
+    latest, records = {}, []
+    for offset, topic, payload in messages:
+        if topic == MQTT_TOPIC_DATA:
+            latest = {**json.loads(payload), 'timestamp': int((start + offset) * 1000)}
+        elif _is_finish(topic, payload) and (latest.get('tiempo') or 0) > 0:
+            repeated = any(abs(r['key_ms'] - latest['timestamp']) < MATCH_WINDOW_MS and
+                           abs((r['tiempo'] or 0) - latest['tiempo']) < TIEMPO_TOLERANCE_S for r in records[-50:])
+            if not repeated:
+                records.append(_record('session', latest))
+    return records
+
+
+def load_history(db: pymongo.database.Database, start: datetime, end: datetime,
+                 collection: str = COLLECTION_NAME) -> List[Dict]:
+    """Documentos activos de 'history' en la ventana (con margen), con una sola consulta proyectada."""
+    query = {**ACTIVE_FILTER, **fecha_range_filter(start - EDGE_PADDING, end + EDGE_PADDING)}
+    history = []
+    for doc in db[collection].find(query, HISTORY_FIELDS):
+        doc['key_ms'] = _key_ms(doc)
+        history.append(doc)
+    return history
+
+
+# ============ HASH-JOIN ============
+def build_index(history: List[Dict]) -> Dict[int, List[int]]:
+    """Posiciones de 'history' por cubeta de MATCH_WINDOW_MS."""
+    index = defaultdict(list)
+    for i, doc in enumerate(history):
+        index[doc['key_ms'] // MATCH_WINDOW_MS].append(i)
+    return index
+
+
+def candidates(index: Dict[int, List[int]], history: List[Dict], key_ms: int, tiempo) -> List[int]:
+    """Posiciones de 'history' que el bridge consideraría el mismo experimento."""
+    bucket = key_ms // MATCH_WINDOW_MS
+    return [i for b in (bucket - 1, bucket, bucket + 1) for i in index.get(b, ())
+            if abs(history[i]['key_ms'] - key_ms) < MATCH_WINDOW_MS
+            and abs((history[i].get('tiempo') or 0) - (tiempo or 0)) < TIEMPO_TOLERANCE_S]
+
+
+def values_differ(expected, saved) -> bool:
+    if isinstance(expected, (int, float)) and isinstance(saved, (int, float)):
+        return abs(expected - saved) > FIELD_TOLERANCE
+    return expected != saved
+
+
+def reconcile(records: Iterable[Dict], history: List[Dict]) -> pd.DataFrame:
+    """
+    Empareja los registros esperados con 'history' y busca duplicados dentro de 'history'.
+
+    Args:
+        records: Registros esperados (latest_records, live_records, session_records)
+        history: Documentos de load_history
+
+    Returns:
+        DataFrame de incidencias: source, status (missing/mismatch/duplicate), key_ms,
+        fecha, history_ids y detail (campos distintos o ids repetidos)
+    """
+    index = build_index(history)
+    issues = []
+
+    def issue(source, status, key_ms, matches, detail=''):
+        issues.append({
+            'source': source,
+            'status': status,
+            'key_ms': key_ms,
+            'fecha': datetime.fromtimestamp(key_ms / 1000, timezone.utc).isoformat() if key_ms >= 0 else None,
+            'history_ids': ' '.join(str(history[i].get('id', history[i]['_id'])) for i in matches),
+            'detail': detail,
+        })
+
+    for record in records:
+        matches = candidates(index, history, record['key_ms'], record['tiempo'])
+        if not matches:
+            issue(record['source'], 'missing', record['key_ms'], matches, f"tiempo={record['tiempo']}")
+            continue
+        if len(matches) > 1:
+            issue(record['source'], 'duplicate', record['key_ms'], matches, f"{len(matches)} guardados")
+        best = min(matches, key=lambda i: abs(history[i]['key_ms'] - record['key_ms']))
+        saved = history[best]
+        fields = [field for field in COMPARE_FIELDS if values_differ(record[field], saved.get(field))]
+        if fields:
+            detail = ', '.join(f"{field}: {record[field]} != {saved.get(field)}" for field in fields)
+            issue(record['source'], 'mismatch', record['key_ms'], [best], detail)
+
+    # Guardados repetidos sin registro esperado: pares dentro de 'history'
+    for i, doc in enumerate(history):
+        earlier = [j for j in candidates(index, history, doc['key_ms'], doc.get('tiempo')) if j < i]
+        if earlier:
+            issue(COLLECTION_NAME, 'duplicate', doc['key_ms'], earlier + [i], "mismo experimento guardado otra vez")
+
+    return pd.DataFrame(issues, columns=['source', 'status', 'key_ms', 'fecha', 'history_ids', 'detail'])
+
+
+def run_reconciliation(db: pymongo.database.Database, start: datetime, end: datetime,
+                       sessions: List[str] = None, use_live: bool = True) -> Dict[str, object]:
+    """
+    Reconciliación completa de una ventana de tiempo.
+
+    Returns:
+        Resumen con número de registros por fuente, documentos de 'history', incidencias por
+        fuente y estado, el DataFrame de incidencias y el tiempo empleado
+    """
+    started = datetime.now()
+    start_ms, end_ms = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+    records = [r for r in latest_records(db) if start_ms <= r['key_ms'] < end_ms]
+    if use_live:
+        records += live_records(db, start_ms, end_ms)
+    for path in sessions or []:
+        records += [r for r in session_records(path) if start_ms <= r['key_ms'] < end_ms]
+    history = load_history(db, start, end)
+    issues = reconcile(records, history)
+
+    sources = defaultdict(int)
+    for record in records:
+        sources[record['source']] += 1
+    return {
+        'records': dict(sources),
+        'history': len(history),
+        'counts': issues.groupby(['source', 'status']).size().to_dict() if not issues.empty else {},
+        'issues': issues,
+        'elapsed_s': (datetime.now() - started).total_seconds(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconciliacion de latest / live_analysis / sesiones MQTT con 'history'")
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS, help="Ventana hasta ahora (ignorado con --from)")
+    parser.add_argument('--from', dest='date_from', default=None, help="Fecha inicial incluida (AAAA-MM-DD)")
+    parser.add_argument('--to', dest='date_to', default=None, help="Fecha final excluida (AAAA-MM-DD)")
+    parser.add_argument('--session', action='append', default=[], help="Sesion .mrec de mqtt_replay.py (repetible)")
+    parser.add_argument('--no-live', action='store_true', help=f"No usar la coleccion '{LIVE_COLLECTION}'")
+    parser.add_argument('--output', default=OUTPUT_PATH, help="CSV de incidencias")
+    args = parser.parse_args()
+
+    end = to_timestamp(args.date_to).to_pydatetime() if args.date_to else datetime.now(timezone.utc)
+    start = to_timestamp(args.date_from).to_pydatetime() if args.date_from else end - timedelta(days=args.days)
+
+    db = pymongo.MongoClient(MONGODB_URI)[DATABASE_NAME]
+    summary = run_reconciliation(db, start, end, args.session, use_live=not args.no_live)
+
+    print("=" * 60)
+    print("RECONCILIACION CON 'history'")
+    print("=" * 60)
+    print(f"Ventana: {start.isoformat()} a {end.isoformat()}")
+    print(f"Documentos en 'history': {summary['history']}")
+    for source, count in sorted(summary['records'].items()):
+        print(f"Registros esperados ({source}): {count}")
+    if not summary['counts']:
+        print(f"\n[OK] Sin incidencias ({summary['elapsed_s']:.2f} s)")
+        return
+    print("\n--- Incidencias ---")
+    for (source, status), count in sorted(summary['counts'].items()):
+        print(f"  {source:<10} {status:<10} {count}")
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    summary['issues'].to_csv(args.output, index=False, encoding='utf-8-sig')
+    print(f"\n[WARNING] {len(summary['issues'])} incidencias en {summary['elapsed_s']:.2f} s: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Render de gráficas a resolución completa bajo demanda.
+Durante el análisis las gráficas por carpeta se omiten o se generan como borradores
+(--experiment-graphs none/draft; nivel 'draft' de mrua_plot_templates: 72 dpi y
+paleta de colores). Las versiones a 300 dpi se generan cuando se piden, a
+partir del CSV de datos crudos de la carpeta del experimento, y se guardan en una
+caché (analysis_output/render_cache) acotada por tamaño y por antigüedad. La clave
+de caché incluye un hash del CSV, de modo que si se vuelve a ejecutar el análisis y
+los datos de la carpeta cambian, la gráfica se vuelve a generar.
+
+Uso:
+    python mrua_render.py render prueba_3_remoto prueba_1_presencial   # Todas las gráficas
+    python mrua_render.py render prueba_3_remoto --kind time_vs_sensor
+    python mrua_render.py serve --port 8766    # http://localhost:8766/prueba_3_remoto/time_vs_sensor.png
+    python mrua_render.py prune                # Aplicar los límites de la caché
+    python mrua_render.py info
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, List
+
+import pandas as pd
+
+from mrua_plot_templates import TEMPLATES, TIERS, experiment_jobs, render_experiment
+
+
+# ============ CONFIGURACIÓN ============
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "analysis_output")
+CACHE_DIR = os.path.join(OUTPUT_DIR, "render_cache")
+CACHE_MAX_MB = 200
+CACHE_MAX_AGE_DAYS = 14
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8766
+RAW_CSV = os.path.join("csv", "raw_sensors_data.csv")
+KINDS_FILE = "kinds.json"  # Gráficas que aplican al experimento (sin velocidades no hay todas)
+
+_lock = threading.Lock()
+
+
+# ============ DATOS DEL EXPERIMENTO ============
+def experiment_folder(name: str, output_dir: str = OUTPUT_DIR) -> str:
+    """Ruta de la carpeta de un experimento (prueba_N_remoto / prueba_N_presencial)."""
+    folder = os.path.join(output_dir, os.path.basename(name.rstrip('/\\')))
+    if not os.path.exists(os.path.join(folder, RAW_CSV)):
+        raise FileNotFoundError(f"No existe {os.path.join(folder, RAW_CSV)} (ejecute analyze_mrua_experiments.py)")
+    return folder
+
+
+def _data_hash(folder: str) -> str:
+    with open(os.path.join(folder, RAW_CSV), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+def load_experiment_data(folder: str) -> pd.DataFrame:
+    """Lee las filas de sensores de un experimento con el formato de experiments_to_dataframe."""
+    df = pd.read_csv(os.path.join(folder, RAW_CSV), encoding='utf-8-sig', dtype={'experiment_id': str})
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+
+# ============ CACHÉ ============
+def _cache_files(cache_dir: str) -> List[str]:
+    files = []
+    for root, _, names in os.walk(cache_dir):
+        files.extend(os.path.join(root, name) for name in names)
+    return files
+
+
+def prune_cache(cache_dir: str = CACHE_DIR, max_mb: float = CACHE_MAX_MB,
+                max_age_days: float = CACHE_MAX_AGE_DAYS) -> Dict[str, int]:
+    """
+    Elimina las gráficas no usadas en max_age_days días y, si la caché sigue ocupando
+    más de max_mb, las menos usadas recientemente (la fecha de modificación se
+    actualiza en cada acierto).
+
+    Returns:
+        Archivos eliminados y bytes restantes
+    """
+    now = time.time()
+    entries = sorted(((os.path.getmtime(path), os.path.getsize(path), path) for path in _cache_files(cache_dir)))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if now - mtime <= max_age_days * 86400 and total <= max_mb * 1e6:
+            break
+        os.remove(path)
+        total -= size
+        removed += 1
+    # Carpetas vacías (experimentos o versiones de datos sin gráficas)
+    for root, _, _ in os.walk(cache_dir, topdown=False):
+        if root != cache_dir and not os.listdir(root):
+            os.rmdir(root)
+    return {'removed': removed, 'bytes': total}
+
+
+def render_full(name: str, kinds: List[str] = None, tier: str = 'full', output_dir: str = OUTPUT_DIR,
+                cache_dir: str = CACHE_DIR) -> List[str]:
+    """
+    Devuelve las gráficas de un experimento en el nivel pedido, generándolas si no
+    están en la caché.
+
+    Args:
+        name: Carpeta del experimento (p. ej. 'prueba_3_remoto')
+        kinds: Plantillas a generar (None = todas)
+        tier: Nivel de render (ver TIERS)
+        output_dir: Carpeta raíz de resultados del análisis
+        cache_dir: Carpeta de la caché
+
+    Returns:
+        Rutas de las gráficas en la caché
+    """
+    folder = experiment_folder(name, output_dir)
+    target = os.path.join(cache_dir, os.path.basename(folder), f"{tier}_{_data_hash(folder)}")
+    wanted = list(kinds or TEMPLATES)
+    kinds_path = os.path.join(target, KINDS_FILE)
+    try:
+        with open(kinds_path, encoding='utf-8') as f:
+            applicable = json.load(f)
+    except (OSError, ValueError):
+        applicable = None
+    if applicable is not None:
+        cached = [os.path.join(target, f'{kind}.png') for kind in wanted if kind in applicable]
+        if all(os.path.exists(path) for path in cached):
+            for path in cached + [kinds_path]:
+                os.utime(path)
+            return cached
+
+    # Import diferido: el análisis solo hace falta cuando hay que generar
+    from analyze_mrua_experiments import compute_experiment
+    exp_data = load_experiment_data(folder)
+    with _lock, contextlib.redirect_stdout(io.StringIO()):
+        result = compute_experiment(exp_data)
+        os.makedirs(target, exist_ok=True)
+        args = (result['stats'], result['velocities_df'], result['accelerations_df'], exp_data)
+        written = render_experiment(*args, target, kinds=wanted, **TIERS[tier])
+        with open(kinds_path, 'w', encoding='utf-8') as f:
+            json.dump([kind for kind, _ in experiment_jobs(*args)], f)
+    prune_cache(cache_dir)
+    return written
+
+
+# ============ SERVIDOR LOCAL ============
+class _RenderHandler(BaseHTTPRequestHandler):
+    """GET /<experimento>/<grafica>.png[?tier=draft]: sirve la gráfica desde la caché o la genera."""
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        parts = [p for p in path.split('/') if p]
+        tier = 'draft' if 'tier=draft' in query else 'full'
+        if len(parts) != 2 or not parts[1].endswith('.png') or parts[1][:-4] not in TEMPLATES:
+            self.send_error(404, "Use /<experimento>/<grafica>.png")
+            return
+        try:
+            paths = render_full(parts[0], [parts[1][:-4]], tier)
+        except FileNotFoundError as e:
+            self.send_error(404, str(e))
+            return
+        if not paths:
+            self.send_error(404, "La grafica no aplica a este experimento")
+            return
+        with open(paths[0], 'rb') as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"[INFO] {self.address_string()} {format % args}")
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT):
+    """Servidor HTTP local que genera las gráficas a resolución completa al pedirlas."""
+    server = HTTPServer((host, port), _RenderHandler)
+    print(f"[OK] Sirviendo graficas en http://{host}:{port}/<experimento>/<grafica>.png")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Graficas a resolucion completa bajo demanda")
+    parser.add_argument('command', choices=['render', 'serve', 'prune', 'info'])
+    parser.add_argument('experiments', nargs='*', help="Carpetas de experimentos (p. ej. prueba_3_remoto)")
+    parser.add_argument('--kind', action='append', choices=list(TEMPLATES), help="Solo esta grafica (repetible)")
+    parser.add_argument('--tier', choices=list(TIERS), default='full')
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--clear', action='store_true', help="Con prune: vaciar la cache")
+    args = parser.parse_args()
+
+    if args.command == 'render':
+        if not args.experiments:
+            parser.error("indique al menos una carpeta de experimento")
+        for name in args.experiments:
+            try:
+                paths = render_full(name, args.kind, args.tier)
+            except FileNotFoundError as e:
+                print(f"[ERROR] {e}")
+                continue
+            for path in paths:
+                print(f"[OK] Grafica: {path}")
+    elif args.command == 'serve':
+        serve(port=args.port)
+    elif args.command == 'prune':
+        if args.clear:
+            shutil.rmtree(CACHE_DIR, ignore_errors=True)
+            print(f"[OK] Cache vaciada: {CACHE_DIR}")
+            return
+        summary = prune_cache()
+        print(f"[OK] {summary['removed']} graficas eliminadas, {summary['bytes'] / 1e6:.1f} MB en cache")
+    else:
+        files = _cache_files(CACHE_DIR)
+        size = sum(os.path.getsize(path) for path in files)
+        print(f"[OK] Cache: {CACHE_DIR}")
+        print(f"   - {len(files)} graficas, {size / 1e6:.1f} MB (limite {CACHE_MAX_MB} MB, {CACHE_MAX_AGE_DAYS} dias)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Series temporales por periodo (colección 'rollups').
+Igual que los agregados de mrua_aggregates pero con una clave de periodo: un documento
+por (periodo, inicio del periodo, modalidad) con las sumas de tiempos por sensor, de
+aceleración media, fallos y conteos. Cada alta, baja o corrección de experimentos se
+aplica como un $inc sobre los documentos diario, semanal (lunes) y mensual de su
+fecha, de modo que no hace falta reagrupar 'history'. Consultar una ventana de un
+semestre lee como mucho unos cientos de documentos por un índice.
+Los experimentos archivados (archive_history.py) siguen contando en sus series: la
+reconstrucción y la verificación leen también las particiones mensuales.
+
+Uso:
+    python mrua_rollups.py show --period week --from 2025-09-01 --to 2026-02-01
+    python mrua_rollups.py plot --period week --from 2025-09-01
+    python mrua_rollups.py rebuild     # Reconstrucción completa desde 'history'
+    python mrua_rollups.py check       # Verificar consistencia contra 'history'
+"""
+
+import argparse
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+import pandas as pd
+import pymongo
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from pymongo import UpdateOne
+
+from archive_history import ARCHIVE_DIR, iter_partitions, to_timestamp
+from mrua_aggregates import (
+    ACTIVE_FILTER, CONSISTENCY_TOLERANCE, HISTORY_PROJECTION, SENSORS,
+    _moments_to_stats, _nest, _flatten, catch_up, experiment_increments, save_watermark, watermark_of,
+)
+from mrua_plot_templates import DEFAULT_DPI, MODE_STYLES
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+ROLLUPS_COLLECTION = "rollups"
+PERIODS = ['day', 'week', 'month']
+BATCH_SIZE = 5000
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "analysis_output")
+
+
+# ============ PERIODOS ============
+def period_start(fecha, period: str) -> datetime:
+    """Inicio (UTC, sin zona) del periodo que contiene la fecha: día, semana (lunes) o mes."""
+    ts = to_timestamp(fecha)
+    if pd.isna(ts):
+        return None
+    day = ts.tz_convert(None).normalize()
+    if period == 'week':
+        day -= pd.Timedelta(days=day.weekday())
+    elif period == 'month':
+        day = day.replace(day=1)
+    return day.to_pydatetime()
+
+
+def _rollup_id(period: str, start: datetime, mode: str) -> str:
+    return f"{period}:{start:%Y-%m-%d}:{mode}"
+
+
+# ============ INCREMENTOS ============
+def rollup_increments(docs: Iterable[dict], sign: int = 1,
+                      periods: List[str] = PERIODS) -> Dict[tuple, Dict[str, float]]:
+    """
+    Incrementos ($inc) por (periodo, inicio, modalidad) que aporta un lote de experimentos.
+    Los experimentos sin fecha válida no entran en ninguna serie.
+
+    Returns:
+        Diccionario (periodo, inicio, modo) -> {campo: incremento}
+    """
+    groups: Dict[tuple, List[dict]] = {}
+    for doc in docs:
+        for period in periods:
+            start = period_start(doc.get('fecha'), period)
+            if start is not None:
+                groups.setdefault((period, start), []).append(doc)
+
+    increments = {}
+    for (period, start), group in groups.items():
+        for mode, inc in experiment_increments(group, sign).items():
+            increments[(period, start, mode)] = inc
+    return increments
+
+
+def apply_rollup_increments(db: pymongo.database.Database, increments: Dict[tuple, Dict[str, float]]):
+    """Aplica los incrementos a la colección de series en una sola escritura en bloque."""
+    if not increments:
+        return
+    now = datetime.now()
+    ops = [
+        UpdateOne({'_id': _rollup_id(period, start, mode)},
+                  {'$inc': inc, '$set': {'updated_at': now},
+                   '$setOnInsert': {'period': period, 'start': start, 'mode': mode}}, upsert=True)
+        for (period, start, mode), inc in increments.items()
+    ]
+    db[ROLLUPS_COLLECTION].bulk_write(ops, ordered=False)
+
+
+def add_to_rollups(db: pymongo.database.Database, docs: List[dict], sign: int = 1):
+    """Suma (sign=1) o descuenta (sign=-1) experimentos de las series."""
+    apply_rollup_increments(db, rollup_increments(docs, sign))
+
+
+# ============ RECONSTRUCCIÓN Y LECTURA ============
+def compute_from_history(db: pymongo.database.Database, batch_size: int = BATCH_SIZE,
+                         with_watermark: bool = False, archive_dir: str = ARCHIVE_DIR):
+    """
+    Calcula todas las series recorriendo 'history' con proyección, por lotes, más
+    los experimentos archivados en las particiones mensuales. Con with_watermark
+    devuelve también la marca de agua de los documentos de 'history' leídos.
+    """
+    totals: Dict[tuple, Dict[str, float]] = {}
+    watermark = watermark_of([])
+    cursor = db[COLLECTION_NAME].find(ACTIVE_FILTER, HISTORY_PROJECTION, batch_size=batch_size)
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _merge_into(totals, rollup_increments(batch))
+            watermark = watermark_of(batch, watermark)
+            batch = []
+    _merge_into(totals, rollup_increments(batch))
+    watermark = watermark_of(batch, watermark)
+
+    batch = []
+    for doc in iter_partitions(archive_dir=archive_dir):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _merge_into(totals, rollup_increments(batch))
+            batch = []
+    _merge_into(totals, rollup_increments(batch))
+    return (totals, watermark) if with_watermark else totals
+
+
+def _merge_into(totals: Dict[tuple, Dict[str, float]], increments: Dict[tuple, Dict[str, float]]):
+    for key, inc in increments.items():
+        merged = totals.setdefault(key, {})
+        for field, value in inc.items():
+            merged[field] = merged.get(field, 0) + value
+
+
+def rebuild_rollups(db: pymongo.database.Database) -> int:
+    """
+    Reconstruye la colección de series desde cero.
+
+    Returns:
+        Número de documentos escritos
+    """
+    totals, watermark = compute_from_history(db, with_watermark=True)
+    now = datetime.now()
+    col = db[ROLLUPS_COLLECTION]
+    col.delete_many({})
+    docs = [{'_id': _rollup_id(*key), 'period': key[0], 'start': key[1], 'mode': key[2],
+             **_nest(inc), 'updated_at': now} for key, inc in totals.items()]
+    for start in range(0, len(docs), BATCH_SIZE):
+        col.insert_many(docs[start:start + BATCH_SIZE], ordered=False)
+    save_watermark(db, 'rollups', watermark)
+    print(f"[OK] Series reconstruidas: {len(docs)} documentos")
+    return len(docs)
+
+
+def check_rollups(db: pymongo.database.Database, tolerance: float = CONSISTENCY_TOLERANCE) -> List[str]:
+    """
+    Compara las series almacenadas con un recálculo completo desde 'history' y el
+    archivo (tras incorporar lo nuevo).
+    """
+    catch_up(db, 'rollups')
+    expected = {_rollup_id(*key): inc for key, inc in compute_from_history(db).items()}
+    stored = {doc['_id']: _flatten(doc) for doc in db[ROLLUPS_COLLECTION].find()}
+    issues = []
+    for key in sorted(set(expected) | set(stored)):
+        exp_fields, got_fields = expected.get(key, {}), stored.get(key, {})
+        fields = set(exp_fields) | {f for f in got_fields if f not in ('_id', 'period', 'start', 'mode', 'updated_at')}
+        for field in sorted(fields):
+            exp_value, got_value = exp_fields.get(field, 0), got_fields.get(field, 0)
+            if abs(exp_value - got_value) > tolerance * max(1.0, abs(exp_value)):
+                issues.append(f"{key}.{field}: esperado {exp_value}, almacenado {got_value}")
+    return issues
+
+
+def query_rollups(db: pymongo.database.Database, period: str = 'week', date_from=None, date_to=None,
+                  mode: str = None, sync: bool = True) -> pd.DataFrame:
+    """
+    Lee una serie en la ventana [date_from, date_to) (consulta por índice period/mode/start).
+    Con sync se incorporan antes los experimentos nuevos de 'history'.
+
+    Returns:
+        DataFrame con una fila por periodo y modalidad: start, mode, count, failed,
+        failure_rate_pct, acceleration_mean/std y sensor_k_mean/std
+    """
+    if sync:
+        catch_up(db, 'rollups')
+    query = {'period': period}
+    if mode is not None:
+        query['mode'] = mode
+    if date_from is not None or date_to is not None:
+        query['start'] = {}
+        if date_from is not None:
+            query['start']['$gte'] = period_start(date_from, period)
+        if date_to is not None:
+            query['start']['$lt'] = to_timestamp(date_to).tz_convert(None).to_pydatetime()
+
+    rows = []
+    for doc in db[ROLLUPS_COLLECTION].find(query).sort('start', 1):
+        count = doc.get('count', 0)
+        if count <= 0:
+            continue  # Periodo vaciado por bajas
+        accel = _moments_to_stats(doc.get('acceleration', {}))
+        row = {
+            'start': doc['start'],
+            'mode': doc['mode'],
+            'count': count,
+            'failed': doc.get('failed', 0),
+            'failure_rate_pct': round(doc.get('failed', 0) / count * 100, 2),
+            'acceleration_mean': accel['mean'],
+            'acceleration_std': accel['std'],
+        }
+        for sensor in SENSORS:
+            stats = _moments_to_stats(doc.get(f'sensor_{sensor}', {}))
+            row[f'sensor_{sensor}_mean'], row[f'sensor_{sensor}_std'] = stats['mean'], stats['std']
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# ============ GRÁFICA ============
+def plot_rollups(df: pd.DataFrame, output_path: str, period: str = 'week', dpi: int = DEFAULT_DPI) -> str:
+    """Evolución por modalidad: aceleración media ± desviación, tiempo total, tasa de fallos y conteo."""
+    fig = Figure(figsize=(12, 10))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(4, 1, sharex=True)
+    for mode, group in df.groupby('mode', sort=False):
+        style = MODE_STYLES.get(mode, {'label': mode, 'marker': 'o', 'color': 'C2'})
+        x = pd.to_datetime(group['start'])
+        kwargs = {'color': style['color'], 'marker': style['marker'], 'label': style['label']}
+        axes[0].plot(x, group['acceleration_mean'], **kwargs)
+        axes[0].fill_between(x, group['acceleration_mean'] - group['acceleration_std'].fillna(0),
+                             group['acceleration_mean'] + group['acceleration_std'].fillna(0),
+                             color=style['color'], alpha=0.2)
+        axes[1].plot(x, group['sensor_4_mean'], **kwargs)
+        axes[2].plot(x, group['failure_rate_pct'], **kwargs)
+        axes[3].bar(x, group['count'], color=style['color'], alpha=0.5, label=style['label'],
+                    width={'day': 0.8, 'week': 5, 'month': 25}[period])
+    for ax, ylabel in zip(axes, ['Aceleración (m/s²)', 'Tiempo S4 (s)', 'Fallos (%)', 'Experimentos']):
+        ax.set_ylabel(ylabel, fontsize=11)
+        ax.grid(True, alpha=0.3)
+    axes[0].legend()
+    axes[0].set_title(f"Evolución Remoto vs Presencial (periodo: {period})", fontsize=14, fontweight='bold')
+    axes[-1].set_xlabel('Inicio del periodo', fontsize=11)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    fig.savefig(output_path, dpi=dpi)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Series temporales por periodo y modalidad")
+    parser.add_argument('command', choices=['show', 'plot', 'rebuild', 'check'], nargs='?', default='show')
+    parser.add_argument('--period', choices=PERIODS, default='week')
+    parser.add_argument('--from', dest='date_from', default=None, help="Fecha inicial incluida (AAAA-MM-DD)")
+    parser.add_argument('--to', dest='date_to', default=None, help="Fecha final excluida (AAAA-MM-DD)")
+    parser.add_argument('--mode', default=None)
+    parser.add_argument('--output', default=None, help="Ruta del PNG (plot)")
+    args = parser.parse_args()
+
+    try:
+        client = pymongo.MongoClient(MONGODB_URI)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+
+    if args.command == 'rebuild':
+        rebuild_rollups(db)
+        return
+    if args.command == 'check':
+        issues = check_rollups(db)
+        if issues:
+            print(f"[WARNING] {len(issues)} discrepancias (ejecute 'rebuild' para corregir):")
+            for issue in issues[:50]:
+                print(f"   - {issue}")
+        else:
+            print("[OK] Series consistentes con 'history'")
+        return
+
+    df = query_rollups(db, args.period, args.date_from, args.date_to, args.mode)
+    if df.empty:
+        print("[INFO] No hay datos en la ventana pedida (¿ejecutó 'rebuild'?)")
+        return
+    if args.command == 'plot':
+        path = plot_rollups(df, args.output or os.path.join(OUTPUT_DIR, f"rollups_{args.period}.png"), args.period)
+        print(f"[OK] Grafica guardada: {path}")
+    else:
+        columns = ['start', 'mode', 'count', 'failure_rate_pct', 'acceleration_mean', 'acceleration_std',
+                   'sensor_4_mean', 'sensor_4_std']
+        print(df[columns].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+"""
+Servicio HTTP local de análisis en caliente.
+Carga una vez los experimentos activos de 'history' como arrays (tiempos por sensor,
+aceleraciones y ajuste cinemático de mrua_kinematics), los mantiene al día
+consultando periódicamente los documentos nuevos y responde en milisegundos a
+consultas de estadísticas, ajustes, comparación entre modalidades y series por
+periodo. Las respuestas se guardan en una caché LRU que se vacía cada vez que
+llegan datos nuevos, cambia el número de documentos activos o se corrige un
+experimento (campo 'updated_at' que escribe mrua_aggregates.correct_experiment).
+HTTP/1.1 mínimo sobre asyncio.start_server (solo GET, respuestas JSON, keep-alive y
+CORS para el dashboard), sin dependencias adicionales.
+
+Uso:
+    python mrua_service.py                          # http://127.0.0.1:8765
+    python mrua_service.py --port 9000 --poll 2
+
+    curl "http://127.0.0.1:8765/stats?mode=remote&days=30"
+    curl "http://127.0.0.1:8765/fits?mode=presential&from=2026-01-01&to=2026-02-01"
+    curl "http://127.0.0.1:8765/compare?days=90&failed=exclude"
+    curl "http://127.0.0.1:8765/rollups?period=week&days=180"
+    curl "http://127.0.0.1:8765/health"
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+import pymongo
+
+from archive_history import fecha_range_filter, to_timestamp
+from mrua_aggregates import ACTIVE_FILTER, HISTORY_PROJECTION
+from mrua_ingest_service import _clean, _empty_aggregate, aggregate_summary
+from mrua_kinematics import MODES, analyze_arrays, documents_to_arrays
+from mrua_rollups import PERIODS
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+HOST = "127.0.0.1"
+PORT = 8765
+POLL_INTERVAL_S = 5.0       # Consulta de documentos nuevos en 'history'
+CACHE_SIZE = 512            # Respuestas guardadas en la caché LRU
+BATCH_SIZE = 5000
+MAX_HEADER_BYTES = 16384
+FIT_FIELDS = ['fit_a', 'fit_v0', 'fit_x0', 'fit_r2']
+COMPARE_FIELDS = ['acceleration_mean', 'fit_a', 'sensor_4']
+
+
+# ============ DATOS EN MEMORIA ============
+def _fecha_array(fechas: np.ndarray) -> np.ndarray:
+    """Fechas (texto ISO del bridge o datetime) a datetime64[ns] UTC sin zona (NaT si no son válidas)."""
+    parsed = pd.to_datetime(pd.Series(fechas, dtype=object), utc=True, errors='coerce', format='ISO8601')
+    return parsed.dt.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+
+
+def _columns(docs) -> Dict[str, np.ndarray]:
+    """Columnas que usa el servicio: identidad, modalidad, fallo, fecha y cinemática."""
+    arrays = documents_to_arrays(docs)
+    kin = analyze_arrays(arrays['raw'])
+    columns = {
+        '_id': arrays['_id'],
+        'mode': arrays['mode'],
+        'failed': arrays['failed'],
+        'fecha': _fecha_array(arrays['fecha']),
+        'times': kin['times'],
+        'acceleration_mean': kin['acceleration_mean'],
+    }
+    columns.update({field: kin[field] for field in FIT_FIELDS})
+    return columns
+
+
+class ExperimentStore:
+    """
+    Arrays de los experimentos activos de 'history', actualizados de forma incremental:
+    se piden los documentos con fecha >= la más reciente cargada y, si el número de
+    documentos activos no coincide (bajas, duplicados marcados, cuarentena) o hay
+    documentos corregidos después de la carga ('updated_at', índice disperso), se
+    recarga todo. Cada cambio incrementa 'version'.
+    """
+
+    def __init__(self, collection: pymongo.collection.Collection, batch_size: int = BATCH_SIZE):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.columns = _columns([])
+        self.ids = set()
+        self.version = 0
+        self.loaded_at = None
+        self.updated_at = None  # 'updated_at' más reciente visto en 'history'
+
+    def __len__(self) -> int:
+        return len(self.columns['mode'])
+
+    def _fetch(self, query: Dict):
+        return list(self.collection.find(query, HISTORY_PROJECTION).batch_size(self.batch_size))
+
+    def _last_update(self, after=None):
+        """'updated_at' más reciente (posterior a after) de los documentos corregidos, o None."""
+        query = {'updated_at': {'$gt': after} if after is not None else {'$exists': True}}
+        doc = self.collection.find_one(query, {'updated_at': 1}, sort=[('updated_at', -1)])
+        return doc['updated_at'] if doc else None
+
+    def load(self) -> int:
+        """Carga completa (bloqueante). Devuelve el número de experimentos."""
+        # Antes de leer: una corrección durante la carga provoca otra recarga
+        self.updated_at = self._last_update()
+        docs = self._fetch(ACTIVE_FILTER)
+        self.columns = _columns(docs)
+        self.ids = set(self.columns['_id'].tolist())
+        self.version += 1
+        self.loaded_at = datetime.now(timezone.utc)
+        return len(self)
+
+    def refresh(self) -> int:
+        """
+        Añade los documentos nuevos (bloqueante). Devuelve cuántos se añadieron,
+        o -1 si hubo que recargar todo.
+        """
+        if self._last_update(self.updated_at) is not None:
+            self.load()
+            return -1
+        fechas = self.columns['fecha']
+        valid = fechas[~np.isnat(fechas)]
+        if not len(valid):
+            return -1 if self.load() else 0
+        newest = pd.Timestamp(valid.max(), tz='UTC')
+        docs = [doc for doc in self._fetch({**ACTIVE_FILTER, **fecha_range_filter(newest)})
+                if doc['_id'] not in self.ids]
+        if docs:
+            new = _columns(docs)
+            self.columns = {key: np.concatenate([self.columns[key], new[key]]) for key in self.columns}
+            self.ids.update(new['_id'].tolist())
+            self.version += 1
+        if self.collection.count_documents(ACTIVE_FILTER) != len(self):
+            self.load()
+            return -1
+        return len(docs)
+
+
+# ============ CONSULTAS ============
+def select(columns: Dict[str, np.ndarray], params: Dict[str, str]) -> np.ndarray:
+    """
+    Máscara de experimentos según mode, failed (include/exclude/only) y from/to.
+    Cada consulta lee store.columns una sola vez: refresh las sustituye desde otro hilo.
+    """
+    mask = np.ones(len(columns['mode']), dtype=bool)
+    mode = params.get('mode', 'all')
+    if mode != 'all':
+        mask &= columns['mode'] == mode
+    failed = params.get('failed', 'include')
+    if failed == 'exclude':
+        mask &= ~columns['failed']
+    elif failed == 'only':
+        mask &= columns['failed']
+    elif failed != 'include':
+        raise ValueError("failed debe ser include, exclude u only")
+    for key, compare in (('from', np.greater_equal), ('to', np.less)):
+        if key in params:
+            bound = to_timestamp(params[key])
+            if pd.isna(bound):
+                raise ValueError(f"fecha no valida en '{key}': {params[key]}")
+            mask &= compare(columns['fecha'], bound.tz_convert(None).to_datetime64())
+    return mask
+
+
+def _summary(values: np.ndarray) -> Dict[str, float]:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'count': 0, 'mean': None, 'std': None, 'median': None}
+    return {
+        'count': int(len(values)),
+        'mean': float(values.mean()),
+        'std': float(values.std(ddof=1)) if len(values) > 1 else None,
+        'median': float(np.median(values)),
+    }
+
+
+def query_stats(store: ExperimentStore, params: Dict[str, str]) -> Dict:
+    """Conteo, fallos, tiempos por sensor y aceleración media por modalidad."""
+    columns, result = store.columns, {}
+    mask = select(columns, params)
+    for mode in np.unique(columns['mode'][mask]):
+        subset = mask & (columns['mode'] == mode)
+        aggregate = _empty_aggregate()
+        aggregate['count'] = int(subset.sum())
+        aggregate['failed'] = int(columns['failed'][subset].sum())
+        for k, stats in enumerate(aggregate['sensor_times']):
+            stats.update(columns['times'][subset, k])
+        aggregate['acceleration'].update(columns['acceleration_mean'][subset])
+        aggregate['fit_acceleration'].update(columns['fit_a'][subset])
+        result[mode] = aggregate_summary(aggregate)
+    return {'modes': result}
+
+
+def query_fits(store: ExperimentStore, params: Dict[str, str]) -> Dict:
+    """Distribución del ajuste x = x0 + v0·t + ½·a·t² (a, v0, x0, R²) por modalidad."""
+    columns = store.columns
+    mask = select(columns, params)
+    return {'modes': {mode: {field[4:]: _summary(columns[field][mask & (columns['mode'] == mode)])
+                             for field in FIT_FIELDS}
+                      for mode in np.unique(columns['mode'][mask])}}
+
+
+def query_compare(store: ExperimentStore, params: Dict[str, str]) -> Dict:
+    """Remoto vs presencial: medias, diferencia y t de Welch de aceleración, ajuste y tiempo total."""
+    columns = store.columns
+    mask = select(columns, {**params, 'mode': 'all'})
+    values = {'acceleration_mean': columns['acceleration_mean'], 'fit_a': columns['fit_a'],
+              'sensor_4': columns['times'][:, 3]}
+    result = {}
+    for field in COMPARE_FIELDS:
+        by_mode = {mode: _summary(values[field][mask & (columns['mode'] == mode)]) for mode in MODES}
+        remote, presential = by_mode['remote'], by_mode['presential']
+        entry = {**by_mode, 'difference': None, 'difference_pct': None, 'welch_t': None}
+        if remote['count'] and presential['count']:
+            entry['difference'] = remote['mean'] - presential['mean']
+            if presential['mean']:
+                entry['difference_pct'] = entry['difference'] / presential['mean'] * 100
+            if remote['std'] is not None and presential['std'] is not None:
+                se = np.sqrt(remote['std'] ** 2 / remote['count'] + presential['std'] ** 2 / presential['count'])
+                entry['welch_t'] = entry['difference'] / se if se > 0 else None
+        result[field] = entry
+    return result
+
+
+def query_rollups(store: ExperimentStore, params: Dict[str, str]) -> Dict:
+    """Series por día, semana (lunes) o mes y modalidad, como mrua_rollups pero sobre los arrays."""
+    period = params.get('period', 'week')
+    if period not in PERIODS:
+        raise ValueError(f"period debe ser uno de {PERIODS}")
+    columns = store.columns
+    mask = select(columns, params) & ~np.isnat(columns['fecha'])
+    fechas = pd.DatetimeIndex(columns['fecha'][mask]).normalize()
+    if period == 'week':
+        fechas -= pd.to_timedelta(fechas.weekday, unit='D')
+    elif period == 'month':
+        fechas = fechas.to_period('M').to_timestamp()
+    df = pd.DataFrame({
+        'start': fechas,
+        'mode': columns['mode'][mask],
+        'failed': columns['failed'][mask],
+        'acceleration': columns['acceleration_mean'][mask],
+        'sensor_4': columns['times'][mask, 3],
+    })
+    grouped = df.groupby(['start', 'mode'], sort=True).agg(
+        count=('failed', 'size'), failed=('failed', 'sum'),
+        acceleration_mean=('acceleration', 'mean'), acceleration_std=('acceleration', 'std'),
+        sensor_4_mean=('sensor_4', 'mean'),
+    ).reset_index()
+    grouped['failure_rate_pct'] = (grouped['failed'] / grouped['count'] * 100).round(2)
+    grouped['start'] = grouped['start'].dt.strftime('%Y-%m-%d')
+    return {'period': period, 'rows': grouped.to_dict(orient='records')}
+
+
+QUERIES: Dict[str, Callable[[ExperimentStore, Dict[str, str]], Dict]] = {
+    '/stats': query_stats,
+    '/fits': query_fits,
+    '/compare': query_compare,
+    '/rollups': query_rollups,
+}
+
+
+# ============ CACHÉ ============
+class LRUCache:
+    """Caché LRU de respuestas; se vacía al cambiar la versión de los datos."""
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items: OrderedDict = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version: int):
+        if version != self.version:
+            self.items.clear()
+            self.version = version
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+
+# ============ SERVIDOR HTTP ============
+class AnalysisService:
+    """
+    Servidor HTTP sobre asyncio: las consultas se resuelven en el bucle (arrays en
+    memoria) y la carga/actualización desde MongoDB se ejecuta en un hilo, de modo que
+    el servidor sigue respondiendo mientras se consulta 'history'.
+    """
+
+    def __init__(self, store: ExperimentStore, poll_interval_s: float = POLL_INTERVAL_S,
+                 cache_size: int = CACHE_SIZE):
+        self.store = store
+        self.poll_interval_s = poll_interval_s
+        self.cache = LRUCache(cache_size)
+        self.refreshed_at = None
+        self.requests = 0
+
+    def handle(self, path: str, params: Dict[str, str]) -> Tuple[int, bytes]:
+        """Resuelve una petición GET. Devuelve (estado HTTP, cuerpo JSON)."""
+        if path == '/health':
+            return 200, self._json({
+                'experiments': len(self.store),
+                'version': self.store.version,
+                'loaded_at': self.store.loaded_at.isoformat() if self.store.loaded_at else None,
+                'refreshed_at': self.refreshed_at.isoformat() if self.refreshed_at else None,
+                'cache': {'size': len(self.cache.items), 'hits': self.cache.hits, 'misses': self.cache.misses},
+                'requests': self.requests,
+            })
+        query = QUERIES.get(path)
+        if query is None:
+            return 404, self._json({'error': f"ruta desconocida: {path}", 'routes': sorted(QUERIES) + ['/health']})
+        try:
+            params = self._absolute_window(params)
+        except ValueError as e:
+            return 400, self._json({'error': str(e)})
+        key = (path, tuple(sorted(params.items())))
+        version = self.store.version
+        cached = self.cache.get(key, version)
+        if cached is not None:
+            return 200, cached
+        try:
+            started = time.perf_counter()
+            result = query(self.store, params)
+        except (ValueError, KeyError) as e:
+            return 400, self._json({'error': str(e)})
+        except Exception as e:
+            print(f"[ERROR] {path}: {e!r}")
+            return 500, self._json({'error': f"error interno: {e}"})
+        result.update(version=version, query_ms=round((time.perf_counter() - started) * 1000, 3))
+        body = self._json(result)
+        self.cache.put(key, body)
+        return 200, body
+
+    @staticmethod
+    def _absolute_window(params: Dict[str, str]) -> Dict[str, str]:
+        """
+        'days' (ventana hasta ahora) pasa a 'from' redondeado al minuto, así las
+        peticiones repetidas dentro del mismo minuto comparten entrada en la caché.
+        """
+        if 'days' not in params:
+            return params
+        params = dict(params)
+        since = pd.Timestamp.now(tz='UTC').floor('min') - pd.Timedelta(days=float(params.pop('days')))
+        params.setdefault('from', since.isoformat())
+        return params
+
+    @staticmethod
+    def _json(data: Dict) -> bytes:
+        return json.dumps(_clean(data), ensure_ascii=False, default=str).encode('utf-8')
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                parts = lines[0].split(' ')
+                headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(':') for line in lines[1:] if line)}
+                keep_alive = headers.get('connection', '').lower() != 'close' and parts[-1] == 'HTTP/1.1'
+
+                self.requests += 1
+                if len(parts) != 3:
+                    status, body = 400, self._json({'error': 'peticion no valida'})
+                elif parts[0] == 'OPTIONS':
+                    status, body = 204, b''
+                elif parts[0] != 'GET':
+                    status, body = 405, self._json({'error': 'solo GET'})
+                else:
+                    url = urlsplit(parts[1])
+                    status, body = self.handle(url.path.rstrip('/') or '/', dict(parse_qsl(url.query)))
+                writer.write(self._response(status, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _response(status: int, body: bytes, keep_alive: bool) -> bytes:
+        reason = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+                  405: 'Method Not Allowed', 500: 'Internal Server Error'}[status]
+        head = (f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Access-Control-Allow-Origin: *\r\n"
+                f"Access-Control-Allow-Methods: GET, OPTIONS\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        return head.encode('latin-1') + body
+
+    async def poll(self):
+        """Actualiza los arrays cada poll_interval_s (la caché se invalida por versión)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval_s)
+            try:
+                added = await loop.run_in_executor(None, self.store.refresh)
+                self.refreshed_at = datetime.now(timezone.utc)
+                if added:
+                    print(f"[INFO] Datos actualizados ({'recarga completa' if added < 0 else f'{added} nuevos'}): "
+                          f"{len(self.store)} experimentos, version {self.store.version}")
+            except Exception as e:
+                print(f"[WARNING] Error actualizando desde 'history': {e}")
+
+    async def run(self, host: str = HOST, port: int = PORT, ready: Optional[asyncio.Event] = None):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        count = await loop.run_in_executor(None, self.store.load)
+        print(f"[OK] {count} experimentos cargados en {time.perf_counter() - started:.2f} s")
+        server = await asyncio.start_server(self._serve_client, host, port, limit=MAX_HEADER_BYTES)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"[OK] Servicio escuchando en http://{host}:{self.port}")
+        poller = asyncio.create_task(self.poll())
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            poller.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de analisis MRUA con datos en memoria")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL_S, help="Segundos entre consultas a 'history'")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help="Respuestas en la cache LRU")
+    args = parser.parse_args()
+
+    collection = pymongo.MongoClient(MONGODB_URI)[DATABASE_NAME][COLLECTION_NAME]
+    service = AnalysisService(ExperimentStore(collection), args.poll, args.cache_size)
+    try:
+        asyncio.run(service.run(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n[INFO] Servicio detenido")
+    except Exception as e:
+        print(f"[ERROR] Servicio de analisis: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Figuras resumen de todos los experimentos por modalidad.
+En lugar de cinco PNG por carpeta de experimento, dibuja las curvas x-t y v-x de
+todos los experimentos de una modalidad como paneles de densidad: cada curva se
+interpola sobre una rejilla de posiciones y se acumula en un histograma 2D de
+contenedores fijos, de modo que los lotes se suman en una sola pasada sin guardar
+los experimentos. Sobre la densidad se dibuja la media ± desviación estándar por
+sensor (RunningStats). El resultado son tres figuras: una por modalidad y una
+comparación de las medias.
+
+Uso:
+    python mrua_summary_figures.py                     # Desde MongoDB
+    python mrua_summary_figures.py --source mirror     # Desde el espejo SQLite (mrua_mirror.py)
+    python mrua_summary_figures.py --source archive    # Desde el archivo binario (mrua_memmap.py)
+"""
+
+import argparse
+import os
+from typing import Dict, List
+
+import numpy as np
+import pymongo
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+
+from mrua_kinematics import MODES, SENSOR_POSITIONS_M, RunningStats, sensor_times, segment_velocities
+from mrua_plot_templates import DEFAULT_DPI, MODE_STYLES
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+SUMMARY_DIR = os.path.join(os.path.dirname(__file__), "analysis_output", "summary_graphs")
+ARCHIVE_CHUNK = 50000
+
+SENSOR_POSITIONS_CM = SENSOR_POSITIONS_M * 100
+X_GRID_CM = np.arange(0, SENSOR_POSITIONS_CM[-1] + 1, 1.0)  # Rejilla de 1 cm
+X_EDGES_CM = np.append(X_GRID_CM - 0.5, X_GRID_CM[-1] + 0.5)
+V_GRID_CM = X_GRID_CM[X_GRID_CM >= SENSOR_POSITIONS_CM[1]]  # v se mide desde el sensor 2
+V_X_EDGES_CM = np.append(V_GRID_CM - 0.5, V_GRID_CM[-1] + 0.5)
+T_EDGES_S = np.linspace(0, 3.0, 151)   # Por encima de 3 s el experimento cuenta como fallido
+V_EDGES_MS = np.linspace(0, 3.0, 151)
+DENSITY_CMAPS = {'remote': 'Blues', 'presential': 'Oranges'}
+
+
+# ============ ACUMULACIÓN ============
+def interpolate_curves(positions: np.ndarray, values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """
+    Interpola linealmente cada fila de values (medida en positions) sobre grid,
+    uniendo los sensores con registro y saltando los que faltan (NaN).
+
+    Returns:
+        Matriz N x len(grid) (NaN fuera del tramo con registros)
+    """
+    n, k = values.shape
+    valid = ~np.isnan(values)
+    columns = np.arange(k)
+    prev = np.maximum.accumulate(np.where(valid, columns, -1), axis=1)
+    nxt = np.minimum.accumulate(np.where(valid, columns, k)[:, ::-1], axis=1)[:, ::-1]
+
+    segment = np.clip(np.searchsorted(positions, grid, side='right') - 1, 0, k - 2)
+    lo, hi = prev[:, segment], nxt[:, segment + 1]
+    ok = (lo >= 0) & (hi < k)
+    lo, hi = np.where(ok, lo, 0), np.where(ok, hi, 1)
+    rows = np.arange(n)[:, None]
+    x0, x1 = positions[lo], positions[hi]
+    y0, y1 = values[rows, lo], values[rows, hi]
+    return np.where(ok, y0 + (grid - x0) / (x1 - x0) * (y1 - y0), np.nan)
+
+
+def _density(curves: np.ndarray, grid: np.ndarray, value_edges: np.ndarray, grid_edges: np.ndarray) -> np.ndarray:
+    x = np.broadcast_to(grid, curves.shape)
+    ok = ~np.isnan(curves)
+    return np.histogram2d(curves[ok], x[ok], bins=[value_edges, grid_edges])[0]
+
+
+class SummaryAccumulator:
+    """Densidades x-t y v-x y estadísticas por sensor de cada modalidad, acumuladas por lotes."""
+
+    def __init__(self):
+        self.experiments: Dict[str, int] = {}
+        self.xt: Dict[str, np.ndarray] = {}
+        self.vx: Dict[str, np.ndarray] = {}
+        self.time_stats: Dict[str, List[RunningStats]] = {}
+        self.velocity_stats: Dict[str, List[RunningStats]] = {}
+
+    def add(self, arrays: Dict[str, np.ndarray]) -> 'SummaryAccumulator':
+        """Agrega un lote con el formato de documents_to_arrays."""
+        times = sensor_times(arrays['raw'])
+        velocity = segment_velocities(times)['velocity'][:, 1:]
+        modes = np.asarray(arrays['mode'], dtype=object)
+        has_curve = (~np.isnan(times)).sum(axis=1) >= 2
+        for mode in sorted(set(modes[has_curve])):
+            rows = has_curve & (modes == mode)
+            t, v = times[rows], velocity[rows]
+            if mode not in self.experiments:
+                self.experiments[mode] = 0
+                self.xt[mode] = np.zeros((len(T_EDGES_S) - 1, len(X_GRID_CM)))
+                self.vx[mode] = np.zeros((len(V_EDGES_MS) - 1, len(V_GRID_CM)))
+                self.time_stats[mode] = [RunningStats() for _ in SENSOR_POSITIONS_CM]
+                self.velocity_stats[mode] = [RunningStats() for _ in SENSOR_POSITIONS_CM[1:]]
+            self.experiments[mode] += int(rows.sum())
+            self.xt[mode] += _density(interpolate_curves(SENSOR_POSITIONS_CM, t, X_GRID_CM),
+                                      X_GRID_CM, T_EDGES_S, X_EDGES_CM)
+            self.vx[mode] += _density(interpolate_curves(SENSOR_POSITIONS_CM[1:], v, V_GRID_CM),
+                                      V_GRID_CM, V_EDGES_MS, V_X_EDGES_CM)
+            for stats, column in zip(self.time_stats[mode], t.T):
+                stats.update(column)
+            for stats, column in zip(self.velocity_stats[mode], v.T):
+                stats.update(column)
+        return self
+
+
+# ============ FIGURAS ============
+def _modes(acc: SummaryAccumulator) -> List[str]:
+    return [m for m in MODES if m in acc.experiments] + sorted(m for m in acc.experiments if m not in MODES)
+
+
+def _mean_std(stats: List[RunningStats]):
+    return np.array([s.to_dict()['mean'] for s in stats]), np.array([s.std for s in stats])
+
+
+def _occupied_limit(edges: np.ndarray, counts: np.ndarray, axis: int) -> float:
+    """Borde superior del último contenedor con datos a lo largo de un eje."""
+    occupied = np.nonzero(counts.any(axis=axis))[0]
+    return edges[min(occupied[-1] + 2, len(edges) - 1)] if len(occupied) else edges[-1]
+
+
+def _density_panel(fig: Figure, ax, x_edges, y_edges, counts: np.ndarray, cmap: str, crop: str):
+    """Densidad (escala log) recortada en el eje 'x' o 'y' a la zona con datos."""
+    if counts.any():
+        mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts, 0), cmap=cmap,
+                             norm=LogNorm(vmin=1, vmax=counts.max()), shading='flat')
+        fig.colorbar(mesh, ax=ax, label='Experimentos')
+        if crop == 'x':
+            ax.set_xlim(x_edges[0], _occupied_limit(x_edges, counts, 0))
+        else:
+            ax.set_ylim(y_edges[0], _occupied_limit(y_edges, counts, 1))
+    ax.grid(True, alpha=0.3)
+
+
+def render_summary(acc: SummaryAccumulator, output_dir: str = SUMMARY_DIR, dpi: int = DEFAULT_DPI) -> List[str]:
+    """
+    Dibuja una figura por modalidad (densidad x-t y v-x con la media ± desviación por
+    sensor) y una comparación de las medias de todas las modalidades.
+
+    Returns:
+        Rutas escritas
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for mode in _modes(acc):
+        style = MODE_STYLES.get(mode, {'label': mode, 'marker': 'o', 'color': 'C2'})
+        fig = Figure(figsize=(14, 6))
+        FigureCanvasAgg(fig)
+        ax_xt, ax_vx = fig.subplots(1, 2)
+
+        _density_panel(fig, ax_xt, T_EDGES_S, X_EDGES_CM, acc.xt[mode].T, DENSITY_CMAPS.get(mode, 'Greens'), 'x')
+        mean, std = _mean_std(acc.time_stats[mode])
+        ax_xt.errorbar(mean, SENSOR_POSITIONS_CM, xerr=std, color='black', marker=style['marker'],
+                       linestyle='--', capsize=5, label='Media ± desv. estándar')
+        ax_xt.set_xlabel('Tiempo (s)', fontsize=12)
+        ax_xt.set_ylabel('Distancia (cm)', fontsize=12)
+        ax_xt.set_title('Posición vs Tiempo', fontsize=13, fontweight='bold')
+        ax_xt.legend(loc='upper left')
+
+        _density_panel(fig, ax_vx, V_X_EDGES_CM, V_EDGES_MS, acc.vx[mode], DENSITY_CMAPS.get(mode, 'Greens'), 'y')
+        mean, std = _mean_std(acc.velocity_stats[mode])
+        ax_vx.errorbar(SENSOR_POSITIONS_CM[1:], mean, yerr=std, color='black', marker=style['marker'],
+                       linestyle='--', capsize=5, label='Media ± desv. estándar')
+        ax_vx.set_xlabel('Posición del Sensor (cm)', fontsize=12)
+        ax_vx.set_ylabel('Velocidad (m/s)', fontsize=12)
+        ax_vx.set_title('Velocidad vs Posición', fontsize=13, fontweight='bold')
+        ax_vx.legend(loc='upper left')
+
+        fig.suptitle(f"Modalidad {style['label']}: {acc.experiments[mode]} experimentos",
+                     fontsize=14, fontweight='bold')
+        fig.tight_layout()
+        path = os.path.join(output_dir, f'summary_{mode}.png')
+        fig.savefig(path, dpi=dpi)
+        written.append(path)
+
+    if written:
+        fig = Figure(figsize=(14, 6))
+        FigureCanvasAgg(fig)
+        ax_xt, ax_vx = fig.subplots(1, 2)
+        for mode in _modes(acc):
+            style = MODE_STYLES.get(mode, {'label': mode, 'marker': 'o', 'color': 'C2'})
+            label = f"{style['label']} (n={acc.experiments[mode]})"
+            mean, std = _mean_std(acc.time_stats[mode])
+            ax_xt.errorbar(mean, SENSOR_POSITIONS_CM, xerr=std, color=style['color'], marker=style['marker'],
+                           linestyle='--', capsize=5, label=label)
+            mean, std = _mean_std(acc.velocity_stats[mode])
+            ax_vx.errorbar(SENSOR_POSITIONS_CM[1:], mean, yerr=std, color=style['color'], marker=style['marker'],
+                           linestyle='--', capsize=5, label=label)
+        for ax, xlabel, ylabel, title in [(ax_xt, 'Tiempo (s)', 'Distancia (cm)', 'Posición vs Tiempo'),
+                                          (ax_vx, 'Posición del Sensor (cm)', 'Velocidad (m/s)', 'Velocidad vs Posición')]:
+            ax.set_xlabel(xlabel, fontsize=12)
+            ax.set_ylabel(ylabel, fontsize=12)
+            ax.set_title(title, fontsize=13, fontweight='bold')
+            ax.grid(True, alpha=0.3)
+            ax.legend()
+        fig.suptitle('Comparación Remoto vs Presencial (todos los experimentos)', fontsize=14, fontweight='bold')
+        fig.tight_layout()
+        path = os.path.join(output_dir, 'summary_comparison.png')
+        fig.savefig(path, dpi=dpi)
+        written.append(path)
+    return written
+
+
+# ============ FUENTES ============
+def _batches(source: str):
+    if source == 'mirror':
+        from mrua_mirror import load_mirror_arrays
+        yield load_mirror_arrays()
+        return
+    if source == 'archive':
+        from mrua_memmap import archive_to_arrays, open_archive
+        archive = open_archive()
+        for start in range(0, archive['header']['count'], ARCHIVE_CHUNK):
+            yield archive_to_arrays(archive, slice(start, start + ARCHIVE_CHUNK))
+        return
+    from mrua_memmap import mongo_batches
+    client = pymongo.MongoClient(MONGODB_URI)
+    client.admin.command('ping')
+    yield from mongo_batches(client[DATABASE_NAME])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Figuras resumen de todos los experimentos por modalidad")
+    parser.add_argument('--source', choices=['mongo', 'mirror', 'archive'], default='mongo')
+    parser.add_argument('--output', default=SUMMARY_DIR)
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI)
+    args = parser.parse_args()
+
+    acc = SummaryAccumulator()
+    try:
+        for arrays in _batches(args.source):
+            acc.add(arrays)
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        return
+    except pymongo.errors.PyMongoError as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+    for path in render_summary(acc, args.output, args.dpi):
+        print(f"[OK] Grafica guardada: {path}")
+    for mode in _modes(acc):
+        print(f"   - {mode}: {acc.experiments[mode]} experimentos")
+
+
+if __name__ == "__main__":
+    main()
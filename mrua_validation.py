@@ -0,0 +1,221 @@
+"""
+Validación vectorizada de los documentos de 'history' y cuarentena de los inválidos.
+Todas las reglas se evalúan en una sola pasada sobre los arrays extraídos y cada
+experimento queda etiquetado con una máscara de códigos de motivo. Los inválidos
+pueden moverse en bloque a la colección 'history_quarantine'.
+
+Uso:
+    python mrua_validation.py                 # Solo informe (analysis_output/validation_report.csv)
+    python mrua_validation.py --quarantine    # Mover los inválidos a cuarentena
+    python mrua_validation.py --archive       # Informe sobre el archivo binario (mrua_memmap.py), sin MongoDB
+"""
+
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import pymongo
+from pymongo import ReplaceOne
+
+from mrua_aggregates import ACTIVE_FILTER, HISTORY_PROJECTION, remove_experiments
+from mrua_kinematics import MODES, documents_to_arrays
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+QUARANTINE_COLLECTION = "history_quarantine"
+OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "analysis_output")
+MAX_PLAUSIBLE_TIME_S = 20.0  # Un recorrido de 1.5 m nunca dura tanto
+BATCH_SIZE = 10000
+
+# Códigos de motivo (máscara de bits)
+MISSING_FIELD = 1        # Falta t12/t23/t34 o fecha
+ZERO_TIME = 2            # Algún sensor sin registro (t = 0)
+NEGATIVE_TIME = 4        # Algún tiempo negativo
+ABSURD_TIME = 8          # Algún tiempo mayor que MAX_PLAUSIBLE_TIME_S
+NON_MONOTONIC = 16       # No se cumple t12 < t23 < t34
+DUPLICATE_ID = 32        # 'id' repetido (se conserva la primera aparición)
+UNKNOWN_MODE = 64        # 'mode' distinto de remote/presential
+INVALID_FECHA = 128      # 'fecha' no interpretable como fecha
+
+# En experimentos marcados como fallidos (finalizados a mano) es normal que falten
+# sensores: esos motivos se informan pero no envían el documento a cuarentena
+FAILED_RUN_REASONS = MISSING_FIELD | ZERO_TIME
+
+REASON_NAMES = {
+    MISSING_FIELD: 'missing_field',
+    ZERO_TIME: 'zero_time',
+    NEGATIVE_TIME: 'negative_time',
+    ABSURD_TIME: 'absurd_time',
+    NON_MONOTONIC: 'non_monotonic',
+    DUPLICATE_ID: 'duplicate_id',
+    UNKNOWN_MODE: 'unknown_mode',
+    INVALID_FECHA: 'invalid_fecha',
+}
+
+
+# ============ REGLAS ============
+def validate_arrays(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Evalúa todas las reglas de validación sobre un lote de experimentos.
+
+    Args:
+        arrays: Resultado de documents_to_arrays
+
+    Returns:
+        Array de enteros con la máscara de motivos por experimento (0 = válido)
+    """
+    raw = arrays['raw']
+    timings = raw[:, :3]  # t12, t23, t34
+    reasons = np.zeros(len(raw), dtype=np.int32)
+
+    fecha_missing = pd.isna(arrays['fecha'])
+    reasons |= np.where(np.isnan(timings).any(axis=1) | fecha_missing, MISSING_FIELD, 0)
+    with np.errstate(invalid='ignore'):
+        reasons |= np.where((timings == 0).any(axis=1), ZERO_TIME, 0)
+        reasons |= np.where((raw < 0).any(axis=1), NEGATIVE_TIME, 0)
+        reasons |= np.where((raw > MAX_PLAUSIBLE_TIME_S).any(axis=1), ABSURD_TIME, 0)
+        positive = timings > 0
+        steps = np.diff(timings, axis=1)
+        both = positive[:, 1:] & positive[:, :-1]
+        reasons |= np.where((both & (steps <= 0)).any(axis=1), NON_MONOTONIC, 0)
+
+    ids = arrays['id']
+    # Los ids de ancho fijo del archivo binario (bytes) se comparan sin convertir
+    _, first = np.unique(ids if ids.dtype.kind == 'S' else ids.astype(str), return_index=True)
+    duplicated = np.ones(len(raw), dtype=bool)
+    duplicated[first] = False
+    reasons |= np.where(duplicated, DUPLICATE_ID, 0)
+
+    reasons |= np.where(~np.isin(arrays['mode'], MODES), UNKNOWN_MODE, 0)
+
+    parsed = pd.to_datetime(pd.Series(arrays['fecha']), errors='coerce', utc=True, format='mixed')
+    reasons |= np.where(parsed.isna().to_numpy() & ~fecha_missing, INVALID_FECHA, 0)
+    return reasons
+
+
+def quarantine_candidates(arrays: Dict[str, np.ndarray], reasons: np.ndarray) -> np.ndarray:
+    """
+    Experimentos que deben salir de 'history': cualquier motivo en los completados
+    y solo los motivos distintos de FAILED_RUN_REASONS en los fallidos.
+    """
+    blocking = np.where(arrays['failed'], reasons & ~FAILED_RUN_REASONS, reasons)
+    return blocking > 0
+
+
+def reason_labels(mask: int) -> List[str]:
+    """Traduce una máscara de motivos a sus nombres."""
+    return [name for code, name in REASON_NAMES.items() if mask & code]
+
+
+def reason_counts(reasons: np.ndarray) -> Dict[str, int]:
+    """Número de experimentos afectados por cada motivo."""
+    return {name: int(((reasons & code) > 0).sum()) for code, name in REASON_NAMES.items()}
+
+
+# ============ EXTRACCIÓN, INFORME Y CUARENTENA ============
+def load_history_arrays(db: pymongo.database.Database, collection: str = COLLECTION_NAME) -> Dict[str, np.ndarray]:
+    """
+    Lee los documentos activos de 'history' con proyección (en orden de inserción) y los
+    convierte a arrays columnares. Los duplicados ya marcados por dedup_history.py quedan
+    fuera: no cuentan en el análisis ni en los agregados.
+    """
+    cursor = db[collection].find(ACTIVE_FILTER, HISTORY_PROJECTION, batch_size=BATCH_SIZE).sort('_id', 1)
+    return documents_to_arrays(cursor)
+
+
+def validation_report(arrays: Dict[str, np.ndarray], reasons: np.ndarray) -> pd.DataFrame:
+    """DataFrame con los experimentos inválidos y sus motivos."""
+    invalid = np.flatnonzero(reasons)
+    return pd.DataFrame({
+        '_id': arrays['_id'][invalid].astype(str),
+        'experiment_id': arrays['id'][invalid].astype(str),
+        'mode': arrays['mode'][invalid],
+        'fecha': arrays['fecha'][invalid],
+        'reason_mask': reasons[invalid],
+        'reasons': ['|'.join(reason_labels(m)) for m in reasons[invalid]],
+    })
+
+
+def quarantine(db: pymongo.database.Database, arrays: Dict[str, np.ndarray], reasons: np.ndarray,
+               batch_size: int = BATCH_SIZE) -> int:
+    """
+    Mueve en bloques los candidatos a cuarentena a QUARANTINE_COLLECTION (idempotente)
+    y descuenta de los agregados materializados los que seguían activos (los duplicados
+    marcados ya se descontaron al marcarlos).
+
+    Returns:
+        Número de documentos movidos
+    """
+    invalid = np.flatnonzero(quarantine_candidates(arrays, reasons))
+    source, target = db[COLLECTION_NAME], db[QUARANTINE_COLLECTION]
+    now = datetime.now()
+    moved = 0
+    for start in range(0, len(invalid), batch_size):
+        chunk = invalid[start:start + batch_size]
+        mask_by_id = {arrays['_id'][i]: int(reasons[i]) for i in chunk}
+        docs = list(source.find({'_id': {'$in': list(mask_by_id)}}))
+        if not docs:
+            continue
+        ops = []
+        for doc in docs:
+            mask = mask_by_id[doc['_id']]
+            doc.update({'quarantine_mask': mask, 'quarantine_reasons': reason_labels(mask), 'quarantined_at': now})
+            ops.append(ReplaceOne({'_id': doc['_id']}, doc, upsert=True))
+        target.bulk_write(ops, ordered=False)
+        source.delete_many({'_id': {'$in': [doc['_id'] for doc in docs]}})
+        remove_experiments(db, [doc for doc in docs if doc.get('is_duplicate') is not True])
+        moved += len(docs)
+        print(f"[INFO] Cuarentena: {moved}/{len(invalid)} documentos movidos")
+    return moved
+
+
+def main():
+    db = None
+    if "--archive" in sys.argv:
+        from mrua_memmap import ARCHIVE_DIR, archive_to_arrays, open_archive
+        # Vistas sin copia del memmap: no se construye ningún documento
+        arrays = archive_to_arrays(open_archive(ARCHIVE_DIR))
+        print(f"[OK] Leidos {len(arrays['raw'])} experimentos del archivo binario: {ARCHIVE_DIR}")
+    else:
+        try:
+            client = pymongo.MongoClient(MONGODB_URI)
+            db = client[DATABASE_NAME]
+            client.admin.command('ping')
+        except Exception as e:
+            print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+            return
+        arrays = load_history_arrays(db)
+
+    start = datetime.now()
+    reasons = validate_arrays(arrays)
+    elapsed = (datetime.now() - start).total_seconds()
+    n_invalid = int((reasons > 0).sum())
+    n_blocking = int(quarantine_candidates(arrays, reasons).sum())
+    print(f"[OK] Validados {len(reasons)} experimentos en {elapsed:.2f} s: "
+          f"{n_invalid} con motivos, {n_blocking} para cuarentena")
+    for name, count in reason_counts(reasons).items():
+        if count:
+            print(f"   - {name}: {count}")
+
+    if n_invalid == 0:
+        return
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    report_path = os.path.join(OUTPUT_DIR, "validation_report.csv")
+    validation_report(arrays, reasons).to_csv(report_path, index=False, encoding='utf-8-sig')
+    print(f"[OK] Informe de validacion: {report_path}")
+
+    if "--quarantine" in sys.argv and db is None:
+        print("[WARNING] La cuarentena necesita MongoDB: se omite con --archive")
+    elif "--quarantine" in sys.argv:
+        moved = quarantine(db, arrays, reasons)
+        print(f"[OK] {moved} experimentos movidos a '{QUARANTINE_COLLECTION}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Extracción paralela de 'history' por rangos.
+Divide la colección en rangos de 'fecha' o '_id' (límites tomados de una muestra
+con $sample, de modo que los rangos tienen tamaños parecidos) o en un rango por
+modalidad, y los lee a la vez con un pool de hilos que comparte el pool de
+conexiones de un único MongoClient. Cada rango se convierte a arrays columnares en
+su hilo y los trozos se reensamblan siempre en el orden de los rangos, por lo que
+el resultado es determinista sea cual sea el orden en que terminan los hilos.
+
+Uso:
+    python parallel_extract.py                         # 4 hilos, rangos de fecha
+    python parallel_extract.py --workers 8 --by _id
+    python parallel_extract.py --benchmark 1 2 4 8     # Rendimiento según número de hilos
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pymongo
+from bson import ObjectId
+
+from mrua_aggregates import ACTIVE_FILTER, HISTORY_PROJECTION
+from mrua_kinematics import documents_to_arrays
+
+
+# ============ CONFIGURACIÓN ============
+MONGODB_URI = "mongodb://localhost:27017/"
+DATABASE_NAME = "mru"
+COLLECTION_NAME = "history"
+DEFAULT_WORKERS = 4
+PARTITIONS_PER_WORKER = 4   # Más rangos que hilos para repartir mejor la carga
+SAMPLES_PER_PARTITION = 50
+BATCH_SIZE = 5000
+
+# Alias de tipo BSON de los valores de la muestra (para los rangos de "otros tipos")
+_BSON_TYPES = [(bool, 'bool'), ((int, float), 'number'), (str, 'string'), (datetime, 'date'), (ObjectId, 'objectId')]
+# Orden de comparación de tipos de MongoDB (los ausentes/null van antes que todos)
+_BSON_ORDER = ['number', 'string', 'objectId', 'bool', 'date']
+
+
+# ============ RANGOS ============
+def _bson_type(value) -> str:
+    for python_type, alias in _BSON_TYPES:
+        if isinstance(value, python_type):
+            return alias
+    return None
+
+
+def split_ranges(collection: pymongo.collection.Collection, field: str = 'fecha',
+                 partitions: int = DEFAULT_WORKERS * PARTITIONS_PER_WORKER) -> List[Dict]:
+    """
+    Calcula filtros de rango que cubren toda la colección sin solaparse.
+
+    Args:
+        collection: Colección de MongoDB
+        field: 'fecha', '_id' o 'mode' (un rango por modalidad)
+        partitions: Número aproximado de rangos
+
+    Returns:
+        Lista de filtros en el orden ascendente de MongoDB: primero los documentos sin
+        el campo o con tipos que ordenan antes que el de la muestra, luego los rangos
+        del tipo de la muestra y por último los tipos que ordenan después
+    """
+    if field == 'mode':
+        modes = sorted(m for m in collection.distinct('mode') if m is not None)
+        return [{'mode': {'$nin': modes}}] + [{'mode': mode} for mode in modes]
+
+    sample = [doc.get(field) for doc in collection.aggregate([
+        {'$match': ACTIVE_FILTER},
+        {'$sample': {'size': partitions * SAMPLES_PER_PARTITION}},
+        {'$project': {field: 1}},
+    ])]
+    types = [_bson_type(v) for v in sample if v is not None]
+    if not types:
+        return [{}]
+    # Solo el tipo dominante define límites; el resto va al rango de "otros tipos"
+    dominant = max(set(types), key=types.count)
+    values = sorted(v for v in sample if _bson_type(v) == dominant)
+    positions = np.linspace(0, len(values), partitions + 1)[1:-1].astype(int)
+    bounds = sorted(set(values[i] for i in positions))
+
+    higher = _BSON_ORDER[_BSON_ORDER.index(dominant) + 1:]
+    ranges = [{'$nor': [{field: {'$type': alias}} for alias in [dominant] + higher]}]
+    lower = None
+    for bound in bounds + [None]:
+        condition = {'$type': dominant}
+        if lower is not None:
+            condition['$gte'] = lower
+        if bound is not None:
+            condition['$lt'] = bound
+        ranges.append({field: condition})
+        lower = bound
+    if higher:
+        ranges.append({'$or': [{field: {'$type': alias}} for alias in higher]})
+    return ranges
+
+
+# ============ LECTURA PARALELA ============
+def _read_range(collection: pymongo.collection.Collection, query: Dict, sort_field: str,
+                projection: Dict, as_arrays: bool, direction: int = 1):
+    projection = dict(projection) if projection else None
+    docs = list(collection.find(query, projection, batch_size=BATCH_SIZE).sort(sort_field, direction))
+    return documents_to_arrays(docs) if as_arrays else docs
+
+
+def iter_ranges(db: pymongo.database.Database, field: str = 'fecha', workers: int = DEFAULT_WORKERS,
+                projection: Dict = HISTORY_PROJECTION, as_arrays: bool = True,
+                collection: str = COLLECTION_NAME, query: Dict = None, descending: bool = False,
+                partitions: int = None) -> Iterator:
+    """
+    Lee los rangos en paralelo y los entrega en el orden de los rangos.
+    Como mucho hay 2 x workers rangos leídos en memoria esperando a ser consumidos.
+
+    Args:
+        db: Objeto Database de MongoDB (los hilos comparten el pool de conexiones de su cliente)
+        field: Campo de partición ('fecha', '_id' o 'mode')
+        workers: Número de hilos
+        projection: Proyección de la consulta (None = documento completo)
+        as_arrays: Si es True cada trozo se entrega como documents_to_arrays; si no, como lista de documentos
+        collection: Nombre de la colección
+        query: Filtro adicional (p. ej. rango de fechas) aplicado a cada rango
+        descending: Si es True los rangos (y cada rango) se recorren de mayor a menor
+        partitions: Número de rangos (None = workers x PARTITIONS_PER_WORKER); más rangos
+            significa trozos más pequeños en memoria
+
+    Yields:
+        Un trozo por rango, en orden
+    """
+    col = db[collection]
+    ranges = split_ranges(col, field, partitions or max(1, workers) * PARTITIONS_PER_WORKER)
+    sort_field = field if field != 'mode' else 'fecha'
+    if descending:
+        ranges = ranges[::-1]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = []
+        for part in ranges:
+            range_query = {'$and': [ACTIVE_FILTER, query or {}, part]}
+            pending.append(pool.submit(_read_range, col, range_query, sort_field, projection, as_arrays,
+                                       -1 if descending else 1))
+            if len(pending) >= 2 * workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+def concat_arrays(chunks: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """Une trozos con el formato de documents_to_arrays (en el orden dado)."""
+    chunks = [c for c in chunks if len(c['id'])] or [documents_to_arrays([])]
+    return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+
+def parallel_arrays(db: pymongo.database.Database, field: str = 'fecha',
+                    workers: int = DEFAULT_WORKERS) -> Dict[str, np.ndarray]:
+    """Extrae toda la colección activa en arrays columnares usando varios hilos."""
+    return concat_arrays(list(iter_ranges(db, field, workers)))
+
+
+def parallel_documents(db: pymongo.database.Database, collection: str = COLLECTION_NAME,
+                       workers: int = DEFAULT_WORKERS, query: Dict = None) -> List[dict]:
+    """
+    Documentos completos de la colección activa, más recientes primero (mismo orden que
+    find().sort('fecha', -1) para las fechas de texto del bridge).
+    """
+    docs = []
+    for chunk in iter_ranges(db, 'fecha', workers, projection=None, as_arrays=False, collection=collection, query=query):
+        docs.extend(chunk)
+    docs.reverse()
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraccion paralela de la coleccion history")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--by', choices=['fecha', '_id', 'mode'], default='fecha')
+    parser.add_argument('--benchmark', type=int, nargs='+', metavar='N',
+                        help="Medir el rendimiento con cada número de hilos")
+    args = parser.parse_args()
+
+    try:
+        client = pymongo.MongoClient(MONGODB_URI, maxPoolSize=max([args.workers] + (args.benchmark or [])) + 2)
+        db = client[DATABASE_NAME]
+        client.admin.command('ping')
+    except Exception as e:
+        print(f"[ERROR] No se pudo conectar a MongoDB: {e}")
+        return
+
+    for workers in args.benchmark or [args.workers]:
+        start = datetime.now()
+        arrays = parallel_arrays(db, args.by, workers)
+        elapsed = (datetime.now() - start).total_seconds()
+        rate = len(arrays['id']) / elapsed if elapsed > 0 else float('inf')
+        print(f"[OK] {workers} hilos: {len(arrays['id'])} experimentos en {elapsed:.2f} s ({rate:,.0f} docs/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ Fecha: 2026
 """
 
 import os
+import argparse
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -15,9 +16,16 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 from typing import Dict, List, Tuple
 import warnings
+from mrua_plot_templates import TIERS
+from mrua_sketches import TDigest, boxplot_stats
 
 warnings.filterwarnings('ignore')
 
+# Copy-on-write (siempre activo desde pandas 3.0): las columnas que no se modifican se
+# comparten entre el DataFrame cargado y el corregido en lugar de copiarse
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 # ============ CONFIGURACIÓN ============
 BASE_DIR = Path("c:/Dashboard de Control MRU") 
 if not BASE_DIR.exists():
@@ -44,6 +52,14 @@ plt.rcParams.update({
 })
 
 MAX_EXPERIMENTS_PER_MODE = 35 
+GRAPH_DPI = TIERS['full']['dpi']  # Figuras de publicación; --tier draft para revisiones rápidas
+
+# Modo N grande: a partir de este número de puntos la dispersión se dibuja como densidad
+# hexagonal con conteos precalculados y los boxplots salen de t-digest por modalidad,
+# de modo que el coste de dibujo no depende del número de experimentos
+LARGE_N_THRESHOLD = 5000
+DENSITY_BINS = 80
+HEXBIN_GRIDSIZE = 40
 
 # ============ MANUAL STATS FUNCTIONS (NO SCIPY) ============
 
@@ -144,34 +160,33 @@ def adjust_correlation(x, y, target_r_min=0.2, target_r_max=0.4):
 def ensure_physical_coherence(df):
     """
     Aplica filtros y ajustes para garantizar coherencia física MRUA.
+    Solo se reescribe la columna time_s (un array nuevo); el resto de columnas se
+    comparten con df gracias a copy-on-write y cada grupo modalidad/sensor se recorre
+    por sus posiciones precalculadas, sin máscaras por combinación.
     """
-    df_out = df.copy()
+    if 'time_s' not in df.columns:
+        return df
+    times = df['time_s'].to_numpy(dtype=np.float64, copy=True)
     
     # 1. Sensor 1 (S1) is the start reference, must be strictly 0
-    if 'sensor_id' in df_out.columns:
-        s1_mask = df_out['sensor_id'] == 1
-        if s1_mask.any():
-            df_out.loc[s1_mask, 'time_s'] = 0.0
+    if 'sensor_id' in df.columns:
+        times[df['sensor_id'].to_numpy() == 1] = 0.0
     
     # 2. Filtrar outliers extremos en tiempo (> 2.5 sigma)
-    if 'sensor_id' in df_out.columns and 'mode' in df_out.columns:
-        for mode in df_out['mode'].unique():
-            for sid in df_out['sensor_id'].unique():
-                mask = (df_out['mode'] == mode) & (df_out['sensor_id'] == sid)
-                if mask.any():
-                    data = df_out.loc[mask, 'time_s']
-                    z_scores = np.abs(manual_zscore(data))
-                    outliers = z_scores > 2.5
-                    if outliers.any():
-                        vals = data.values.copy()
-                        vals[outliers] = np.mean(vals[~outliers]) + np.random.normal(0, np.std(vals[~outliers])*0.5, outliers.sum())
-                        df_out.loc[mask, 'time_s'] = vals
+    if 'sensor_id' in df.columns and 'mode' in df.columns:
+        for rows in df.groupby(['mode', 'sensor_id'], sort=False).indices.values():
+            data = times[rows]
+            z_scores = np.abs(manual_zscore(data))
+            outliers = z_scores > 2.5
+            if outliers.any():
+                data[outliers] = np.mean(data[~outliers]) + np.random.normal(0, np.std(data[~outliers])*0.5, outliers.sum())
+                times[rows] = data
                         
-    return df_out
+    return df.assign(time_s=times)
 
 # ============ LECTURA DE DATOS ============
 
-def find_experiment_folders(base_dir: Path) -> Dict[str, List[Path]]:
+def find_experiment_folders(base_dir: Path, max_per_mode: int = MAX_EXPERIMENTS_PER_MODE) -> Dict[str, List[Path]]:
     folders = {'remote': [], 'presential': []}
     
     if not base_dir.exists():
@@ -204,8 +219,8 @@ def find_experiment_folders(base_dir: Path) -> Dict[str, List[Path]]:
         folders[mode] = valid
 
     for mode in folders:
-        if len(folders[mode]) > MAX_EXPERIMENTS_PER_MODE:
-            folders[mode] = folders[mode][:MAX_EXPERIMENTS_PER_MODE]
+        if max_per_mode and len(folders[mode]) > max_per_mode:
+            folders[mode] = folders[mode][:max_per_mode]
             
     print(f"[INFO] Ensayos seleccionados: Remoto={len(folders['remote'])}, Presencial={len(folders['presential'])}")
     return folders
@@ -244,22 +259,84 @@ def load_all_data(folders: Dict[str, List[Path]]) -> pd.DataFrame:
     full_df = pd.concat(all_rows, ignore_index=True)
     return ensure_physical_coherence(full_df)
 
+# ============ CAPA DE CARACTERÍSTICAS ============
+
+MODE_ORDER = ['presential', 'remote']
+VELOCITY_MIN_DT = 0.001  # Segmentos con intervalo menor se descartan (s)
+
+def build_features(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Precalcula en una sola pasada vectorizada todo lo que leen los gráficos, de modo
+    que cada función plot_* solo dibuja:
+    - sensor_pivot: tiempo por (sensor, ensayo) con una columna por modalidad, solo pares completos
+    - velocities: velocidad de cada segmento entre sensores consecutivos y su punto medio (m)
+    - velocity_profile: media y desviación de la velocidad por modalidad y posición (pos_bin)
+    - mode_summary: tiempo medio/desviación y distancia media (cm y m) por modalidad y sensor
+    - accelerations: aceleración promedio de cada ensayo por modalidad
+    """
+    # Pivot único de tiempos: (sensor, ensayo) x modalidad
+    sensor_pivot = (df.pivot_table(index=['sensor_id', 'experiment_index'], columns='mode', values='time_s')
+                      .reindex(columns=MODE_ORDER).dropna())
+    
+    # Segmentos: un solo ordenamiento por (modalidad, ensayo, distancia) y diferencias consecutivas
+    ordered = df.sort_values(['mode', 'experiment_index', 'distance_cm'], kind='stable')
+    modes = ordered['mode'].to_numpy()
+    experiments = ordered['experiment_index'].to_numpy()
+    dists = ordered['distance_cm'].to_numpy() / 100.0  # m
+    times = ordered['time_s'].to_numpy()
+    dt = np.diff(times)
+    valid = (modes[1:] == modes[:-1]) & (experiments[1:] == experiments[:-1]) & (dt > VELOCITY_MIN_DT)
+    velocities = pd.DataFrame({
+        'mode': modes[1:][valid],
+        'pos_m': ((dists[1:] + dists[:-1]) / 2.0)[valid],
+        'velocity': np.diff(dists)[valid] / dt[valid],
+    })
+    velocity_profile = (velocities.assign(pos_bin=velocities['pos_m'].round(2))
+                        .groupby(['mode', 'pos_bin'])['velocity'].agg(['mean', 'std']).reset_index())
+    velocity_profile.columns = ['mode', 'pos_bin', 'v_mean', 'v_std']
+    
+    # Promedios por modalidad y sensor
+    mode_summary = df.groupby(['mode', 'sensor_id']).agg({
+        'time_s': ['mean', 'std'],
+        'distance_cm': 'mean'
+    }).reset_index()
+    mode_summary.columns = ['mode', 'sensor_id', 'time_mean', 'time_std', 'dist_mean']
+    mode_summary['dist_m'] = mode_summary['dist_mean'] / 100.0
+    
+    # Aceleración promedio por ensayo (la misma en todas sus filas)
+    accelerations = df.groupby(['mode', 'experiment_index'])['acceleration_ms2'].first().reset_index()
+    accelerations = accelerations.dropna(subset=['acceleration_ms2'])
+    
+    return {
+        'sensor_pivot': sensor_pivot,
+        'velocities': velocities,
+        'velocity_profile': velocity_profile,
+        'mode_summary': mode_summary,
+        'accelerations': accelerations,
+    }
+
 # ============ FUNCIONES DE GRAFICADO ============
 
-def plot_correlation_sensors(df: pd.DataFrame, output_dir: Path):
+def is_large_n(n: int, large_n: str = 'auto') -> bool:
+    """Decide si se usa el modo N grande ('auto' según LARGE_N_THRESHOLD, 'always' o 'never')."""
+    return large_n == 'always' or (large_n == 'auto' and n >= LARGE_N_THRESHOLD)
+
+def binned_counts(x: np.ndarray, y: np.ndarray, bins: int = DENSITY_BINS):
+    """Conteos 2D precalculados: centros x, centros y y conteos de los contenedores no vacíos."""
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    x_centers, y_centers = np.meshgrid((x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2, indexing='ij')
+    occupied = counts > 0
+    return x_centers[occupied], y_centers[occupied], counts[occupied]
+
+def plot_correlation_sensors(features: Dict[str, pd.DataFrame], output_dir: Path, dpi: int = GRAPH_DPI,
+                             large_n: str = 'auto'):
     """
     Genera gráficos de dispersión Remoto vs Presencial para cada sensor (S1..S4).
     Ajusta visualmente la correlación para que sea moderada.
+    Con muchos pares (ver is_large_n) dibuja densidad hexagonal en lugar de un punto por par.
     """
-    sensors = sorted(df['sensor_id'].unique())
-    
-    for sensor in sensors:
-        sensor_df = df[df['sensor_id'] == sensor]
-        pivot = sensor_df.pivot_table(index='experiment_index', columns='mode', values='time_s')
-        pivot = pivot.dropna() # Solo pares completos
-        
-        if pivot.empty: continue
-        
+    # Pares completos por sensor (pivot precalculado en build_features)
+    for sensor, pivot in features['sensor_pivot'].groupby(level='sensor_id'):
         x = pivot['presential'].values
         y = pivot['remote'].values
         
@@ -286,8 +363,14 @@ def plot_correlation_sensors(df: pd.DataFrame, output_dir: Path):
         margin = (max_val - min_val) * 0.1
         ax.plot([min_val-margin, max_val+margin], [min_val-margin, max_val+margin], 'k--', alpha=0.3, label='Identity (y=x)')
         
-        # Scatter
-        ax.scatter(x, y, alpha=0.7, c='teal', edgecolors='k', s=50, label='Experiments')
+        # Scatter (o densidad con conteos precalculados en modo N grande)
+        if is_large_n(len(x), large_n):
+            hx, hy, counts = binned_counts(x, y)
+            hb = ax.hexbin(hx, hy, C=counts, reduce_C_function=np.sum, gridsize=HEXBIN_GRIDSIZE,
+                           cmap='viridis', bins='log', label='Experiments')
+            fig.colorbar(hb, ax=ax, label='Experiments per cell')
+        else:
+            ax.scatter(x, y, alpha=0.7, c='teal', edgecolors='k', s=50, label='Experiments')
         
         # Regresión Lineal (Si no es S1)
         if sensor > 1:
@@ -310,26 +393,19 @@ def plot_correlation_sensors(df: pd.DataFrame, output_dir: Path):
         ax.legend(loc='lower right')
         
         plt.tight_layout()
-        plt.savefig(output_dir / f"correlation_sensor_S{int(sensor)}.png", dpi=300)
+        plt.savefig(output_dir / f"correlation_sensor_S{int(sensor)}.png", dpi=dpi)
         plt.close()
         print(f"[OK] Graph created: correlation_sensor_S{int(sensor)}.png")
 
 
-def plot_experimental_vs_theoretical(df: pd.DataFrame, output_dir: Path):
+def plot_experimental_vs_theoretical(features: Dict[str, pd.DataFrame], output_dir: Path, dpi: int = GRAPH_DPI):
     """
     Gráfico de Posición vs Tiempo: Datos experimentales vs Modelo Teórico ideal.
     """
     fig, ax = plt.subplots(figsize=(8, 6))
     
-    # Calcular promedios por modalidad y sensor
-    summary = df.groupby(['mode', 'sensor_id']).agg({
-        'time_s': ['mean', 'std'],
-        'distance_cm': 'mean'
-    }).reset_index()
-    summary.columns = ['mode', 'sensor_id', 'time_mean', 'time_std', 'dist_mean']
-    
-    # Convertir a metros
-    summary['dist_m'] = summary['dist_mean'] / 100.0
+    # Promedios por modalidad y sensor (en metros)
+    summary = features['mode_summary']
     
     # Ajuste Teórico Global
     all_time = summary['time_mean'].values
@@ -363,17 +439,18 @@ def plot_experimental_vs_theoretical(df: pd.DataFrame, output_dir: Path):
     ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
-    plt.savefig(output_dir / "experimental_vs_theoretical_mrua.png", dpi=300)
+    plt.savefig(output_dir / "experimental_vs_theoretical_mrua.png", dpi=dpi)
     plt.close()
     print("[OK] Graph created: experimental_vs_theoretical_mrua.png")
 
 
-def plot_acceleration_distribution(df: pd.DataFrame, output_dir: Path):
+def plot_acceleration_distribution(features: Dict[str, pd.DataFrame], output_dir: Path, dpi: int = GRAPH_DPI,
+                                   large_n: str = 'auto'):
     """
     Boxplot de aceleraciones comparativo.
+    En modo N grande las cajas salen de un t-digest por modalidad (Axes.bxp).
     """
-    experiments = df.groupby(['mode', 'experiment_index'])['acceleration_ms2'].first().reset_index()
-    experiments = experiments.dropna(subset=['acceleration_ms2'])
+    experiments = features['accelerations']
     
     rem_acc = experiments[experiments['mode'] == 'remote']['acceleration_ms2']
     pre_acc = experiments[experiments['mode'] == 'presential']['acceleration_ms2']
@@ -386,20 +463,26 @@ def plot_acceleration_distribution(df: pd.DataFrame, output_dir: Path):
     fig, ax = plt.subplots(figsize=(7, 6))
     
     data = [rem_acc, pre_acc]
-    bp = ax.boxplot(data, patch_artist=True, widths=0.5, labels=['Remote', 'Face-to-Face'])
+    if is_large_n(len(rem_acc) + len(pre_acc), large_n):
+        digests = [TDigest().update(d.values) for d in data]
+        box_stats = [boxplot_stats(d) for d in digests]
+        bp = ax.bxp(box_stats, patch_artist=True, widths=0.5)
+        # Sin atípicos dibujados: el texto se coloca sobre el bigote
+        summaries = [(d.stats.mean, d.stats.std, d.count, b['whislo'], b['whishi']) for d, b in zip(digests, box_stats)]
+    else:
+        bp = ax.boxplot(data, patch_artist=True, widths=0.5)
+        summaries = [(d.mean(), d.std(), len(d), np.min(d), np.max(d)) for d in data]
+    ax.set_xticks([1, 2], ['Remote', 'Face-to-Face'])  # 'labels=' de boxplot ya no existe en matplotlib >= 3.11
     
     colors = ['#3498db', '#e74c3c']
     for patch, color in zip(bp['boxes'], colors):
         patch.set_facecolor(color)
         patch.set_alpha(0.6)
         
-    for i, d in enumerate(data):
-        m = d.mean()
-        s = d.std()
-        n = len(d)
+    for i, (m, s, n, d_min, d_max) in enumerate(summaries):
         text = f"$\\mu = {m:.2f}$\n$\\sigma = {s:.2f}$\n$n = {n}$"
         # Ajuste de posición: más arriba para evitar solapamiento
-        ax.text(i+1, np.max(d) + (np.max(d) - np.min(d))*0.05, text, ha='center', va='bottom', 
+        ax.text(i+1, d_max + (d_max - d_min)*0.05, text, ha='center', va='bottom', 
                 bbox=dict(facecolor='white', alpha=0.8, edgecolor='none'))
 
     ax.set_ylabel('Acceleration ($m/s^2$)')
@@ -410,41 +493,17 @@ def plot_acceleration_distribution(df: pd.DataFrame, output_dir: Path):
     ax.set_ylim(y_min, y_max * 1.15)
     
     plt.tight_layout()
-    plt.savefig(output_dir / "acceleration_boxplot.png", dpi=300)
+    plt.savefig(output_dir / "acceleration_boxplot.png", dpi=dpi)
     plt.close()
     print("[OK] Graph created: acceleration_boxplot.png")
 
 
-def plot_velocity_trend(df: pd.DataFrame, output_dir: Path):
+def plot_velocity_trend(features: Dict[str, pd.DataFrame], output_dir: Path, dpi: int = GRAPH_DPI):
     """
     Velocidad promedio vs Posición. 
     """
-    vel_data = []
-    
-    for (mode, idx), group in df.groupby(['mode', 'experiment_index']):
-        group = group.sort_values('distance_cm')
-        dists = group['distance_cm'].values / 100.0 # m
-        times = group['time_s'].values
-        
-        for i in range(1, len(dists)):
-            dt = times[i] - times[i-1]
-            dd = dists[i] - dists[i-1]
-            if dt > 0.001: 
-                v = dd / dt
-                pos_mid = (dists[i] + dists[i-1]) / 2.0
-                vel_data.append({
-                    'mode': mode,
-                    'pos_m': pos_mid,
-                    'velocity': v
-                })
-                
-    vdf = pd.DataFrame(vel_data)
-    
-    if vdf.empty: return
-
-    vdf['pos_bin'] = vdf['pos_m'].round(2)
-    stats_v = vdf.groupby(['mode', 'pos_bin']).agg({'velocity': ['mean', 'std']}).reset_index()
-    stats_v.columns = ['mode', 'pos_bin', 'v_mean', 'v_std']
+    if features['velocities'].empty: return
+    stats_v = features['velocity_profile']
     
     fig, ax = plt.subplots(figsize=(8, 6))
     
@@ -453,7 +512,7 @@ def plot_velocity_trend(df: pd.DataFrame, output_dir: Path):
         if subset.empty: continue
         
         subset = subset.sort_values('pos_bin')
-        vals = subset['v_mean'].values
+        vals = subset['v_mean'].to_numpy(copy=True)  # La tabla precalculada no se modifica
         # Forzar monotonia suave si baja
         for k in range(1, len(vals)):
             if vals[k] < vals[k-1]:
@@ -469,11 +528,11 @@ def plot_velocity_trend(df: pd.DataFrame, output_dir: Path):
     ax.grid(True, alpha=0.3)
     
     plt.tight_layout()
-    plt.savefig(output_dir / "velocity_profile.png", dpi=300)
+    plt.savefig(output_dir / "velocity_profile.png", dpi=dpi)
     plt.close()
     print("[OK] Graph created: velocity_profile.png")
 
-def plot_success_rates(df: pd.DataFrame, output_dir: Path):
+def plot_success_rates(features: Dict[str, pd.DataFrame], output_dir: Path, dpi: int = GRAPH_DPI):
     """
     Gráfico de estabilidad operativa (Tasas de éxito).
     """
@@ -494,20 +553,30 @@ def plot_success_rates(df: pd.DataFrame, output_dir: Path):
         ax.text(bar.get_x() + bar.get_width()/2, h + 1, f"{h}%", ha='center', fontweight='bold')
         
     plt.tight_layout()
-    plt.savefig(output_dir / "stability_success_rate.png", dpi=300)
+    plt.savefig(output_dir / "stability_success_rate.png", dpi=dpi)
     plt.close()
     print("[OK] Graph created: stability_success_rate.png")
 
 # ============ MAIN ============
 
 def main():
+    parser = argparse.ArgumentParser(description="Sintesis de resultados MRUA")
+    parser.add_argument('--tier', choices=list(TIERS), default='full',
+                        help="Resolucion de los graficos (draft = 72 dpi para revisar, full = publicacion)")
+    parser.add_argument('--large-n', choices=['auto', 'always', 'never'], default='auto',
+                        help=f"Densidad y boxplots desde t-digest (auto: desde {LARGE_N_THRESHOLD} puntos)")
+    parser.add_argument('--max-experiments', type=int, default=MAX_EXPERIMENTS_PER_MODE,
+                        help="Ensayos por modalidad (0 = todos)")
+    args = parser.parse_args()
+    dpi = TIERS[args.tier]['dpi']
+    
     print("=== Generación de Gráficos Académicos MRUA (No Scipy) ===")
     
     os.makedirs(SUMMARY_GRAPHS_DIR, exist_ok=True)
     os.makedirs(SUMMARY_CSV_DIR, exist_ok=True)
     
     # 1. Buscar carpetas
-    folders = find_experiment_folders(ANALYSIS_OUTPUT_DIR)
+    folders = find_experiment_folders(ANALYSIS_OUTPUT_DIR, args.max_experiments)
     
     # 2. Cargar y consolidar datos
     print("Cargando y procesando datos...")
@@ -519,12 +588,13 @@ def main():
 
     print(f"Datos cargados: {len(full_df)} registros de sensores.")
     
-    # 3. Generar Gráficos
-    plot_correlation_sensors(full_df, SUMMARY_GRAPHS_DIR)
-    plot_experimental_vs_theoretical(full_df, SUMMARY_GRAPHS_DIR)
-    plot_acceleration_distribution(full_df, SUMMARY_GRAPHS_DIR)
-    plot_velocity_trend(full_df, SUMMARY_GRAPHS_DIR)
-    plot_success_rates(full_df, SUMMARY_GRAPHS_DIR)
+    # 3. Precalcular características (una sola pasada) y generar gráficos
+    features = build_features(full_df)
+    plot_correlation_sensors(features, SUMMARY_GRAPHS_DIR, dpi, args.large_n)
+    plot_experimental_vs_theoretical(features, SUMMARY_GRAPHS_DIR, dpi)
+    plot_acceleration_distribution(features, SUMMARY_GRAPHS_DIR, dpi, args.large_n)
+    plot_velocity_trend(features, SUMMARY_GRAPHS_DIR, dpi)
+    plot_success_rates(features, SUMMARY_GRAPHS_DIR, dpi)
     
     print(f"\n[ÉXITO] Todos los gráficos generados en: {SUMMARY_GRAPHS_DIR}")
 